@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# =================================================================
+# Offline download benchmark of wellnote downloader
+#
+# Copyright (c) 2022 Takahide Nogayama
+#
+# This software is released under the MIT License.
+# http://opensource.org/licenses/mit-license.php
+# =================================================================
+"""
+Runs download_album or download_home against the local stand-in site and reports
+items/sec, WebDriver calls per item and wall time, to compare pacing and concurrency changes.
+
+    $ python benchmarks/bench_download.py album --items 100 --latency 0.05 --pacing adaptive
+    $ python benchmarks/bench_download.py home --items 100 --browser firefox --headless
+
+WebDriver calls are counted in this process only, so they are not reported with --workers.
+"""
+
+import argparse
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import wellnote_downloader  # noqa: E402
+from standin_site import StandinSite  # noqa: E402
+
+
+class WebDriverCallCounter:
+    """
+    Counts the commands sent to the browser by wrapping WebDriver.execute, which every WebDriver call goes through.
+    """
+
+    def __init__(self):
+        self.num_of_calls: int = 0
+        self.original_execute = None
+
+    def __enter__(self) -> "WebDriverCallCounter":
+        from selenium.webdriver.remote.webdriver import WebDriver
+        self.original_execute = WebDriver.execute
+        counter: WebDriverCallCounter = self
+
+        def execute(driver, driver_command, params=None):
+            counter.num_of_calls += 1
+            return counter.original_execute(driver, driver_command, params)
+
+        WebDriver.execute = execute
+        return self
+
+    def __exit__(self, *exc_info):
+        from selenium.webdriver.remote.webdriver import WebDriver
+        WebDriver.execute = self.original_execute
+
+
+def count_files(root: str) -> int:
+    num_of_files: int = 0
+    for _, _, filenames in os.walk(root):
+        num_of_files += len([filename for filename in filenames if filename.startswith("wellnote_")])
+    return num_of_files
+
+
+def main(*args: str) -> int:
+    ap = argparse.ArgumentParser(description="Offline download benchmark")
+    ap.add_argument("mode", choices=("album", "home"), help="Which download to measure")
+    ap.add_argument("--items", metavar="INT", type=int, default=50, help="Number of items of the stand-in site")
+    ap.add_argument("--latency", metavar="SEC", type=float, default=0.0, help="Sleep time (sec) of every HTTP request")
+    ap.add_argument("--render-delay", metavar="SEC", type=float, default=0.0, help="Delay (sec) of page updates")
+    ap.add_argument("--media-bytes", metavar="INT", type=int, default=64 * 1024, help="Size of each album item")
+    ap.add_argument("--browser", metavar="STR", default="chrome", help="Browser to automate")
+    ap.add_argument("--headless", action="store_true", default=False, help="Run the browser without its window")
+    ap.add_argument("--interval", metavar="INT", type=int, default=wellnote_downloader.DEFAULT_INTERVAL, help="--interval of the downloader")
+    ap.add_argument("--pacing", choices=wellnote_downloader.PACING_MODES, default=wellnote_downloader.DEFAULT_PACING, help="--pacing of the downloader")
+    ap.add_argument("--fetch", choices=wellnote_downloader.FETCH_MODES, default=wellnote_downloader.DEFAULT_FETCH, help="--fetch of album")
+    ap.add_argument("--workers", metavar="INT", type=int, default=1, help="--workers of album")
+    ap.add_argument("--keep", action="store_true", default=False, help="Keep the download dir")
+    ap.add_argument("--json", action="store_true", default=False, help="Print the result as JSON")
+    ns = ap.parse_args(args or None)
+
+    logging.basicConfig(stream=sys.stderr, format=wellnote_downloader.LOG_FORMAT, level=logging.ERROR)
+
+    download_dir: str = tempfile.mkdtemp(prefix="wellnote_bench_")
+    num_of_album_items: int = ns.items if ns.mode == "album" else 1
+    num_of_home_items: int = ns.items if ns.mode == "home" else 1
+    with StandinSite(num_of_album_items, num_of_home_items, ns.latency, ns.render_delay, ns.media_bytes) as site:
+        os.environ["WELLNOTE_URL"] = site.url
+        os.environ.setdefault("WELLNOTE_EMAIL", "bench@example.com")
+        os.environ.setdefault("WELLNOTE_PASSWORD", "bench")
+
+        kwargs: dict = dict(interval=ns.interval, pacing=ns.pacing, download_dir=download_dir, browser=ns.browser, \
+                            clear_profile=True, headless=ns.headless)
+        if ns.mode == "album":
+            start_year, start_month, end_year, end_month = site.album_period
+            handler = wellnote_downloader.download_album
+            kwargs.update(fetch=ns.fetch, workers=ns.workers)
+        else:
+            start_year, start_month, end_year, end_month = site.home_period
+            handler = wellnote_downloader.download_home
+
+        wellnote_downloader.import_selenium()
+        with WebDriverCallCounter() as counter:
+            start: float = time.perf_counter()
+            handler(start_year=start_year, start_month=start_month, end_year=end_year, end_month=end_month, **kwargs)
+            wall_sec: float = time.perf_counter() - start
+
+        num_of_requests: int = site.num_of_requests
+
+    num_of_items: int = count_files(os.path.join(download_dir, "wellnote", ns.mode))
+    result: dict = {
+        "mode": ns.mode,
+        "items": num_of_items,
+        "expected_items": ns.items,
+        "wall_sec": round(wall_sec, 3),
+        "items_per_sec": round(num_of_items / wall_sec, 3) if wall_sec else None,
+        "webdriver_calls": counter.num_of_calls if ns.workers == 1 else None,
+        "webdriver_calls_per_item": round(counter.num_of_calls / num_of_items, 2) if num_of_items and ns.workers == 1 else None,
+        "http_requests": num_of_requests,
+        "pacing": ns.pacing,
+        "fetch": ns.fetch,
+        "workers": ns.workers,
+        "latency_sec": ns.latency,
+    }
+
+    if ns.keep:
+        result["download_dir"] = download_dir
+    else:
+        shutil.rmtree(download_dir, ignore_errors=True)
+
+    if ns.json:
+        print(json.dumps(result))
+    else:
+        for key, value in result.items():
+            print(f"{key:>26}: {value}")
+    return 0 if num_of_items == ns.items else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main(*sys.argv[1:]))
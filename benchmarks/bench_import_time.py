@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# =================================================================
+# Import time regression benchmark of wellnote downloader
+#
+# Copyright (c) 2022 Takahide Nogayama
+#
+# This software is released under the MIT License.
+# http://opensource.org/licenses/mit-license.php
+# =================================================================
+"""
+Measures how long "wellnote_downloader --version" takes, and fails when it exceeds the budget
+or when it imports the modules which are needed only to drive a browser.
+
+    $ python benchmarks/bench_import_time.py --budget 0.5
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+HEAVY_MODULES: tuple[str, ...] = ("selenium", "webdriver_manager", "filedate", "urllib3", "PIL", "boto3")
+
+VERSION_SCRIPT: str = "import wellnote_downloader; wellnote_downloader.main_cli('--version')"
+
+LOADED_MODULES_SCRIPT: str = f"""
+import sys
+import wellnote_downloader
+print(",".join(sorted({{name.split(".")[0] for name in sys.modules}} & set({HEAVY_MODULES!r}))))
+"""
+
+
+def run(script: str) -> str:
+    env: dict[str, str] = dict(os.environ)
+    src_dir: str = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+    env["PYTHONPATH"] = os.pathsep.join([src_dir, env.get("PYTHONPATH", "")])
+    return subprocess.run([sys.executable, "-c", script], env=env, check=True, capture_output=True, text=True).stdout
+
+
+def main(*args: str) -> int:
+    ap = argparse.ArgumentParser(description="Import time regression benchmark")
+    ap.add_argument("--repeat", metavar="INT", type=int, default=10, help="Number of measurements")
+    ap.add_argument("--budget", metavar="SEC", type=float, default=0.5, help="Maximum median seconds of 'wellnote_downloader --version'")
+    ns = ap.parse_args(args or None)
+
+    elapsed_secs: list[float] = []
+    for _ in range(ns.repeat):
+        start: float = time.perf_counter()
+        run(VERSION_SCRIPT)
+        elapsed_secs.append(time.perf_counter() - start)
+    median_sec: float = statistics.median(elapsed_secs)
+    print(f"wellnote_downloader --version: median={median_sec:.3f}s min={min(elapsed_secs):.3f}s max={max(elapsed_secs):.3f}s")
+
+    loaded: str = run(LOADED_MODULES_SCRIPT).strip()
+    if loaded:
+        print(f"NG: importing wellnote_downloader loads {loaded}")
+        return 1
+    if median_sec > ns.budget:
+        print(f"NG: median {median_sec:.3f}s exceeds the budget {ns.budget:.3f}s")
+        return 1
+    print("OK")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(*sys.argv[1:]))
@@ -0,0 +1,480 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# =================================================================
+# Local stand-in of wellnote.jp for offline benchmarks
+#
+# Copyright (c) 2022 Takahide Nogayama
+#
+# This software is released under the MIT License.
+# http://opensource.org/licenses/mit-license.php
+# =================================================================
+"""
+Serves the parts of wellnote.jp which wellnote_downloader depends on:
+
+- the login form (loginId and password)
+- the year and month selectors of albums
+- the virtuoso-grid-item grid and the swiper viewer with vdots and a download button
+- the virtualized home timeline of data-index cards with <time datetime>
+
+Every request sleeps latency seconds, and the pages delay their updates by render delay seconds.
+
+    $ python benchmarks/standin_site.py --album-items 200 --home-items 200 --latency 0.05
+    $ WELLNOTE_URL=http://127.0.0.1:8000/ wellnote_downloader album --start 2019-01 --end 2019-12
+"""
+
+import argparse
+from datetime import datetime, timedelta
+from http import cookies
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import logging
+import sys
+import threading
+import time
+from urllib.parse import parse_qs, urlparse
+
+_LOGGER: logging.Logger = logging.getLogger(__name__)
+
+SESSION_COOKIE: str = "standin_session"
+
+# 1x1 transparent PNG
+PNG_BYTES: bytes = bytes.fromhex("89504e470d0a1a0a0000000d4948445200000001000000010806000000"
+                                 "1f15c4890000000d49444154789c63000100000500010d0a2db40000000049454e44ae426082")
+
+PAGE_TEMPLATE: str = """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>wellnote stand-in</title>
+<style>
+body { margin: 0; font-family: sans-serif; }
+nav { height: 48px; }
+svg { width: 24px; height: 24px; cursor: pointer; }
+li { display: inline-block; padding: 4px 8px; cursor: pointer; }
+li.fQmbrI { font-weight: bold; }
+li.Bhkiq { color: #ccc; }
+.virtuoso-grid-item { display: inline-block; width: 100px; height: 100px; margin: 2px; background: #ddd; }
+.viewer { position: fixed; top: 0; left: 0; right: 0; bottom: 0; background: #fff; }
+.viewer div { margin: 4px; }
+.swiper-button-next, .sc-bGaVxB, .sc-gnnDb { display: inline-block; width: 80px; height: 24px; background: #eee; cursor: pointer; }
+.sc-jdhwqr > div { box-sizing: border-box; border-bottom: 1px solid #ccc; overflow: hidden; }
+</style>
+<script>window.STANDIN = %(config)s;</script>
+</head>
+<body>
+%(body)s
+</body>
+</html>
+"""
+
+TOP_BODY: str = """<nav><a href="/login">ログイン</a></nav>"""
+
+LOGIN_BODY: str = """
+<form method="post" action="/login">
+<input id="loginId" type="email" name="loginId" autocomplete="username">
+<input id="password" type="password" name="password" autocomplete="current-password">
+</form>
+"""
+
+HOME_BODY: str = """
+<nav><a href="/albums">アルバム</a></nav>
+<div class="sc-fIosxK"><div class="sc-gyElHZ">あなたの家族</div></div>
+<section><div class="sc-jdhwqr" style="box-sizing: border-box; padding-top: 0px; padding-bottom: 0px;"></div></section>
+<script>
+(function() {
+    var posts = [];
+    var list = document.querySelector('.sc-jdhwqr');
+    var cardHeight = STANDIN.cardHeight;
+    var overscan = 2;
+    var rendered = {};
+
+    function card(index) {
+        var post = posts[index];
+        var div = document.createElement('div');
+        div.setAttribute('data-index', index);
+        div.style.height = cardHeight + 'px';
+        div.innerHTML = '<time datetime="' + post.datetime + '">' + post.label + '</time>'
+            + '<p class="post-text">' + post.text + '</p>'
+            + '<img src="/media/home_' + index + '.png" width="32" height="32">';
+        return div;
+    }
+
+    function render() {
+        var offset = -list.getBoundingClientRect().top;
+        var first = Math.max(0, Math.floor(offset / cardHeight) - overscan);
+        var last = Math.min(posts.length - 1, Math.ceil((offset + window.innerHeight) / cardHeight) + overscan);
+        Object.keys(rendered).forEach(function(key) {
+            var index = parseInt(key, 10);
+            if (index < first || index > last) {
+                list.removeChild(rendered[key]);
+                delete rendered[key];
+            }
+        });
+        for (var index = first; index <= last; index++) {
+            if (!rendered[index]) {
+                rendered[index] = card(index);
+                var next = null;
+                for (var j = index + 1; j <= last; j++) {
+                    if (rendered[j]) { next = rendered[j]; break; }
+                }
+                list.insertBefore(rendered[index], next);
+            }
+        }
+        list.style.paddingTop = (first * cardHeight) + 'px';
+        list.style.paddingBottom = (Math.max(0, posts.length - 1 - last) * cardHeight) + 'px';
+    }
+
+    var scheduled = false;
+    window.addEventListener('scroll', function() {
+        if (scheduled) { return; }
+        scheduled = true;
+        setTimeout(function() { scheduled = false; render(); }, STANDIN.renderDelayMs);
+    });
+
+    fetch('/api/home.json').then(function(r) { return r.json(); }).then(function(data) {
+        posts = data;
+        render();
+    });
+})();
+</script>
+"""
+
+ALBUM_BODY: str = """
+<nav><a href="/albums">アルバム</a></nav>
+<div id="header"></div>
+<ul id="months"></ul>
+<div id="grid"></div>
+<div id="viewer"></div>
+<script>
+(function() {
+    var items = [];
+    var years = [];
+    var year = null;
+    var month = null;
+    var position = null;  // index in the month items shown by the viewer
+
+    function later(f) { setTimeout(f, STANDIN.renderDelayMs); }
+
+    function monthItems(y, m) {
+        return items.filter(function(item) { return item.year === y && item.month === m; });
+    }
+
+    function svg(cls, onclick) {
+        var e = document.createElementNS('http://www.w3.org/2000/svg', 'svg');
+        e.setAttribute('class', cls);
+        e.innerHTML = '<rect width="24" height="24"></rect>';
+        e.addEventListener('click', onclick);
+        return e;
+    }
+
+    function renderHeader() {
+        var header = document.getElementById('header');
+        header.innerHTML = '';
+        var idx = years.indexOf(year);
+        if (idx > 0) {
+            header.appendChild(svg('sc-emDsmM fWHKrl', function() { later(function() { selectYear(years[idx - 1]); }); }));
+        }
+        var text = document.createElement('div');
+        text.className = 'sc-bvFjSx';
+        text.textContent = year + '年';
+        header.appendChild(text);
+        if (idx < years.length - 1) {
+            header.appendChild(svg('sc-emDsmM dRpxwk', function() { later(function() { selectYear(years[idx + 1]); }); }));
+        }
+    }
+
+    function renderMonths() {
+        var ul = document.getElementById('months');
+        ul.innerHTML = '';
+        for (var m = 1; m <= 12; m++) {
+            var li = document.createElement('li');
+            li.textContent = String(m);
+            if (m === month) {
+                li.className = 'sc-bttaWv fQmbrI';
+            } else if (monthItems(year, m).length) {
+                li.className = 'sc-bttaWv hEsndb';
+                li.setAttribute('tabindex', '0');
+                li.addEventListener('click', (function(m) { return function() { later(function() { selectMonth(m); }); }; })(m));
+            } else {
+                li.className = 'sc-bttaWv Bhkiq';
+                li.setAttribute('disabled', '');
+            }
+            ul.appendChild(li);
+        }
+    }
+
+    function renderGrid() {
+        var grid = document.getElementById('grid');
+        grid.innerHTML = '';
+        monthItems(year, month).forEach(function(item, i) {
+            var div = document.createElement('div');
+            div.className = 'virtuoso-grid-item';
+            div.setAttribute('data-item-id', item.id);
+            div.addEventListener('click', function() { later(function() { openViewer(i); }); });
+            grid.appendChild(div);
+        });
+    }
+
+    function renderViewer() {
+        var viewer = document.getElementById('viewer');
+        viewer.innerHTML = '';
+        if (position === null) { return; }
+        var list = monthItems(year, month);
+        var item = list[position];
+        var box = document.createElement('div');
+        box.className = 'viewer';
+
+        var close = svg('sc-eldieg', function() { position = null; renderViewer(); });
+        box.appendChild(close);
+
+        var date = document.createElement('div');
+        date.className = 'sc-hmvnCu';
+        date.textContent = item.year + '年' + item.month + '月' + item.day + '日';
+        box.appendChild(date);
+
+        var slide = document.createElement('div');
+        slide.className = 'swiper-slide swiper-slide-active';
+        slide.innerHTML = '<img src="' + location.origin + '/media/' + item.id + '.' + item.extension + '" width="64" height="64">';
+        box.appendChild(slide);
+
+        var vdots = document.createElement('div');
+        vdots.className = 'sc-bGaVxB';
+        vdots.textContent = '...';
+        box.appendChild(vdots);
+
+        var download = document.createElement('div');
+        download.className = 'sc-gnnDb';
+        download.textContent = 'download';
+        download.style.display = 'none';
+        download.addEventListener('click', function() {
+            var a = document.createElement('a');
+            a.href = '/media/' + item.id + '.' + item.extension + '?download=1';
+            a.setAttribute('download', '');
+            document.body.appendChild(a);
+            a.click();
+            document.body.removeChild(a);
+            download.style.display = 'none';
+        });
+        box.appendChild(download);
+        vdots.addEventListener('click', function() { download.style.display = 'inline-block'; });
+
+        var next = document.createElement('div');
+        next.className = 'swiper-button-next' + (position === list.length - 1 ? ' swiper-button-disabled' : '');
+        next.addEventListener('click', function() {
+            if (position < list.length - 1) {
+                later(function() { position += 1; renderViewer(); });
+            }
+        });
+        box.appendChild(next);
+
+        viewer.appendChild(box);
+    }
+
+    function openViewer(i) { position = i; renderViewer(); }
+
+    function selectMonth(m) {
+        month = m;
+        position = null;
+        renderMonths();
+        renderGrid();
+        renderViewer();
+    }
+
+    function selectYear(y) {
+        year = y;
+        var first = null;
+        for (var m = 1; m <= 12; m++) {
+            if (monthItems(y, m).length) { first = m; break; }
+        }
+        renderHeader();
+        selectMonth(first);
+    }
+
+    fetch('/api/album.json').then(function(r) { return r.json(); }).then(function(data) {
+        items = data;
+        items.forEach(function(item) {
+            if (years.indexOf(item.year) < 0) { years.push(item.year); }
+        });
+        years.sort();
+        selectYear(years[years.length - 1]);
+    });
+})();
+</script>
+"""
+
+
+class StandinSite:
+    """
+    Generates album items and home posts deterministically and serves them on a local port.
+    Album items spread over the months from start_year, a few per day, and home posts are newest first.
+    """
+
+    def __init__(self, num_of_album_items: int = 100, num_of_home_items: int = 100, latency_sec: float = 0.0, render_delay_sec: float = 0.0, \
+                 media_bytes: int = 64 * 1024, start_year: int = 2019, host: str = "127.0.0.1", port: int = 0):
+        self.latency_sec = latency_sec
+        self.render_delay_sec = render_delay_sec
+        self.media_bytes = media_bytes
+        self.host = host
+        self.port = port
+        self.server: ThreadingHTTPServer = None
+        self.thread: threading.Thread = None
+        self.num_of_requests: int = 0
+
+        self.album_items: list[dict] = []
+        day: datetime = datetime(start_year, 1, 1)
+        for item_id in range(num_of_album_items):
+            if item_id % 3 == 0:
+                day += timedelta(days=5)
+            self.album_items.append({
+                "id": item_id,
+                "year": day.year,
+                "month": day.month,
+                "day": day.day,
+                "extension": "mp4" if item_id % 10 == 9 else "jpg",
+            })
+
+        self.home_posts: list[dict] = []
+        posted_at: datetime = datetime(start_year, 1, 1, 12, 0, 0) + timedelta(hours=36 * num_of_home_items)
+        for _ in range(num_of_home_items):
+            posted_at -= timedelta(hours=36)
+            self.home_posts.append({
+                "datetime": posted_at.strftime("%Y-%m-%dT%H:%M:%S") + "+09:00",
+                "label": f"{posted_at.year}年{posted_at.month}月{posted_at.day}日",
+                "text": f"post at {posted_at.isoformat()}",
+            })
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.server.server_address[1]}/"
+
+    @property
+    def album_period(self) -> tuple[int, int, int, int]:
+        first: dict = self.album_items[0]
+        last: dict = self.album_items[-1]
+        return first["year"], first["month"], last["year"], last["month"]
+
+    @property
+    def home_period(self) -> tuple[int, int, int, int]:
+        newest: datetime = datetime.strptime(self.home_posts[0]["datetime"][:19], "%Y-%m-%dT%H:%M:%S")
+        oldest: datetime = datetime.strptime(self.home_posts[-1]["datetime"][:19], "%Y-%m-%dT%H:%M:%S")
+        return oldest.year, oldest.month, newest.year, newest.month
+
+    def media(self, name: str) -> tuple[bytes, str]:
+        if name.endswith(".png"):
+            return PNG_BYTES, "image/png"
+        item_id: int = int(name.split(".")[0])
+        if name.endswith(".mp4"):
+            header: bytes = b"\x00\x00\x00\x18ftypmp42\x00\x00\x00\x00mp42isom"
+            return header + bytes([item_id % 256]) * max(0, self.media_bytes - len(header)), "video/mp4"
+        return b"\xff\xd8\xff\xe0" + bytes([item_id % 256]) * max(0, self.media_bytes - 6) + b"\xff\xd9", "image/jpeg"
+
+    def start(self) -> str:
+        site: StandinSite = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def log_message(self, format, *args):
+                _LOGGER.debug(format, *args)
+
+            def logged_in(self) -> bool:
+                cookie = cookies.SimpleCookie(self.headers.get("Cookie", ""))
+                return SESSION_COOKIE in cookie
+
+            def send(self, status: int, body: bytes, content_type: str, headers: dict[str, str] = None):
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def page(self, body: str):
+                config: str = json.dumps({"renderDelayMs": int(site.render_delay_sec * 1000), "cardHeight": 300})
+                self.send(200, (PAGE_TEMPLATE % {"config": config, "body": body}).encode("utf-8"), "text/html; charset=utf-8")
+
+            def redirect(self, location: str, headers: dict[str, str] = None):
+                self.send(303, b"", "text/plain", dict(headers or {}, Location=location))
+
+            def do_GET(self):
+                site.num_of_requests += 1
+                time.sleep(site.latency_sec)
+                url = urlparse(self.path)
+                if url.path == "/":
+                    self.page(HOME_BODY if self.logged_in() else TOP_BODY)
+                elif url.path == "/login":
+                    self.page(LOGIN_BODY)
+                elif url.path == "/albums":
+                    if self.logged_in():
+                        self.page(ALBUM_BODY)
+                    else:
+                        self.redirect("/")
+                elif url.path == "/api/album.json":
+                    self.send(200, json.dumps(site.album_items).encode("utf-8"), "application/json")
+                elif url.path == "/api/home.json":
+                    self.send(200, json.dumps(site.home_posts).encode("utf-8"), "application/json")
+                elif url.path.startswith("/media/"):
+                    name: str = url.path.split("/")[-1]
+                    body, content_type = site.media(name)
+                    headers: dict[str, str] = {}
+                    if "download" in parse_qs(url.query):
+                        headers["Content-Disposition"] = f'attachment; filename="IMG_{name}"'
+                    self.send(200, body, content_type, headers)
+                else:
+                    self.send(404, b"not found", "text/plain")
+
+            def do_POST(self):
+                site.num_of_requests += 1
+                time.sleep(site.latency_sec)
+                if urlparse(self.path).path == "/login":
+                    self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                    self.redirect("/", {"Set-Cookie": f"{SESSION_COOKIE}=1; Path=/"})
+                else:
+                    self.send(404, b"not found", "text/plain")
+
+        self.server = ThreadingHTTPServer((self.host, self.port), Handler)
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, name="standin_site", daemon=True)
+        self.thread.start()
+        _LOGGER.info("Serving the stand-in site at %s", self.url)
+        return self.url
+
+    def stop(self):
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+    def __enter__(self) -> "StandinSite":
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+def main(*args: str) -> int:
+    ap = argparse.ArgumentParser(description="Local stand-in of wellnote.jp")
+    ap.add_argument("--album-items", dest="num_of_album_items", metavar="INT", type=int, default=100, help="Number of album items")
+    ap.add_argument("--home-items", dest="num_of_home_items", metavar="INT", type=int, default=100, help="Number of home posts")
+    ap.add_argument("--latency", dest="latency_sec", metavar="SEC", type=float, default=0.0, help="Sleep time (sec) of every HTTP request")
+    ap.add_argument("--render-delay", dest="render_delay_sec", metavar="SEC", type=float, default=0.0, help="Delay (sec) of page updates after clicks and scrolls")
+    ap.add_argument("--media-bytes", dest="media_bytes", metavar="INT", type=int, default=64 * 1024, help="Size of each album item")
+    ap.add_argument("--port", dest="port", metavar="INT", type=int, default=8000, help="Port to listen")
+    ns = ap.parse_args(args or None)
+
+    logging.basicConfig(stream=sys.stderr, level=logging.INFO)
+    with StandinSite(**vars(ns)) as site:
+        print(f"WELLNOTE_URL={site.url}")
+        print("album period: %04d-%02d .. %04d-%02d" % site.album_period)
+        print("home period:  %04d-%02d .. %04d-%02d" % site.home_period)
+        try:
+            site.thread.join()
+        except KeyboardInterrupt:
+            pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(*sys.argv[1:]))
@@ -10,46 +10,114 @@
 # http://opensource.org/licenses/mit-license.php
 # =================================================================
 
+from __future__ import annotations
+
 __version__ = "0.13.3"
 
 import argparse
 from argparse import ArgumentParser, Action, Namespace
+from concurrent.futures import ALL_COMPLETED, FIRST_COMPLETED, Future, ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from concurrent.futures import wait as wait_futures
 from contextlib import contextmanager
 from datetime import datetime
 from getpass import getpass
-import glob
+import hashlib
+import json
+from itertools import chain, repeat
 import logging
+import mimetypes
+import mmap
+import multiprocessing
+import operator
 import os
+import queue
 import re
 import shutil
+import sqlite3
+import struct
 import sys
+import tarfile
 import tempfile
+import threading
 import time
+from typing import TYPE_CHECKING, Callable, Iterable
+import zipfile
 
-from selenium import webdriver
-from selenium.common.exceptions import NoSuchElementException, TimeoutException
-from selenium.webdriver.common.by import By
-from selenium.webdriver.common.keys import Keys
-from selenium.webdriver.remote.webdriver import WebDriver
-from selenium.webdriver.remote.webdriver import WebElement
-from selenium.webdriver.support.wait import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.webdriver.chrome.service import Service as ChromeService
-from selenium.webdriver.firefox.service import Service as FirefoxService
-from selenium.webdriver.firefox.options import Options as FirefoxOptions
-from webdriver_manager.chrome import ChromeDriverManager
-from webdriver_manager.firefox import GeckoDriverManager
+# logger
+_LOGGER: logging.Logger = logging.getLogger(__name__)
 
-from selenium.common.exceptions import StaleElementReferenceException
+# selenium, webdriver_manager, filedate, urllib3, Pillow and boto3 are imported when they are needed,
+# so that "wellnote_downloader --version" and "--help" start instantly.
+if TYPE_CHECKING:
+    from selenium.webdriver.remote.webdriver import WebDriver
+    from selenium.webdriver.remote.webdriver import WebElement
 
-import filedate
+webdriver = None
+NoSuchElementException = TimeoutException = WebDriverException = StaleElementReferenceException = None
+InvalidSessionIdException = NoSuchWindowException = None
+By = Keys = EC = WebDriverWait = None
+ChromeService = FirefoxService = FirefoxOptions = None
+ChromeDriverManager = GeckoDriverManager = None
+
+def import_selenium():
+    """
+    Imports selenium and webdriver_manager into the module namespace on the first call.
+    """
+    global webdriver, NoSuchElementException, TimeoutException, WebDriverException, StaleElementReferenceException
+    global InvalidSessionIdException, NoSuchWindowException
+    global By, Keys, EC, WebDriverWait, ChromeService, FirefoxService, FirefoxOptions, ChromeDriverManager, GeckoDriverManager
+    if webdriver is not None:
+        return
+
+    _LOGGER.debug("Importing selenium")
+    from selenium.common.exceptions import NoSuchElementException, TimeoutException, WebDriverException
+    from selenium.common.exceptions import StaleElementReferenceException, InvalidSessionIdException, NoSuchWindowException
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.common.keys import Keys
+    from selenium.webdriver.support.wait import WebDriverWait
+    from selenium.webdriver.support import expected_conditions as EC
+    from selenium.webdriver.chrome.service import Service as ChromeService
+    from selenium.webdriver.firefox.service import Service as FirefoxService
+    from selenium.webdriver.firefox.options import Options as FirefoxOptions
+    from webdriver_manager.chrome import ChromeDriverManager
+    from webdriver_manager.firefox import GeckoDriverManager
+    from selenium import webdriver
 
-# logger
-_LOGGER: logging.Logger = logging.getLogger(__name__)
 
 LOG_FORMAT: str = '%(asctime)s |  %(levelname)-7s | %(message)s (%(filename)s L%(lineno)s %(name)s)'
 
+DEFAULT_WELLNOTE_URL: str = "https://wellnote.jp/"
 DEFAULT_INTERVAL: int = 1
+DEFAULT_PACING: str = "fixed"
+DEFAULT_FETCH: str = "browser"
+FETCH_MODES: tuple[str, ...] = ("browser", "http", "videos")
+DEFAULT_FETCH_WORKERS: int = 4
+DEFAULT_PAGE_LOAD_STRATEGY: str = "normal"
+PAGE_LOAD_STRATEGIES: tuple[str, ...] = ("normal", "eager", "none")
+
+# Browser features which are not needed to download
+CHROME_LIGHTWEIGHT_ARGUMENTS: tuple[str, ...] = (
+    "--no-first-run",
+    "--no-default-browser-check",
+    "--disable-extensions",
+    "--disable-default-apps",
+    "--disable-sync",
+    "--disable-translate",
+    "--disable-background-networking",
+    "--disable-component-update",
+    "--disable-dev-shm-usage",
+    "--mute-audio",
+)
+FIREFOX_LIGHTWEIGHT_PREFERENCES: dict[str, object] = {
+    "app.update.auto": False,
+    "browser.shell.checkDefaultBrowser": False,
+    "datareporting.healthreport.uploadEnabled": False,
+    "datareporting.policy.dataSubmissionEnabled": False,
+    "toolkit.telemetry.enabled": False,
+    "extensions.update.enabled": False,
+    "media.autoplay.default": 5,
+}
+PACING_MODES: tuple[str, ...] = ("fixed", "adaptive")
 NUM_OF_RETRIES: int = 3
 
 def parse_date_str_int(date_s: str) -> tuple[str, str, str]:
@@ -65,6 +133,7 @@ def parse_date_str_int(date_s: str) -> tuple[str, str, str]:
     raise ValueError("Could not parse date_s '%s'", date_s)
 
 def disable_update_time_of_file(filepath, dt):
+    import filedate
     filedate_file = filedate.File(filepath)
     
     _LOGGER.debug("Updating time of file='%s' with dt='%s'", filepath, dt)
@@ -76,63 +145,151 @@ def disable_update_time_of_file(filepath, dt):
     
     os.chmod(filepath, 0o644)
 
+def time_needs_update(filepath: str, dt: datetime) -> bool:
+    """
+    A file which has the time already is not touched, so that the hash cache keyed on its mtime stays valid.
+    Neither is a file which dedup linked to another, because the links share the time of the canonical file.
+    """
+    stat: os.stat_result = os.lstat(filepath)
+    if stat.st_nlink > 1 or os.path.islink(filepath):
+        return False
+    return abs(stat.st_mtime - dt.timestamp()) >= 1 or stat.st_mode & 0o777 != 0o644
+
 ################################################################################
 # Utilities for Selenium
 
 
-def get_driver_and_wait(download_dir: str = None, browser: str = None, clear_profile = False) -> tuple[WebDriver, WebDriverWait, str, int]:
-
-    timeout_sec: int = 60
-
+def get_download_dir(download_dir: str = None) -> str:
     # download_dir: str = "/Users/nogayama1/Downloads"
     if not download_dir:
         # download_dir = os.path.join(os.path.expanduser("~"), "Downloads")
         download_dir = os.path.join(os.getcwd(), "Downloads")
+    return download_dir
 
-    if not browser:
-        browser = "chrome"
-
-    driver: WebDriver = None
+def get_profile_dir(browser: str, worker_id: int = None, account: str = None) -> str:
+    """
+    Each worker of parallel download has its own profile dir because a browser profile can't be shared between processes.
+    Each account of batch download has its own profile dir so that the session of another account is never reused.
+    """
+    profile_name: str = f"{browser}_profile"
+    if account is not None:
+        profile_name += f"_{account}"
+    if worker_id is not None:
+        profile_name += f"_worker{worker_id}"
+    return os.path.join(tempfile.gettempdir(), "wellnote_downloader", profile_name)
+
+def clear_profile_dir(profile_dir: str):
+    _LOGGER.info("Deleting the profile dir to reset the session")
+    if os.path.exists(profile_dir) and os.path.isdir(profile_dir):
+        shutil.rmtree(profile_dir)
+
+def get_driver_path(browser: str, refresh: bool = False) -> str:
+    """
+    webdriver_manager checks the latest driver version over the network on every install().
+    The resolved driver path is cached and reused while it exists, so that the browser starts quickly and offline.
+    """
+    cache_filepath: str = os.path.join(tempfile.gettempdir(), "wellnote_downloader", "drivers.json")
+    browser2path: dict[str, str] = {}
+    if os.path.exists(cache_filepath):
+        try:
+            with open(cache_filepath) as f:
+                browser2path = json.load(f)
+        except ValueError:
+            _LOGGER.warning("Ignoring broken driver cache %s", cache_filepath)
+
+    driver_path: str = browser2path.get(browser)
+    if driver_path and os.path.exists(driver_path) and not refresh:
+        _LOGGER.info("Using cached %s driver %s", browser, driver_path)
+        return driver_path
+
+    _LOGGER.info("Resolving %s driver", browser)
     if browser == "chrome":
-        chrome_options = webdriver.ChromeOptions()
-        
-        profile_dir: str = os.path.join(tempfile.gettempdir(), "wellnote_downloader", "chrome_profile")
-        _LOGGER.info("Using profile dir to reuse session with semi persistent temporary directory: %s", profile_dir)
-        if clear_profile:
-            _LOGGER.info("Deleting the profile dir to reset the session")
-            if os.path.exists(profile_dir) and os.path.isdir(profile_dir):
-                shutil.rmtree(profile_dir)
-        os.makedirs(profile_dir, exist_ok=True)
-        chrome_options.add_argument(f"--user-data-dir='{profile_dir}'")
-
-        prefs = {'download.default_directory': download_dir}
-        chrome_options.add_experimental_option('prefs', prefs)
-
-        driver = webdriver.Chrome(service=ChromeService(ChromeDriverManager().install()), chrome_options=chrome_options)
+        driver_path = ChromeDriverManager().install()
     elif browser == "firefox":
-        options = FirefoxOptions()
-        
-        profile_dir: str = os.path.join(tempfile.gettempdir(), "wellnote_downloader", "firefox_profile")
-        _LOGGER.info("Using profile dir to reuse session with semi persistent temporary directory: %s", profile_dir)
-        if clear_profile:
-            _LOGGER.info("Deleting the profile dir to reset the session")
-            if os.path.exists(profile_dir) and os.path.isdir(profile_dir):
-                shutil.rmtree(profile_dir)
-        os.makedirs(profile_dir, exist_ok=True)
-        options.add_argument('-profile')
-        options.add_argument(profile_dir)
-
-        options.set_preference("browser.download.folderList", 2)
-        options.set_preference("browser.download.dir", download_dir)
-
-        driver = webdriver.Firefox(service=FirefoxService(GeckoDriverManager().install()), \
-                                    options=options)
+        driver_path = GeckoDriverManager().install()
     else:
         raise ValueError(f"browser type '{browser}' is not supported.")
+
+    browser2path[browser] = driver_path
+    os.makedirs(os.path.dirname(cache_filepath), exist_ok=True)
+    with open(cache_filepath, "w") as f:
+        json.dump(browser2path, f)
+    return driver_path
+
+def get_driver_and_wait(download_dir: str = None, browser: str = None, clear_profile = False, worker_id: int = None, \
+                        headless: bool = False, page_load_strategy: str = DEFAULT_PAGE_LOAD_STRATEGY, account: str = None) -> tuple[WebDriver, WebDriverWait, str, int]:
+
+    import_selenium()
+
+    timeout_sec: int = 60
+
+    download_dir = get_download_dir(download_dir)
+
+    if not browser:
+        browser = "chrome"
+
+    profile_dir: str = get_profile_dir(browser, worker_id, account)
+    _LOGGER.info("Using profile dir to reuse session with semi persistent temporary directory: %s", profile_dir)
+    if clear_profile:
+        clear_profile_dir(profile_dir)
+    os.makedirs(profile_dir, exist_ok=True)
+
+    def _start(driver_path: str) -> WebDriver:
+        if browser == "chrome":
+            chrome_options = webdriver.ChromeOptions()
+            chrome_options.page_load_strategy = page_load_strategy
+            chrome_options.add_argument(f"--user-data-dir='{profile_dir}'")
+            for argument in CHROME_LIGHTWEIGHT_ARGUMENTS:
+                chrome_options.add_argument(argument)
+            if headless:
+                chrome_options.add_argument("--headless=new")
+                chrome_options.add_argument("--window-size=1920,1080")
+
+            prefs = {'download.default_directory': download_dir}
+            chrome_options.add_experimental_option('prefs', prefs)
+
+            return webdriver.Chrome(service=ChromeService(driver_path), chrome_options=chrome_options)
+        elif browser == "firefox":
+            options = FirefoxOptions()
+            options.page_load_strategy = page_load_strategy
+            options.add_argument('-profile')
+            options.add_argument(profile_dir)
+            for key, value in FIREFOX_LIGHTWEIGHT_PREFERENCES.items():
+                options.set_preference(key, value)
+            if headless:
+                options.add_argument("-headless")
+                options.add_argument("--width=1920")
+                options.add_argument("--height=1080")
+
+            options.set_preference("browser.download.folderList", 2)
+            options.set_preference("browser.download.dir", download_dir)
+
+            return webdriver.Firefox(service=FirefoxService(driver_path), \
+                                        options=options)
+        else:
+            raise ValueError(f"browser type '{browser}' is not supported.")
+
+    driver: WebDriver = None
+    try:
+        driver = _start(get_driver_path(browser))
+    except WebDriverException as e:
+        # The cached driver may not match the updated browser
+        _LOGGER.warning("Resolving %s driver again because the browser could not be started: %s", browser, e.msg)
+        driver = _start(get_driver_path(browser, refresh=True))
+
     driver.implicitly_wait(timeout_sec)
     wait: WebDriverWait = WebDriverWait(driver, timeout_sec)
     return driver, wait, download_dir, timeout_sec
 
+def quit_driver(driver: WebDriver):
+    """
+    Quits the browser without raising, because the browser may have crashed already.
+    """
+    try:
+        driver.quit()
+    except Exception as e:
+        _LOGGER.debug("Failed to quit the browser: %s", e)
+
 def is_attached(elem):
     try:
         elem.is_enabled()
@@ -146,68 +303,206 @@ def scroll_to_show_element(driver, element, offset=0):
     if offset != 0:
         driver.execute_script("window.scrollTo(0, window.pageYOffset + " + str(offset) + ");")
 
-@contextmanager
-def inspect_mode(driver: WebDriver, original_timeout: int, inspect_sec: int = 1):
-    driver.implicitly_wait(inspect_sec)
-    wait2 = WebDriverWait(driver, inspect_sec)
-    try:
-        yield wait2
-    except NoSuchElementException:
-        pass
-    except TimeoutException:
-        pass
-    finally:
-        driver.implicitly_wait(original_timeout)
+# Finds the first locator which has a displayed and enabled element, in one round trip and without the implicit wait.
+# arguments[0] is a list of [by, value] of selenium locators.
+PROBE_SCRIPT: str = """
+function find(by, value) {
+    if (by === 'xpath') {
+        var snapshot = document.evaluate(value, document, null, XPathResult.ORDERED_NODE_SNAPSHOT_TYPE, null);
+        var nodes = [];
+        for (var i = 0; i < snapshot.snapshotLength; i++) { nodes.push(snapshot.snapshotItem(i)); }
+        return nodes;
+    }
+    if (by === 'id') { value = '[id="' + value + '"]'; }
+    else if (by === 'class name') { value = '.' + value; }
+    else if (by === 'name') { value = '[name="' + value + '"]'; }
+    return Array.prototype.slice.call(document.querySelectorAll(value));
+}
+function clickable(element) {
+    return element.getClientRects().length > 0
+        && window.getComputedStyle(element).visibility !== 'hidden'
+        && !element.disabled;
+}
+var locators = arguments[0];
+for (var i = 0; i < locators.length; i++) {
+    var elements = find(locators[i][0], locators[i][1]);
+    for (var j = 0; j < elements.length; j++) {
+        if (clickable(elements[j])) { return [elements[j], i]; }
+    }
+}
+return null;
+"""
+
+def probe(driver: WebDriver, *locators) -> tuple[WebElement, int]:
+    """
+    Returns the first displayed and enabled element of the locators and the index of its locator,
+    or (None, -1) right away if there is none.
+    """
+    found = driver.execute_script(PROBE_SCRIPT, [list(locator) for locator in locators])
+    if not found:
+        return None, -1
+    return found[0], found[1]
 
-class EC_OR:
+def any_element_is_clickable(*locators):
+    """
+    Wait condition which returns (element, index of its locator) of the first clickable locator.
+    Every poll is one round trip.
+    """
+    def _predicate(driver: WebDriver):
+        element, idx = probe(driver, *locators)
+        return (element, idx) if element else False
+    return _predicate
 
-    def __init__(self, timeout_sec, *args):
-        self.timeout_sec = timeout_sec
-        self.conditions = args
-    
-    def __call__(self, driver):
-        with inspect_mode(driver, self.timeout_sec):
-            for idx, condition in enumerate(self.conditions):
-                time.sleep(1)
-                try:
-                    _LOGGER.debug("Waiting for condition %s / %s", idx + 1, len(self.conditions))
-                    ans = condition(driver)
-                    if ans:
-                        return ans, idx
-                except Exception:
-                    pass
-            return False
 
+def text_changes(locator, old_text: str):
+    """
+    Waits until the text of the element is updated, e.g. the year text after clicking the previous year button.
+    """
+    def _f(driver):
+        text: str = driver.find_element(*locator).text
+        return text if text != old_text else False
 
-def download_is_completed(download_dir: str, last_newest_file: str = None):
+    return _f
 
+def element_changes(locator, old_element: WebElement):
+    """
+    Waits until another element matches the locator, e.g. the active swiper slide after clicking the next button.
+    """
     def _f(driver):
-        filepaths: list[str] = glob.glob(os.path.join(download_dir, "*"))
+        element: WebElement = driver.find_element(*locator)
+        return element if element != old_element else False
 
-        filepaths = [filepath for filepath in filepaths if os.path.isfile(filepath)]
+    return _f
 
-        if not filepaths:  # empty
-            _LOGGER.info("The download is not started yet because the download dir is empty")
-            return False
+def images_are_loaded(element: WebElement):
+
+    def _f(driver):
+        return driver.execute_script("return Array.from(arguments[0].getElementsByTagName('img')).every(function(img) { return img.complete; });", element)
+
+    return _f
+
+
+class Pacer:
+    """
+    Decides how long to sleep between browser events.
 
-        newest_file = max(filepaths, key=lambda fp: os.path.getmtime(fp))
-        if newest_file == last_newest_file:
-            _LOGGER.info("The download is not started yet")
+    fixed:    sleeps interval * scale after each event as before.
+    adaptive: waits until the page reflects the event, then sleeps only when the page gets slow or errors happen.
+              The interval is the ceiling of the additional sleep.
+    """
+
+    FAST_LATENCY_SEC: float = 0.5
+    SMOOTHING: float = 0.3
+    # The probe of the adaptive mode gives up after a few times the usual latency and delay, not the timeout of the page loads
+    PROBE_TIMEOUT_SEC: float = 2.0
+    PROBE_TIMEOUT_FACTOR: float = 4.0
+    PROBE_POLL_SEC: float = 0.1
+
+    def __init__(self, interval: float = DEFAULT_INTERVAL, mode: str = DEFAULT_PACING):
+        if mode not in PACING_MODES:
+            raise ValueError(f"pacing mode '{mode}' is not supported.")
+        self.interval = interval
+        self.mode = mode
+        self.latency_sec: float = 0.0
+        self.backoff_sec: float = 0.0
+
+    @property
+    def adaptive(self) -> bool:
+        return self.mode == "adaptive"
+
+    @property
+    def delay_sec(self) -> float:
+        if not self.adaptive:
+            return self.interval
+        return min(self.interval, max(0.0, self.latency_sec - self.FAST_LATENCY_SEC) + self.backoff_sec)
+
+    def observe(self, latency_sec: float):
+        self.latency_sec = self.SMOOTHING * latency_sec + (1 - self.SMOOTHING) * self.latency_sec
+        self.backoff_sec /= 2
+
+    def penalize(self):
+        self.backoff_sec = min(self.interval, max(self.backoff_sec * 2, self.interval / 4))
+        _LOGGER.info("Slowing down browser events. delay=%.2f sec", self.delay_sec)
+
+    def pause(self, scale: float = 1.0):
+        delay_sec: float = self.delay_sec * scale
+        if delay_sec > 0:
+            time.sleep(delay_sec)
+
+    def get_probe_timeout_sec(self, max_timeout_sec: float) -> float:
+        return min(max_timeout_sec, max(self.PROBE_TIMEOUT_SEC, self.PROBE_TIMEOUT_FACTOR * (self.latency_sec + self.delay_sec)))
+
+    def after(self, wait: WebDriverWait, condition, scale: float = 1.0):
+        """
+        Called after a browser event. Adaptive mode waits for the condition instead of a fixed sleep.
+        If the page does not change within the probe timeout, it sleeps the delay slowed down as the fixed mode does.
+        """
+        if not self.adaptive:
+            self.pause(scale)
+            return None
+
+        timeout_sec: float = self.get_probe_timeout_sec(wait._timeout)
+        start: float = time.monotonic()
+        try:
+            ans = WebDriverWait(wait._driver, timeout_sec, poll_frequency=self.PROBE_POLL_SEC).until(condition)
+        except TimeoutException:
+            _LOGGER.warning("The page did not change within %.1f sec", timeout_sec)
+            self.penalize()
+            self.pause(scale)
+            return None
+        self.observe(time.monotonic() - start)
+        self.pause(scale)
+        return ans
+
+
+PARTIAL_EXTENSIONS: tuple[str, ...] = ("part", "crdownload")
+
+def make_staging_dir(download_dir: str, worker_id: int = None) -> str:
+    """
+    The browser downloads into a fresh staging dir under the download dir.
+    Every downloaded file is moved out of it immediately, so checking completion never scans the downloaded files.
+    """
+    os.makedirs(download_dir, exist_ok=True)
+    prefix: str = ".wellnote_staging_" if worker_id is None else f".wellnote_worker{worker_id}_"
+    return tempfile.mkdtemp(prefix=prefix, dir=download_dir)
+
+def download_is_completed(staging_dir: str, get_ignored_paths: Callable[[], set[str]] = frozenset):
+    """
+    Firefox creates an empty file with the final name and writes into a .part file.
+    Chrome writes into a .crdownload file and renames it.
+    So a download is completed when the staging dir has a file and no partial file.
+
+    The ignored paths are taken before listing the staging dir. A path leaves them only after its file has been moved away,
+    so a listed file which is not ignored is a new download.
+    """
+
+    def _f(driver):
+        ignored_paths: set[str] = get_ignored_paths()
+        filepath2mtime: dict[str, float] = {}
+        with os.scandir(staging_dir) as entries:
+            for entry in entries:
+                if entry.path in ignored_paths:
+                    continue
+                try:
+                    if not entry.is_file():
+                        continue
+                    mtime: float = entry.stat().st_mtime
+                except FileNotFoundError:
+                    continue  # renamed by the browser
+                if entry.name.split(".")[-1] in PARTIAL_EXTENSIONS:
+                    _LOGGER.info("Downloading...")
+                    return False
+                filepath2mtime[entry.path] = mtime
+
+        if not filepath2mtime:  # empty
+            _LOGGER.info("The download is not started yet because the staging dir is empty")
             return False
 
-        newest_file_basename: str = os.path.basename(newest_file)
+        if len(filepath2mtime) > 1:
+            _LOGGER.warning("Found %s files in the staging dir. Using the newest one.", len(filepath2mtime))
 
-        if "." not in newest_file_basename:
-            _LOGGER.info("The latest file does not have an extension. Download may be finished.")
-            return newest_file
-        else:
-            extension: str = newest_file_basename.split(".")[-1]
-            if extension in ("part", "crdownload"):
-                _LOGGER.info("Downloading...")
-                return False
-            else:
-                _LOGGER.info("Download has been finished")
-                return newest_file
+        _LOGGER.info("Download has been finished")
+        return max(filepath2mtime, key=filepath2mtime.get)
 
     return _f
 
@@ -217,20 +512,1930 @@ class DownloadResult:
         self.downloaded_filepath = None
 
 @contextmanager
-def safe_download(driver: WebDriver, wait: WebDriverWait, download_dir: str):
+def safe_download(driver: WebDriver, wait: WebDriverWait, staging_dir: str, get_ignored_paths: Callable[[], set[str]] = frozenset):
+    """
+    get_ignored_paths returns the finished downloads which are still waiting to be moved by the post processor.
+    """
 
-    filepaths: list[str] = glob.glob(os.path.join(download_dir, "*"))
-    last_newest_file = max(filepaths, key=lambda fp: os.path.getmtime(fp)) if filepaths else None
+    ignored_paths: set[str] = get_ignored_paths()
+    with os.scandir(staging_dir) as entries:
+        for entry in entries:
+            if entry.path in ignored_paths:
+                continue
+            _LOGGER.warning("Deleting a leftover in the staging dir: %s", entry.name)
+            if entry.is_dir():
+                shutil.rmtree(entry.path, ignore_errors=True)
+            else:
+                os.remove(entry.path)
 
     download_result = DownloadResult()
     yield download_result
 
     _LOGGER.debug("Waiting until the download is completed")
-    download_result.downloaded_filepath = wait.until(download_is_completed(download_dir, last_newest_file))
+    download_result.downloaded_filepath = wait.until(download_is_completed(staging_dir, get_ignored_paths))
+
+
+# Counts the items of the month in the album grid in one round trip.
+# Returns null if the grid is virtualized and some items are not rendered.
+GRID_COUNT_SCRIPT: str = """
+var items = document.getElementsByClassName('virtuoso-grid-item');
+var list = document.querySelector('.virtuoso-grid-list');
+if (list) {
+    var style = window.getComputedStyle(list);
+    if (parseFloat(style.paddingTop) > 0 || parseFloat(style.paddingBottom) > 0) {
+        return null;
+    }
+}
+return items.length;
+"""
+
+
+################################################################################
+# Utilities for HTTP fetch
+
+# Reads the date text and the media url of the active slide of the viewer in one round trip
+VIEWER_SNAPSHOT_SCRIPT: str = """
+var date = document.querySelector('.sc-hmvnCu');
+var slide = document.querySelector('.swiper-slide-active');
+var media = slide ? slide.querySelector('video source[src], video[src], img[src]') : null;
+return {
+    date: date ? date.textContent : null,
+    src: media ? (media.currentSrc || media.src) : null,
+    video: !!(slide && slide.querySelector('video'))
+};
+"""
+
+def get_extension(url: str, content_type: str = None) -> str:
+    """
+    https://example.com/a/b.JPG?x=1 -> jpg
+    """
+    import urllib3
+    path: str = urllib3.util.parse_url(url).path or ""
+    basename: str = path.split("/")[-1]
+    if "." in basename:
+        return basename.split(".")[-1].lower()
+    if content_type:
+        extension: str = mimetypes.guess_extension(content_type.split(";")[0].strip())
+        if extension:
+            return extension.lstrip(".")
+    return "bin"
+
+
+RANGE_CHUNK_SIZE: int = 8 * 1024 * 1024
+FETCH_TIMEOUT_SEC: int = 60
+
+CONTENT_RANGE_PATTERN: re.Pattern = re.compile(r"bytes (\d+)-(\d+)/(\d+|\*)")
+
+def load_partial_state(state_filepath: str) -> dict:
+    try:
+        with open(state_filepath, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_partial_state(state_filepath: str, state: dict):
+    tmp_filepath: str = state_filepath + ".tmp"
+    with open(tmp_filepath, "w", encoding="utf-8") as f:
+        json.dump(state, f)
+    os.replace(tmp_filepath, state_filepath)
+
+def get_cookie_header(cookies: list[dict], url: str) -> str:
+    """
+    Joins the browser cookies which the browser would send to url: the domain matches the host,
+    the path is a prefix of the path, and secure cookies go only over https. Returns None if none of them match.
+    """
+    import urllib3
+    parsed = urllib3.util.parse_url(url)
+    host: str = (parsed.host or "").lower()
+    path: str = parsed.path or "/"
+    matched: list[str] = []
+    for cookie in cookies:
+        domain: str = cookie.get("domain", "").lower()
+        if domain.startswith("."):
+            if host != domain[1:] and not host.endswith(domain):
+                continue
+        elif host != domain:
+            continue
+        cookie_path: str = cookie.get("path") or "/"
+        if not (path == cookie_path or path.startswith(cookie_path.rstrip("/") + "/")):
+            continue
+        if cookie.get("secure") and parsed.scheme != "https":
+            continue
+        matched.append(f"{cookie['name']}={cookie['value']}")
+    return "; ".join(matched) or None
+
+def md5_of_file(filepath: str) -> str:
+    md5 = hashlib.md5()
+    with open(filepath, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            md5.update(chunk)
+    return md5.hexdigest()
+
+
+class SessionExpired(IOError):
+    """
+    Raised when a media url answers with a login page or a denial, because the cookies of the fetcher are old.
+    """
+
+
+class HttpFetcher:
+    """
+    Downloads media urls found in the viewer with a pool of keep-alive connections,
+    reusing the cookies of the logged-in browser session, while the browser moves to the next item.
+
+    A request carries only the cookies of the browser which match its url, so that a CDN or a presigned storage url
+    does not get the login session. The cookies are copied again at each month, and when a request is denied,
+    the fetch thread asks the browser thread, which owns the driver, for fresh cookies and retries once.
+
+    Media are fetched in chunks of Range requests into {target}.part, and {target}.part.json keeps
+    the size and the validator of the media. An interrupted transfer continues from the size of the .part file,
+    in this run or in the next run.
+    """
+
+    def __init__(self, driver: WebDriver, num_of_workers: int = DEFAULT_FETCH_WORKERS):
+        import urllib3
+        self.num_of_workers = num_of_workers
+        # a stalled transfer times out and continues from where it stopped
+        self.pool: urllib3.PoolManager = urllib3.PoolManager(maxsize=num_of_workers, block=True, retries=urllib3.Retry(total=3, backoff_factor=1), \
+                                                             timeout=urllib3.Timeout(connect=FETCH_TIMEOUT_SEC, read=FETCH_TIMEOUT_SEC))
+        self.executor: ThreadPoolExecutor = ThreadPoolExecutor(max_workers=num_of_workers, thread_name_prefix="fetcher")
+        self.futures: list[tuple[Future, object]] = []
+        self.headers: dict[str, str] = {}
+        self.cookies: list[dict] = []
+        self.driver: WebDriver = driver
+        # the fetch threads wait on it for a newer session_version
+        self.session_condition: threading.Condition = threading.Condition()
+        self.session_version: int = 0
+        self.session_expired: threading.Event = threading.Event()
+        self.update_session(driver)
+
+    def update_session(self, driver: WebDriver):
+        """
+        Runs on the browser thread.
+        """
+        cookies: list[dict] = driver.get_cookies()
+        headers: dict[str, str] = {
+            "User-Agent": driver.execute_script("return navigator.userAgent;"),
+            "Referer": driver.current_url,
+        }
+        with self.session_condition:
+            self.cookies, self.headers = cookies, headers
+            self.session_version += 1
+            self.session_expired.clear()
+            self.session_condition.notify_all()
+
+    def refresh_session_if_expired(self):
+        """
+        Runs on the browser thread, where a fetch thread can't use the driver.
+        """
+        if not self.session_expired.is_set():
+            return
+        _LOGGER.warning("Refreshing the cookies of the fetcher")
+        try:
+            self.update_session(self.driver)
+        except Exception as e:
+            _LOGGER.error("Failed to refresh the cookies of the fetcher: %s", e)
+            self.session_expired.clear()  # the waiting fetches time out and fail
+
+    def wait_for_new_session(self, session_version: int) -> bool:
+        """
+        Runs on a fetch thread. Returns whether the browser thread has copied the cookies again after session_version.
+        """
+        with self.session_condition:
+            if self.session_version == session_version:
+                self.session_expired.set()
+                self.session_condition.wait_for(lambda: self.session_version != session_version, timeout=FETCH_TIMEOUT_SEC)
+            return self.session_version != session_version
+
+    def _fetch(self, url: str, target_filepath_woe: str) -> str:
+        import urllib3
+        os.makedirs(os.path.dirname(target_filepath_woe), exist_ok=True)
+        partial_filepath: str = target_filepath_woe + ".part"
+        state_filepath: str = partial_filepath + ".json"
+
+        # the query of a media url may be a signature which changes every time
+        url_path: str = url.split("?")[0]
+        state: dict = load_partial_state(state_filepath)
+        if state.get("url") != url_path or not os.path.exists(partial_filepath):
+            state = {"url": url_path}
+
+        refreshed: bool = False
+        attempt: int = 0
+        while True:
+            session_version: int = self.session_version
+            try:
+                self._fetch_chunks(url, partial_filepath, state_filepath, state)
+                break
+            except SessionExpired as e:
+                if refreshed or not self.wait_for_new_session(session_version):
+                    raise
+                refreshed = True
+                _LOGGER.warning("Retrying %s with fresh cookies after: %s", partial_filepath.replace(os.getcwd(), "."), e)
+            except (OSError, urllib3.exceptions.HTTPError) as e:
+                if attempt == NUM_OF_RETRIES:
+                    raise
+                attempt += 1
+                _LOGGER.warning("Resuming %s at %s bytes after an error: %s", partial_filepath.replace(os.getcwd(), "."), \
+                                os.path.getsize(partial_filepath) if os.path.exists(partial_filepath) else 0, e)
+
+        self._verify(partial_filepath, state)
+        target_filepath: str = target_filepath_woe + "." + state["extension"]
+        os.replace(partial_filepath, target_filepath)
+        os.remove(state_filepath)
+        return target_filepath
+
+    def _fetch_chunks(self, url: str, partial_filepath: str, state_filepath: str, state: dict):
+        offset: int = os.path.getsize(partial_filepath) if "size" in state else 0
+        while state.get("size") is None or offset < state["size"]:
+            headers: dict[str, str] = dict(self.headers, Range=f"bytes={offset}-{offset + RANGE_CHUNK_SIZE - 1}")
+            cookie: str = get_cookie_header(self.cookies, url)
+            if cookie:
+                headers["Cookie"] = cookie
+            validator: str = state.get("etag") or state.get("last_modified")
+            if offset and validator:
+                headers["If-Range"] = validator
+            response = self.pool.request("GET", url, headers=headers, preload_content=False)
+            try:
+                content_type: str = response.headers.get("Content-Type", "")
+                if response.status in (401, 403) or (response.status in (200, 206) and content_type.startswith("text/html")):
+                    raise SessionExpired(f"GET {url} returned HTTP {response.status} {content_type}")
+                if response.status == 416 and offset and state.get("size") in (None, offset):
+                    state["size"] = offset
+                    return
+                if response.status == 200:
+                    # The server does not support ranges, or the media has changed. Start over.
+                    offset = 0
+                    state.clear()
+                    state["url"] = url.split("?")[0]
+                    content_length: str = response.headers.get("Content-Length")
+                    state["size"] = int(content_length) if content_length else None
+                elif response.status == 206:
+                    match: re.Match = CONTENT_RANGE_PATTERN.match(response.headers.get("Content-Range", ""))
+                    if not match or int(match.group(1)) != offset:
+                        raise IOError(f"GET {url} returned an unexpected Content-Range {response.headers.get('Content-Range')}")
+                    if not offset:
+                        state.clear()
+                        state["url"] = url.split("?")[0]
+                    state["size"] = int(match.group(3)) if match.group(3) != "*" else None
+                else:
+                    raise IOError(f"GET {url} returned HTTP {response.status}")
+
+                state.setdefault("extension", get_extension(url, content_type))
+                state.setdefault("etag", response.headers.get("ETag"))
+                state.setdefault("last_modified", response.headers.get("Last-Modified"))
+
+                with open(partial_filepath, "r+b" if offset else "wb") as f:
+                    f.seek(offset)
+                    f.truncate()
+                    for chunk in response.stream(1024 * 1024):
+                        f.write(chunk)
+                        offset += len(chunk)
+                if state["size"] is None and response.status == 200:
+                    state["size"] = offset
+                save_partial_state(state_filepath, state)
+                if response.status == 200:
+                    return
+            finally:
+                response.release_conn()
+
+    def _verify(self, partial_filepath: str, state: dict):
+        """
+        Checks the size, and the MD5 if the ETag is an MD5 as object storages return.
+        A broken transfer is deleted so that the next try starts over.
+        """
+        size: int = os.path.getsize(partial_filepath)
+        etag: str = (state.get("etag") or "").strip('"')
+        error: str = None
+        if size != state.get("size"):
+            error = f"{size} bytes instead of {state.get('size')} bytes"
+        elif re.fullmatch(r"[0-9a-f]{32}", etag) and md5_of_file(partial_filepath) != etag:
+            error = f"MD5 does not match the ETag {etag}"
+        if error:
+            os.remove(partial_filepath)
+            os.remove(partial_filepath + ".json")
+            raise IOError(f"{partial_filepath} is broken: {error}")
+
+    def wait(self, futures: list[Future], return_when: str):
+        """
+        Waits on the browser thread, and refreshes the cookies when a fetch asks for them meanwhile.
+        """
+        while True:
+            self.refresh_session_if_expired()
+            _, not_done = wait_futures(futures, timeout=1, return_when=return_when)
+            if not not_done or (return_when == FIRST_COMPLETED and len(not_done) < len(futures)):
+                return
+
+    def submit(self, url: str, target_filepath_woe: str, payload: object):
+        # back-pressure to keep the browser at most a few items ahead of the downloads
+        self.refresh_session_if_expired()
+        running: list[Future] = [future for future, _ in self.futures if not future.done()]
+        if len(running) >= self.num_of_workers * 2:
+            self.wait(running, FIRST_COMPLETED)
+        self.futures.append((self.executor.submit(self._fetch, url, target_filepath_woe), payload))
+
+    def completed(self, block: bool = False) -> tuple[list[tuple[object, str]], int]:
+        """
+        Returns the payloads and file paths of the finished downloads, and the number of failures.
+        """
+        results: list[tuple[object, str]] = []
+        num_of_failures: int = 0
+        pending: list[tuple[Future, object]] = []
+        if block:
+            self.wait([future for future, _ in self.futures], ALL_COMPLETED)
+        for future, payload in self.futures:
+            if not block and not future.done():
+                pending.append((future, payload))
+                continue
+            try:
+                results.append((payload, future.result()))
+            except Exception as e:
+                num_of_failures += 1
+                _LOGGER.error("Failed to fetch %s: %s", payload, e)
+        self.futures = pending
+        return results, num_of_failures
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        self.pool.clear()
+
+
+################################################################################
+# Utilities for metrics
+
+class Metrics:
+    """
+    Records how long each phase takes and how many WebDriver calls each item needs.
+
+    With a file path, every item is appended to the file as a JSON line,
+    and a Prometheus textfile is written next to it (e.g. metrics.jsonl and metrics.prom).
+    A summary with items/sec and ETA is logged periodically.
+    """
+
+    SUMMARY_INTERVAL_SEC: float = 30.0
+
+    def __init__(self, filepath: str = None, source: str = "album", worker_id: int = None):
+        self.source = source
+        self.worker_id = worker_id
+        self.lock: threading.Lock = threading.Lock()
+        self.phase2stats: dict[str, list[float]] = {}  # name -> [count, total sec, max sec]
+        self.num_of_items: int = 0
+        self.num_of_webdriver_calls: int = 0
+        self.num_of_webdriver_calls_at_last_item: int = 0
+        self.progress: tuple[float, float] = (0, 0)  # done, total
+        self.start_time: float = time.monotonic()
+        self.last_summary_time: float = self.start_time
+
+        self.file = None
+        self.prometheus_filepath: str = None
+        if filepath:
+            os.makedirs(os.path.dirname(os.path.abspath(filepath)), exist_ok=True)
+            self.file = open(filepath, "a", encoding="utf-8")
+            suffix: str = "" if worker_id is None else f"_worker{worker_id}"
+            self.prometheus_filepath = os.path.splitext(filepath)[0] + suffix + ".prom"
+
+    def add(self, name: str, elapsed_sec: float):
+        # the post processor thread also records phases
+        with self.lock:
+            stats: list[float] = self.phase2stats.setdefault(name, [0, 0.0, 0.0])
+            stats[0] += 1
+            stats[1] += elapsed_sec
+            stats[2] = max(stats[2], elapsed_sec)
+
+    @contextmanager
+    def phase(self, name: str):
+        start: float = time.monotonic()
+        try:
+            yield
+        finally:
+            self.add(name, time.monotonic() - start)
+
+    def attach(self, driver: WebDriver, wait: WebDriverWait):
+        """
+        Counts every WebDriver command and times every wait.until of this driver.
+        """
+        execute = driver.execute
+        until = wait.until
+
+        def counting_execute(*args, **kwargs):
+            self.num_of_webdriver_calls += 1
+            return execute(*args, **kwargs)
+
+        def timed_until(*args, **kwargs):
+            with self.phase("wait"):
+                return until(*args, **kwargs)
+
+        driver.execute = counting_execute
+        wait.until = timed_until
+
+    def set_progress(self, done: float, total: float):
+        self.progress = (done, total)
+
+    def item(self, **fields):
+        self.num_of_items += 1
+        webdriver_calls: int = self.num_of_webdriver_calls - self.num_of_webdriver_calls_at_last_item
+        self.num_of_webdriver_calls_at_last_item = self.num_of_webdriver_calls
+        if self.file:
+            record: dict = dict(event="item", time=datetime.now().isoformat(timespec="seconds"), source=self.source, \
+                                worker=self.worker_id, webdriver_calls=webdriver_calls, **fields)
+            self.file.write(json.dumps(record, default=str) + "\n")
+            self.file.flush()
+        if time.monotonic() - self.last_summary_time >= self.SUMMARY_INTERVAL_SEC:
+            self.log_summary()
+
+    def summary(self) -> dict:
+        elapsed_sec: float = time.monotonic() - self.start_time
+        items_per_sec: float = self.num_of_items / elapsed_sec if elapsed_sec > 0 else 0.0
+        done, total = self.progress
+        eta_sec: float = None
+        if 0 < done < total:
+            eta_sec = elapsed_sec * (total - done) / done
+        return {
+            "source": self.source,
+            "worker": self.worker_id,
+            "elapsed_sec": round(elapsed_sec, 3),
+            "items": self.num_of_items,
+            "items_per_sec": round(items_per_sec, 3),
+            "webdriver_calls": self.num_of_webdriver_calls,
+            "webdriver_calls_per_item": round(self.num_of_webdriver_calls / self.num_of_items, 2) if self.num_of_items else None,
+            "eta_sec": round(eta_sec) if eta_sec is not None else None,
+            "phases": {name: {"count": count, "total_sec": round(total_sec, 3), "max_sec": round(max_sec, 3)} \
+                       for name, (count, total_sec, max_sec) in list(self.phase2stats.items())},
+        }
+
+    def log_summary(self):
+        self.last_summary_time = time.monotonic()
+        summary: dict = self.summary()
+        eta: str = f"{summary['eta_sec'] // 60}m{summary['eta_sec'] % 60:02}s" if summary["eta_sec"] is not None else "unknown"
+        _LOGGER.warning("Progress: %s items, %.2f items/sec, %s WebDriver calls/item, ETA %s", \
+                        summary["items"], summary["items_per_sec"], summary["webdriver_calls_per_item"], eta)
+        slowest: list[tuple[str, dict]] = sorted(summary["phases"].items(), key=lambda kv: -kv[1]["total_sec"])[:3]
+        _LOGGER.info("Slowest phases: %s", ", ".join(f"{name}={stats['total_sec']}s" for name, stats in slowest))
+        self.write_prometheus(summary)
+
+    def write_prometheus(self, summary: dict = None):
+        if not self.prometheus_filepath:
+            return
+        summary = summary or self.summary()
+        labels: str = f'source="{self.source}"' + (f',worker="{self.worker_id}"' if self.worker_id is not None else "")
+        lines: list[str] = [
+            "# TYPE wellnote_downloader_items_total counter",
+            f"wellnote_downloader_items_total{{{labels}}} {summary['items']}",
+            "# TYPE wellnote_downloader_webdriver_calls_total counter",
+            f"wellnote_downloader_webdriver_calls_total{{{labels}}} {summary['webdriver_calls']}",
+            "# TYPE wellnote_downloader_items_per_second gauge",
+            f"wellnote_downloader_items_per_second{{{labels}}} {summary['items_per_sec']}",
+            "# TYPE wellnote_downloader_elapsed_seconds gauge",
+            f"wellnote_downloader_elapsed_seconds{{{labels}}} {summary['elapsed_sec']}",
+        ]
+        if summary["eta_sec"] is not None:
+            lines += ["# TYPE wellnote_downloader_eta_seconds gauge", f"wellnote_downloader_eta_seconds{{{labels}}} {summary['eta_sec']}"]
+        lines += ["# TYPE wellnote_downloader_phase_seconds_total counter"]
+        lines += [f'wellnote_downloader_phase_seconds_total{{{labels},phase="{name}"}} {stats["total_sec"]}' for name, stats in summary["phases"].items()]
+        lines += ["# TYPE wellnote_downloader_phase_count_total counter"]
+        lines += [f'wellnote_downloader_phase_count_total{{{labels},phase="{name}"}} {stats["count"]}' for name, stats in summary["phases"].items()]
+        lines += ["# TYPE wellnote_downloader_phase_seconds_max gauge"]
+        lines += [f'wellnote_downloader_phase_seconds_max{{{labels},phase="{name}"}} {stats["max_sec"]}' for name, stats in summary["phases"].items()]
+
+        # node_exporter may read the textfile at any time
+        temporary_filepath: str = self.prometheus_filepath + ".tmp"
+        with open(temporary_filepath, "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(temporary_filepath, self.prometheus_filepath)
+
+    def close(self):
+        summary: dict = self.summary()
+        self.log_summary()
+        if self.file:
+            self.file.write(json.dumps(dict(event="summary", time=datetime.now().isoformat(timespec="seconds"), **summary)) + "\n")
+            self.file.close()
+            self.file = None
+
+
+################################################################################
+# Utilities for post processing
+
+class PostProcessor:
+    """
+    Runs the filesystem work after each download (move, timestamp and chmod) on a background thread,
+    so that the browser loop does not wait for slow or network mounted download dirs.
+
+    The queue is bounded and submit() blocks while it is full.
+    An error of a task is raised by the next submit(), and close() returns the rest.
+    With more than one worker, e.g. for uploads, the tasks may finish out of order.
+    """
+
+    def __init__(self, maxsize: int = 16, workers: int = 1, name: str = "postprocessor"):
+        self.queue: queue.Queue = queue.Queue(maxsize)
+        self.pending_paths: set[str] = set()
+        self.pending_paths_lock: threading.Lock = threading.Lock()
+        self.errors: list[Exception] = []
+        self.num_of_failures: int = 0  # including the errors which have been raised
+        self.threads: list[threading.Thread] = [threading.Thread(target=self._run, name=f"{name}{i}" if workers > 1 else name, daemon=True) \
+                                                for i in range(workers)]
+        for thread in self.threads:
+            thread.start()
+
+    def _run(self):
+        while True:
+            task = self.queue.get()
+            if task is None:
+                self.queue.task_done()
+                return
+            func, args, pending_path = task
+            try:
+                func(*args)
+            except Exception as e:
+                _LOGGER.error("Failed to post process %s: %s", pending_path or args, e)
+                self.errors.append(e)
+                self.num_of_failures += 1
+            finally:
+                # after func, which has moved the file away
+                with self.pending_paths_lock:
+                    self.pending_paths.discard(pending_path)
+                self.queue.task_done()
+
+    def raise_error(self):
+        if self.errors:
+            error: Exception = self.errors.pop(0)
+            raise error
+
+    def submit(self, func, *args, pending_path: str = None):
+        """
+        pending_path is a file which func consumes. It is reported by get_pending_paths() until func finishes.
+        """
+        self.raise_error()
+        if pending_path:
+            with self.pending_paths_lock:
+                self.pending_paths.add(pending_path)
+        self.queue.put((func, args, pending_path))
+
+    def get_pending_paths(self) -> set[str]:
+        """
+        Returns a snapshot, which the worker threads do not change while it is read.
+        """
+        with self.pending_paths_lock:
+            return set(self.pending_paths)
+
+    def is_pending(self, path: str) -> bool:
+        with self.pending_paths_lock:
+            return path in self.pending_paths
+
+    def close(self) -> list[Exception]:
+        """
+        Waits for the queued tasks and stops the thread. Returns the errors which have not been raised yet.
+        """
+        alive_threads: list[threading.Thread] = [thread for thread in self.threads if thread.is_alive()]
+        for _ in alive_threads:
+            self.queue.put(None)
+        for thread in alive_threads:
+            thread.join()
+        errors: list[Exception] = self.errors
+        self.errors = []
+        return errors
+
+
+################################################################################
+# Utilities for archive output
+
+ARCHIVE_FORMATS: tuple[str, ...] = ("tar", "zip")
+DEFAULT_ARCHIVE_VOLUME_MB: int = 1024
+
+class ArchiveMember:
+    """
+    name is the path of the member in the volume, e.g. album/2019/wellnote_2019-09-05_000.jpg.
+    offset is the offset of the data for tar and of the local file header for zip.
+    """
+
+    def __init__(self, name: str, offset: int, size: int, mtime: float):
+        self.name = name
+        self.offset = offset
+        self.size = size
+        self.mtime = mtime
+
+    def to_dict(self) -> dict:
+        return {"member": self.name, "offset": self.offset, "size": self.size, "mtime": self.mtime}
+
+    @classmethod
+    def from_dict(cls, d: dict) -> ArchiveMember:
+        return cls(d["member"], d["offset"], d["size"], d["mtime"])
+
+
+def is_archive_volume(filepath: str) -> bool:
+    return os.path.basename(os.path.dirname(filepath)) == "archive" and filepath.split(".")[-1] in ARCHIVE_FORMATS
+
+def read_archive_member(volume_path: str, member: ArchiveMember) -> bytes:
+    """
+    Reads a member with one seek, without reading the index of the volume.
+    """
+    with open(volume_path, "rb") as f:
+        offset: int = member.offset
+        if volume_path.endswith(".zip"):
+            # members are stored without compression, and the data follows the local file header
+            f.seek(offset)
+            header: bytes = f.read(zipfile.sizeFileHeader)
+            name_length, extra_length = struct.unpack("<HH", header[26:30])
+            offset += zipfile.sizeFileHeader + name_length + extra_length
+        f.seek(offset)
+        return f.read(member.size)
+
+
+def read_archive_index(volume_path: str) -> list[ArchiveMember]:
+    """
+    Reads the members of {volume}.jsonl. A line cut by a crash ends the index.
+    """
+    members: list[ArchiveMember] = []
+    try:
+        with open(volume_path + ".jsonl", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    members.append(ArchiveMember.from_dict(json.loads(line)))
+                except (ValueError, KeyError):
+                    break
+    except FileNotFoundError:
+        pass
+    return members
+
+def repair_zip_volume(volume_path: str) -> list[ArchiveMember]:
+    """
+    Writes the central directory of a zip volume again from the local file headers of the members in its index,
+    when the volume was not closed, e.g. after a crash. The data after the last complete member is truncated.
+    Returns the members which the volume has.
+    """
+    members: list[ArchiveMember] = read_archive_index(volume_path)
+    with open(volume_path, "r+b") as f:
+        volume_size: int = os.fstat(f.fileno()).st_size
+        infos: list[zipfile.ZipInfo] = []
+        end: int = 0
+        for member in members:
+            f.seek(member.offset)
+            header: bytes = f.read(zipfile.sizeFileHeader)
+            if len(header) < zipfile.sizeFileHeader:
+                break
+            signature, extract_version, _, flag_bits, compress_type, _, _, crc, compress_size, file_size, name_length, extra_length \
+                = struct.unpack(zipfile.structFileHeader, header)
+            name: str = f.read(name_length).decode("utf-8" if flag_bits & 0x800 else "cp437")
+            data_end: int = member.offset + zipfile.sizeFileHeader + name_length + extra_length + compress_size
+            if signature != zipfile.stringFileHeader or name != member.name or file_size != member.size or data_end > volume_size:
+                break
+            info: zipfile.ZipInfo = zipfile.ZipInfo(name, date_time=datetime.fromtimestamp(member.mtime).timetuple()[:6])
+            info.compress_type = compress_type
+            info.external_attr = 0o644 << 16
+            info.flag_bits = flag_bits
+            info.extract_version = extract_version
+            info.header_offset = member.offset
+            info.CRC = crc
+            info.compress_size = compress_size
+            info.file_size = file_size
+            infos.append(info)
+            end = data_end
+        if len(infos) < len(members):
+            _LOGGER.error("%s has lost %s members of its index", volume_path, len(members) - len(infos))
+
+        f.seek(end)
+        f.truncate()
+        archive: zipfile.ZipFile = zipfile.ZipFile(f, "w", compression=zipfile.ZIP_STORED)
+        for info in infos:
+            archive.filelist.append(info)
+            archive.NameToInfo[info.filename] = info
+        archive.close()
+
+    if len(infos) < len(members):
+        with open(volume_path + ".jsonl", "w", encoding="utf-8") as f:
+            for member in members[:len(infos)]:
+                f.write(json.dumps(member.to_dict()) + "\n")
+    return members[:len(infos)]
+
+def zip_volume_is_closed(volume_path: str) -> bool:
+    """
+    Tells whether the central directory of the volume has all the members of its index.
+    """
+    try:
+        with zipfile.ZipFile(volume_path) as archive:
+            names: set[str] = set(archive.namelist())
+    except (zipfile.BadZipFile, OSError):
+        return False
+    return all(member.name in names for member in read_archive_index(volume_path))
+
+def get_tar_member_end(member: ArchiveMember) -> int:
+    # the data of a member is padded to blocks
+    return member.offset + -(-member.size // tarfile.BLOCKSIZE) * tarfile.BLOCKSIZE
+
+def tar_volume_is_closed(volume_path: str) -> bool:
+    """
+    Tells whether the volume has nothing but the end of archive blocks after the last member of its index.
+    An empty file is not a tar volume.
+    """
+    members: list[ArchiveMember] = read_archive_index(volume_path)
+    if os.path.getsize(volume_path) == 0:
+        return False
+    with open(volume_path, "rb") as f:
+        f.seek(get_tar_member_end(members[-1]) if members else 0)
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            if chunk.strip(b"\x00"):
+                return False
+    return True
+
+def repair_tar_volume(volume_path: str) -> list[ArchiveMember]:
+    """
+    Truncates a tar volume after the last member of its index whose header and data are complete and ends it again,
+    when the volume was not closed, e.g. after a crash in the middle of a member. Returns the members which the volume has.
+    """
+    members: list[ArchiveMember] = read_archive_index(volume_path)
+    num_of_members: int = 0
+    end: int = 0
+    with open(volume_path, "r+b") as f:
+        volume_size: int = os.fstat(f.fileno()).st_size
+        for member in members:
+            member_end: int = get_tar_member_end(member)
+            f.seek(member.offset - tarfile.BLOCKSIZE)
+            try:
+                info: tarfile.TarInfo = tarfile.TarInfo.frombuf(f.read(tarfile.BLOCKSIZE), tarfile.ENCODING, "surrogateescape")
+            except tarfile.HeaderError:
+                break
+            if info.size != member.size or member_end > volume_size:
+                break
+            num_of_members += 1
+            end = member_end
+        if num_of_members < len(members):
+            _LOGGER.error("%s has lost %s members of its index", volume_path, len(members) - num_of_members)
+        f.seek(end)
+        f.truncate()
+        # tarfile appends at the end of archive blocks, and can't append to a volume without them
+        f.write(bytes(tarfile.BLOCKSIZE * 2))
+
+    if num_of_members < len(members):
+        with open(volume_path + ".jsonl", "w", encoding="utf-8") as f:
+            for member in members[:num_of_members]:
+                f.write(json.dumps(member.to_dict()) + "\n")
+    return members[:num_of_members]
+
+
+class ArchiveWriter:
+    """
+    Appends downloaded files to rolling per-year volumes instead of leaving them in wellnote/{source}/YYYY.
+
+    The volumes are wellnote/archive/{source}_{YYYY}[_worker{N}]_{NNN}.{tar|zip}, and each volume has a
+    JSON lines index {volume}.jsonl of its members. The manifest records the volume and the member of each item,
+    so skip checks keep working and an item is read with one seek.
+
+    The member gets the time of disable_update_time_of_file as its modification time.
+    A volume which was not closed, e.g. after a crash, is repaired from its index when it is opened again:
+    a tar volume is truncated after the last indexed member, and a zip volume gets its central directory.
+    Runs on the post processor thread only.
+    """
+
+    def __init__(self, download_dir: str, archive_format: str = "tar", volume_mb: int = DEFAULT_ARCHIVE_VOLUME_MB, worker_id: int = None):
+        self.download_dir = download_dir
+        self.archive_format = archive_format
+        self.volume_bytes: int = volume_mb * 1024 * 1024
+        self.worker_id = worker_id
+        self.archive_dir: str = os.path.join(download_dir, "wellnote", "archive")
+        os.makedirs(self.archive_dir, exist_ok=True)
+        # volume of each source and year: (path, tarfile or zipfile, index file)
+        self.key2volume: dict[tuple[str, str], tuple] = {}
+
+    def get_volume_path(self, source: str, year: str, number: int) -> str:
+        worker_s: str = f"_worker{self.worker_id}" if self.worker_id is not None else ""
+        return os.path.join(self.archive_dir, f"{source}_{year}{worker_s}_{number:03}.{self.archive_format}")
+
+    def open_volume(self, source: str, year: str) -> tuple:
+        key: tuple[str, str] = (source, year)
+        volume = self.key2volume.get(key)
+        if volume and os.path.getsize(volume[0]) < self.volume_bytes:
+            return volume
+        if volume:
+            self.close_volume(key)
+
+        number: int = 0
+        while os.path.exists(self.get_volume_path(source, year, number + 1)):
+            number += 1
+        volume_path: str = self.get_volume_path(source, year, number)
+        if os.path.exists(volume_path) and os.path.getsize(volume_path) >= self.volume_bytes:
+            volume_path = self.get_volume_path(source, year, number + 1)
+
+        _LOGGER.info("Appending to %s", volume_path.replace(os.getcwd(), "."))
+        if self.archive_format == "tar":
+            if os.path.exists(volume_path) and not tar_volume_is_closed(volume_path):
+                _LOGGER.warning("Repairing %s which was not closed", volume_path.replace(os.getcwd(), "."))
+                repair_tar_volume(volume_path)
+            archive = tarfile.open(volume_path, "a", format=tarfile.PAX_FORMAT)
+        else:
+            if os.path.exists(volume_path) and not zip_volume_is_closed(volume_path):
+                _LOGGER.warning("Repairing %s which was not closed", volume_path.replace(os.getcwd(), "."))
+                repair_zip_volume(volume_path)
+            archive = zipfile.ZipFile(volume_path, "a", compression=zipfile.ZIP_STORED)
+        volume = (volume_path, archive, open(volume_path + ".jsonl", "a", encoding="utf-8"))
+        self.key2volume[key] = volume
+        return volume
+
+    def add(self, source: str, filepath: str, target_filepath: str, dt: datetime = None) -> tuple[str, ArchiveMember]:
+        """
+        Moves filepath into the volume of the year of target_filepath. Returns the volume path and the member.
+        """
+        name: str = os.path.relpath(target_filepath, os.path.join(self.download_dir, "wellnote")).replace(os.sep, "/")
+        year: str = name.split("/")[1]
+        mtime: float = dt.timestamp() if dt else os.path.getmtime(filepath)
+        volume_path, archive, index_file = self.open_volume(source, year)
+
+        if self.archive_format == "tar":
+            info: tarfile.TarInfo = archive.gettarinfo(filepath, name)
+            info.mtime = mtime
+            info.mode = 0o644
+            with open(filepath, "rb") as f:
+                archive.addfile(info, f)
+            archive.fileobj.flush()
+            # addfile pads the data to blocks and moves the offset past it
+            offset_data: int = archive.offset - -(-info.size // tarfile.BLOCKSIZE) * tarfile.BLOCKSIZE
+            member: ArchiveMember = ArchiveMember(name, offset_data, info.size, mtime)
+        else:
+            info: zipfile.ZipInfo = zipfile.ZipInfo(name, date_time=datetime.fromtimestamp(mtime).timetuple()[:6])
+            info.compress_type = zipfile.ZIP_STORED
+            info.external_attr = 0o644 << 16
+            with open(filepath, "rb") as src, archive.open(info, "w") as dst:
+                shutil.copyfileobj(src, dst)
+            member: ArchiveMember = ArchiveMember(name, info.header_offset, info.file_size, mtime)
+
+        index_file.write(json.dumps(member.to_dict()) + "\n")
+        index_file.flush()
+        os.remove(filepath)
+        return volume_path, member
+
+    def close_volume(self, key: tuple[str, str]):
+        _, archive, index_file = self.key2volume.pop(key)
+        archive.close()
+        index_file.close()
+
+    def close(self):
+        for key in list(self.key2volume):
+            self.close_volume(key)
+
+
+################################################################################
+# Utilities for browser recycling
+
+DEFAULT_MAX_RESTARTS: int = NUM_OF_RETRIES
+
+def get_process_tree_rss(pid: int) -> int:
+    """
+    Returns the resident memory (bytes) of the process and its descendants, e.g. a driver and its browser processes.
+    Returns None where /proc is not available.
+    """
+    if not os.path.isdir("/proc"):
+        return None
+    page_size: int = os.sysconf("SC_PAGE_SIZE")
+    rss: int = 0
+    pids: list[int] = [pid]
+    while pids:
+        pid = pids.pop()
+        try:
+            with open(f"/proc/{pid}/statm") as f:
+                rss += int(f.read().split()[1]) * page_size
+            for task in os.listdir(f"/proc/{pid}/task"):
+                with open(f"/proc/{pid}/task/{task}/children") as f:
+                    pids.extend(int(child) for child in f.read().split())
+        except (OSError, ValueError):
+            continue  # the process has exited
+    return rss
+
+
+class RecycleBrowser(Exception):
+    """
+    Raised at an item boundary to restart the browser.
+    """
+
+
+# Messages of a WebDriverException when the browser or its driver has gone
+SESSION_DEATH_MESSAGES: tuple[str, ...] = ("invalid session id", "session deleted", "no such window", "target window already closed", \
+                                           "chrome not reachable", "browser has closed", "tried to run command without establishing a connection")
+
+def is_session_dead(e: Exception) -> bool:
+    """
+    Tells whether the browser session of e cannot be used any more, e.g. the browser has crashed or the driver is not reachable.
+    A timeout of a wait is not, because it is about the page.
+    """
+    import urllib3
+    if isinstance(e, (InvalidSessionIdException, NoSuchWindowException, ConnectionError, \
+                      urllib3.exceptions.MaxRetryError, urllib3.exceptions.ProtocolError)):
+        return True
+    if isinstance(e, WebDriverException) and not isinstance(e, TimeoutException):
+        message: str = (e.msg or "").lower()
+        return any(death_message in message for death_message in SESSION_DEATH_MESSAGES)
+    return False
+
+
+class Recycler:
+    """
+    Runs download_album or download_home and restarts the browser every recycle_items items, when the browser
+    uses more than recycle_rss_mb, and after the browser session has died.
+
+    The download function reports each finished item with item_done(), and the next browser resumes after
+    the position of the last finished item. The browser profile is kept, so the login session is reused.
+    """
+
+    RSS_CHECK_INTERVAL: int = 10
+
+    def __init__(self, recycle_items: int = 0, recycle_rss_mb: int = 0, max_restarts: int = DEFAULT_MAX_RESTARTS):
+        self.recycle_items = recycle_items
+        self.recycle_rss_mb = recycle_rss_mb
+        self.max_restarts = max_restarts
+        self.position: dict = None
+        self.driver: WebDriver = None
+        self.num_of_items: int = 0
+
+    def start(self, driver: WebDriver):
+        self.driver = driver
+        self.num_of_items = 0
+
+    def get_rss(self) -> int:
+        process = getattr(getattr(self.driver, "service", None), "process", None)
+        return get_process_tree_rss(process.pid) if process else None
+
+    def month_started(self, **position):
+        """
+        Records the start of a month, so that the next browser opens the month again from its first item.
+        """
+        self.position = dict(position, item=-1, date=None, idx=-1)
+
+    def item_done(self, **position):
+        self.position = position
+        self.num_of_items += 1
+        if self.recycle_items and self.num_of_items >= self.recycle_items:
+            raise RecycleBrowser(f"{self.num_of_items} items")
+        if self.recycle_rss_mb and self.num_of_items % self.RSS_CHECK_INTERVAL == 0:
+            rss: int = self.get_rss()
+            if rss and rss > self.recycle_rss_mb * 1024 * 1024:
+                raise RecycleBrowser(f"RSS {rss / 1024 / 1024:.0f} MB")
+
+    def run(self, func, kwargs: dict) -> int:
+        num_of_failures: int = 0
+        while True:
+            position: dict = self.position
+            try:
+                return func(**kwargs)
+            except RecycleBrowser as e:
+                _LOGGER.warning("Restarting the browser after %s at %s", e, self.position)
+            except Exception as e:
+                if not is_session_dead(e):
+                    raise
+                # count only the failures which did not make any progress
+                num_of_failures = 1 if self.position != position else num_of_failures + 1
+                if num_of_failures > self.max_restarts:
+                    raise
+                _LOGGER.error("Restarting the browser (%s/%s) after a failure at %s: %s", num_of_failures, self.max_restarts, self.position, e)
+            kwargs["clear_profile"] = False
+
+
+################################################################################
+# Utilities for storage
+
+STORAGE_SCHEMES: tuple[str, ...] = ("s3",)
+DEFAULT_UPLOAD_WORKERS: int = 4
+MULTIPART_CHUNK_SIZE: int = 8 * 1024 * 1024
+
+def check_boto3():
+    try:
+        import boto3  # noqa: F401
+    except ImportError as e:
+        raise ImportError("--storage s3:// needs boto3. Run: pip install 'wellnote-downloader[s3]'") from e
+
+class LocalStorage:
+    """
+    Keeps the downloaded files in the download dir. The other storages implement the same methods,
+    so that the download loops and the manifest do not know where the files end up.
+    """
+
+    keeps_files: bool = True
+
+    def __init__(self, download_dir: str):
+        self.download_dir: str = download_dir
+
+    def exists(self, filepath: str) -> bool:
+        return os.path.exists(filepath)
+
+    def needs_put(self, filepath: str) -> bool:
+        """
+        Tells whether a file which exists is left in the download dir without being stored, e.g. by a run which stopped before uploading it.
+        """
+        return False
+
+    def put(self, filepath: str, keep_local: bool = False):
+        """
+        Called after a file under the download dir is complete, with its time and manifest entry.
+        """
+
+    def fetch(self, filepath: str):
+        """
+        Brings back a file to append to, e.g. JSON lines of a year.
+        """
+
+    def close(self) -> list[Exception]:
+        return []
+
+class S3Storage(LocalStorage):
+    """
+    Uploads the files to an S3 compatible bucket (AWS S3, MinIO, ...) with multipart uploads on a bounded queue
+    of upload threads, while the browser goes on. The key of a file is its path under the download dir after the prefix of the url.
+    The uploaded files are removed from the download dir unless keep_local.
+
+    exists() lists the keys of a directory once, so a skip check costs no request per file.
+    A file which a stopped run left before uploading it exists too, and the store path of the skipped item uploads it.
+    Files which are appended to, i.e. JSON lines, stay in the download dir and are uploaded as a whole.
+    """
+
+    APPENDED_EXTENSIONS: tuple[str, ...] = ("jsonl",)
+
+    def __init__(self, download_dir: str, url: str, endpoint_url: str = None, keep_local: bool = False, workers: int = DEFAULT_UPLOAD_WORKERS):
+        super().__init__(download_dir)
+        check_boto3()
+        import boto3
+        from boto3.s3.transfer import TransferConfig
+
+        self.bucket, _, prefix = url[len("s3://"):].partition("/")
+        self.prefix: str = prefix.strip("/") + "/" if prefix.strip("/") else ""
+        self.keeps_files = keep_local
+        # AWS_ENDPOINT_URL is read by recent boto3 only
+        self.client = boto3.client("s3", endpoint_url=endpoint_url or os.environ.get("AWS_ENDPOINT_URL"))
+        self.transfer_config = TransferConfig(multipart_threshold=MULTIPART_CHUNK_SIZE, multipart_chunksize=MULTIPART_CHUNK_SIZE, max_concurrency=2)
+        # keys, listed_prefixes and the counters are shared by the upload threads and the post processor thread
+        self.lock: threading.Lock = threading.Lock()
+        self.keys: set[str] = set()
+        self.listed_prefixes: set[str] = set()
+        self.uploader: PostProcessor = PostProcessor(maxsize=workers * 2, workers=workers, name="uploader")
+        self.num_of_uploads: int = 0
+        self.num_of_upload_bytes: int = 0
+        _LOGGER.warning("Uploading to s3://%s/%s", self.bucket, self.prefix)
+
+    def get_key(self, filepath: str) -> str:
+        return self.prefix + os.path.relpath(filepath, self.download_dir).replace(os.sep, "/")
+
+    def list_keys(self, key: str):
+        key_prefix: str = key.rsplit("/", 1)[0] + "/"
+        with self.lock:
+            if key_prefix in self.listed_prefixes:
+                return
+        keys: set[str] = set()
+        paginator = self.client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=key_prefix):
+            keys.update(content["Key"] for content in page.get("Contents", []))
+        with self.lock:
+            self.keys.update(keys)
+            self.listed_prefixes.add(key_prefix)
+
+    def is_uploaded(self, filepath: str) -> bool:
+        key: str = self.get_key(filepath)
+        self.list_keys(key)
+        with self.lock:
+            return key in self.keys
+
+    def exists(self, filepath: str) -> bool:
+        return self.uploader.is_pending(filepath) or self.is_uploaded(filepath) or os.path.exists(filepath)
+
+    def needs_put(self, filepath: str) -> bool:
+        return not self.uploader.is_pending(filepath) and not self.is_uploaded(filepath) and os.path.exists(filepath)
+
+    def put(self, filepath: str, keep_local: bool = False):
+        keep_local = keep_local or self.keeps_files or filepath.split(".")[-1] in self.APPENDED_EXTENSIONS
+        self.uploader.submit(self._upload, filepath, keep_local, pending_path=filepath)
+
+    def _upload(self, filepath: str, keep_local: bool):
+        key: str = self.get_key(filepath)
+        stat: os.stat_result = os.stat(filepath)
+        # S3 sets the time of an object on upload, so the time of the file is kept as metadata
+        self.client.upload_file(filepath, self.bucket, key, Config=self.transfer_config, \
+                                ExtraArgs={"Metadata": {"mtime": str(stat.st_mtime)}})
+        with self.lock:
+            self.keys.add(key)
+            self.num_of_uploads += 1
+            self.num_of_upload_bytes += stat.st_size
+        _LOGGER.info("Uploaded %s to s3://%s/%s", filepath.replace(os.getcwd(), "."), self.bucket, key)
+        if not keep_local:
+            os.remove(filepath)
+
+    def fetch(self, filepath: str):
+        if os.path.exists(filepath) or not self.exists(filepath):
+            return
+        os.makedirs(os.path.dirname(filepath), exist_ok=True)
+        self.client.download_file(self.bucket, self.get_key(filepath), filepath)
+
+    def close(self) -> list[Exception]:
+        errors: list[Exception] = self.uploader.close()
+        _LOGGER.warning("Uploaded %s files (%.1f MB) to s3://%s/%s", self.num_of_uploads, self.num_of_upload_bytes / 1024 ** 2, self.bucket, self.prefix)
+        return errors
+
+def check_storage_options(storage_url: str, archive_format: str, dedup_link: str):
+    """
+    Archive volumes and links are files of the download dir, so they can't be combined with a remote storage.
+    """
+    if storage_url and archive_format:
+        raise ValueError("--storage can't be combined with --archive")
+    if storage_url and dedup_link:
+        raise ValueError("--storage can't be combined with --dedup")
+
+def make_storage(download_dir: str, storage_url: str = None, storage_endpoint: str = None, \
+                 upload_workers: int = DEFAULT_UPLOAD_WORKERS, keep_local: bool = False) -> LocalStorage:
+    if not storage_url:
+        return LocalStorage(download_dir)
+    if storage_url.startswith("s3://"):
+        return S3Storage(download_dir, storage_url, storage_endpoint, keep_local, upload_workers)
+    raise ValueError(f"Storage url must start with one of {[scheme + '://' for scheme in STORAGE_SCHEMES]}: {storage_url}")
+
+
+################################################################################
+# Utilities for manifest
+
+class Manifest:
+    """
+    SQLite database under the download dir which records downloaded items and completed months.
+    Skip checks look up the primary key instead of globbing the download dir.
+
+    source is either "album" or "home".
+    date is YYYY-MM-DD for album and YYYY-MM-DD_HH-MM-SS for home.
+    """
+
+    FILENAME: str = "manifest.sqlite3"
+
+    ALBUM_FILENAME_PATTERN: re.Pattern = re.compile(r"wellnote_(\d{4}-\d{2}-\d{2})_(\d{3})\.(\w+)$")
+    HOME_FILENAME_PATTERN: re.Pattern = re.compile(r"wellnote_home_(\d{4}-\d{2}-\d{2}_\d{2}-\d{2}-\d{2})\.(\w+)$")
+
+    def __init__(self, download_dir: str, storage: LocalStorage = None):
+        self.download_dir = download_dir
+        self.storage: LocalStorage = storage or LocalStorage(download_dir)
+        os.makedirs(os.path.join(download_dir, "wellnote"), exist_ok=True)
+        self.filepath: str = os.path.join(download_dir, "wellnote", self.FILENAME)
+        is_new: bool = not os.path.exists(self.filepath)
+
+        # workers of parallel download share the database, and the post processor thread writes into it
+        self.lock: threading.RLock = threading.RLock()
+        self.connection: sqlite3.Connection = sqlite3.connect(self.filepath, timeout=60, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        with self.connection:
+            self.connection.execute("""CREATE TABLE IF NOT EXISTS items (
+                source TEXT NOT NULL, date TEXT NOT NULL, idx INTEGER NOT NULL,
+                extension TEXT, filepath TEXT NOT NULL, size INTEGER, mtime REAL, data_index INTEGER,
+                PRIMARY KEY (source, date, idx))""")
+            # member and offset locate an item in an archive volume, which is filepath
+            columns: set[str] = {row[1] for row in self.connection.execute("PRAGMA table_info(items)")}
+            if "member" not in columns:
+                self.connection.execute("ALTER TABLE items ADD COLUMN member TEXT")
+                self.connection.execute("ALTER TABLE items ADD COLUMN offset INTEGER")
+            self.connection.execute("""CREATE TABLE IF NOT EXISTS months (
+                source TEXT NOT NULL, year INTEGER NOT NULL, month INTEGER NOT NULL,
+                PRIMARY KEY (source, year, month))""")
+            # linked_to is the file which the file was deduplicated into
+            self.connection.execute("""CREATE TABLE IF NOT EXISTS hashes (
+                filepath TEXT NOT NULL PRIMARY KEY, size INTEGER NOT NULL, mtime REAL NOT NULL, sha256 TEXT NOT NULL, linked_to TEXT)""")
+            self.connection.execute("CREATE INDEX IF NOT EXISTS hashes_sha256 ON hashes (sha256)")
+            # date of the newest item of the last run which synced everything up to the newest item
+            self.connection.execute("""CREATE TABLE IF NOT EXISTS watermarks (
+                source TEXT NOT NULL PRIMARY KEY, date TEXT NOT NULL)""")
+
+        if is_new:
+            self.import_existing_files()
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+    def import_existing_files(self):
+        """
+        Records the files downloaded before the manifest was introduced.
+        """
+        num_of_files: int = 0
+        for source, pattern in (("album", self.ALBUM_FILENAME_PATTERN), ("home", self.HOME_FILENAME_PATTERN)):
+            source_dir: str = os.path.join(self.download_dir, "wellnote", source)
+            if not os.path.isdir(source_dir):
+                continue
+            with os.scandir(source_dir) as year_entries:
+                for year_entry in year_entries:
+                    if not year_entry.is_dir():
+                        continue
+                    with os.scandir(year_entry.path) as entries:
+                        for entry in entries:
+                            match: re.Match = pattern.match(entry.name)
+                            if not match or match.group(match.lastindex) in PARTIAL_EXTENSIONS:
+                                continue
+                            idx: int = int(match.group(2)) if source == "album" else 0
+                            self.add(source, match.group(1), idx, entry.path, commit=False)
+                            num_of_files += 1
+        self.connection.commit()
+        _LOGGER.warning("Imported %s existing files into the manifest %s", num_of_files, self.filepath.replace(os.getcwd(), "."))
+
+    def find(self, source: str, date: str, idx: int = 0) -> str:
+        """
+        Returns the file path of the item, or None if it is not downloaded yet.
+        """
+        with self.lock:
+            row = self.connection.execute("SELECT filepath FROM items WHERE source=? AND date=? AND idx=?", (source, date, idx)).fetchone()
+        if not row:
+            return None
+        filepath: str = os.path.join(self.download_dir, row[0])
+        if not self.storage.exists(filepath):
+            _LOGGER.warning("Forgetting %s because it was deleted", filepath.replace(os.getcwd(), "."))
+            self.forget(source, date, idx)
+            return None
+        return filepath
+
+    def add(self, source: str, date: str, idx: int, filepath: str, data_index: int = None, commit: bool = True, member: ArchiveMember = None):
+        """
+        member is given if the item was appended to the archive volume filepath.
+        """
+        if member:
+            extension: str = member.name.split(".")[-1]
+            size: int = member.size
+            mtime: float = member.mtime
+        else:
+            stat: os.stat_result = os.stat(filepath)
+            extension: str = filepath.split(".")[-1]
+            size: int = stat.st_size
+            mtime: float = stat.st_mtime
+        with self.lock:
+            self.connection.execute("""INSERT OR REPLACE INTO items (source, date, idx, extension, filepath, size, mtime, data_index, member, offset)
+                                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""", \
+                                    (source, date, idx, extension, os.path.relpath(filepath, self.download_dir), size, mtime, data_index, \
+                                     member.name if member else None, member.offset if member else None))
+            if commit:
+                self.connection.commit()
+
+    def locate(self, source: str, date: str, idx: int = 0) -> tuple[str, ArchiveMember]:
+        """
+        Returns the file path of the item and its member if the file path is an archive volume, or (None, None).
+        """
+        with self.lock:
+            row = self.connection.execute("SELECT filepath, member, offset, size, mtime FROM items WHERE source=? AND date=? AND idx=?", \
+                                          (source, date, idx)).fetchone()
+        if not row:
+            return None, None
+        filepath: str = os.path.join(self.download_dir, row[0])
+        return filepath, ArchiveMember(row[1], row[2], row[3], row[4]) if row[1] else None
+
+    def forget(self, source: str, date: str, idx: int = 0):
+        with self.lock, self.connection:
+            self.connection.execute("DELETE FROM items WHERE source=? AND date=? AND idx=?", (source, date, idx))
+
+    def complete_month(self, source: str, year: int, month: int):
+        with self.lock, self.connection:
+            self.connection.execute("INSERT OR IGNORE INTO months VALUES (?, ?, ?)", (source, year, month))
+
+    def reopen_month(self, source: str, year: int, month: int):
+        with self.lock, self.connection:
+            self.connection.execute("DELETE FROM months WHERE source=? AND year=? AND month=?", (source, year, month))
+
+    def list_files(self, source: str) -> list[tuple[str, int, str]]:
+        """
+        Returns date, idx and file path of every recorded item which is a file of its own, i.e. not a member of an archive volume or JSON lines.
+        """
+        with self.lock:
+            rows = self.connection.execute("SELECT date, idx, filepath FROM items WHERE source=? AND member IS NULL ORDER BY date, idx", (source,)).fetchall()
+        return [(date, idx, os.path.join(self.download_dir, relpath)) for date, idx, relpath in rows]
+
+    def is_month_completed(self, source: str, year: int, month: int) -> bool:
+        with self.lock:
+            return self.connection.execute("SELECT 1 FROM months WHERE source=? AND year=? AND month=?", (source, year, month)).fetchone() is not None
+
+    def list_month(self, source: str, year: int, month: int) -> list[tuple[str, int, str]]:
+        """
+        Returns date, idx and file path of the recorded items of the month whose file exists.
+        """
+        with self.lock:
+            rows = self.connection.execute("SELECT date, idx, filepath FROM items WHERE source=? AND date LIKE ? ORDER BY date, idx", \
+                                           (source, f"{year:04}-{month:02}-%")).fetchall()
+        return [(date, idx, os.path.join(self.download_dir, relpath)) for date, idx, relpath in rows \
+                if self.storage.exists(os.path.join(self.download_dir, relpath))]
+
+    def average_size(self, source: str) -> float:
+        with self.lock:
+            return self.connection.execute("SELECT AVG(size) FROM items WHERE source=? AND size IS NOT NULL", (source,)).fetchone()[0]
+
+    def list_dates(self, source: str) -> set[str]:
+        with self.lock:
+            return {row[0] for row in self.connection.execute("SELECT date FROM items WHERE source=?", (source,))}
+
+    def get_watermark(self, source: str) -> str:
+        with self.lock:
+            row = self.connection.execute("SELECT date FROM watermarks WHERE source=?", (source,)).fetchone()
+        return row[0] if row else None
+
+    def advance_watermark(self, source: str, since: str = None, until: str = None) -> str:
+        """
+        Moves the watermark to the newest recorded item before until, after a run synced every item from since up to until with no gaps.
+        since and until are prefixes of dates like "2019-09", and None is the first and the newest item.
+        The watermark stays if since is newer than it, because the items between them may be missing.
+        """
+        watermark: str = self.get_watermark(source)
+        if since and not (watermark and since <= watermark):
+            _LOGGER.warning("Keeping the watermark of %s at %s because this run did not sync the items before %s", source, watermark, since)
+            return watermark
+        with self.lock, self.connection:
+            self.connection.execute("""INSERT INTO watermarks SELECT source, MAX(date) FROM items WHERE source=? AND date < ? GROUP BY source
+                ON CONFLICT (source) DO UPDATE SET date=MAX(date, excluded.date)""", (source, until or "9999"))
+        watermark = self.get_watermark(source)
+        _LOGGER.warning("Advanced the watermark of %s to %s", source, watermark)
+        return watermark
+
+    def get_hash(self, filepath: str, stat: os.stat_result) -> tuple[str, str]:
+        """
+        Returns the cached sha256 and linked_to of the file, or (None, None) if the file was changed after it was hashed.
+        """
+        with self.lock:
+            row = self.connection.execute("SELECT sha256, linked_to FROM hashes WHERE filepath=? AND size=? AND mtime=?", \
+                                          (os.path.relpath(filepath, self.download_dir), stat.st_size, stat.st_mtime)).fetchone()
+        return (row[0], row[1]) if row else (None, None)
+
+    def set_hash(self, filepath: str, sha256: str, linked_to: str = None, commit: bool = True):
+        stat: os.stat_result = os.stat(filepath)
+        relpath_linked_to: str = os.path.relpath(linked_to, self.download_dir) if linked_to else None
+        with self.lock:
+            self.connection.execute("INSERT OR REPLACE INTO hashes VALUES (?, ?, ?, ?, ?)", \
+                                    (os.path.relpath(filepath, self.download_dir), stat.st_size, stat.st_mtime, sha256, relpath_linked_to))
+            if commit:
+                self.connection.commit()
+
+    def find_by_hash(self, sha256: str, size: int, excluded_filepath: str = None) -> str:
+        """
+        Returns an existing file which has the content, or None.
+        """
+        excluded: str = os.path.relpath(excluded_filepath, self.download_dir) if excluded_filepath else None
+        with self.lock:
+            rows = self.connection.execute("SELECT filepath FROM hashes WHERE sha256=? AND size=? ORDER BY filepath", (sha256, size)).fetchall()
+        for (relpath,) in rows:
+            filepath: str = os.path.join(self.download_dir, relpath)
+            if relpath != excluded and os.path.isfile(filepath) and os.path.getsize(filepath) == size:
+                return filepath
+        return None
+
+    def rename(self, old_filepath: str, new_filepath: str):
+        """
+        Points the item of old_filepath to new_filepath, e.g. after the file was re-encoded.
+        """
+        stat: os.stat_result = os.stat(new_filepath)
+        with self.lock, self.connection:
+            self.connection.execute("UPDATE items SET filepath=?, extension=?, size=?, mtime=? WHERE filepath=?", \
+                                    (os.path.relpath(new_filepath, self.download_dir), new_filepath.split(".")[-1], stat.st_size, stat.st_mtime, \
+                                     os.path.relpath(old_filepath, self.download_dir)))
+
+    def commit(self):
+        with self.lock:
+            self.connection.commit()
+
+
+################################################################################
+# Utilities for deduplication
+
+DEDUP_LINK_MODES: tuple[str, ...] = ("reflink", "hardlink")
+DEFAULT_DEDUP_LINK: str = "reflink"
+DEFAULT_HASH_WORKERS: int = 4
+HASH_CHUNK_SIZE: int = 1024 * 1024
+
+# ioctl of Linux which shares the extents of a file on btrfs, xfs, etc.
+FICLONE: int = 0x40049409
+
+def hash_file(filepath: str) -> str:
+    """
+    Returns the sha256 of the file without reading the whole file into memory.
+    """
+    sha256 = hashlib.sha256()
+    with open(filepath, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+def reflink_file(src_filepath: str, dst_filepath: str):
+    """
+    Creates dst_filepath as a copy-on-write clone of src_filepath.
+    Raises OSError if the platform or the file system does not support it.
+    """
+    try:
+        import fcntl
+    except ImportError:
+        raise OSError(f"reflink is not supported on {sys.platform}")
+    with open(src_filepath, "rb") as src, open(dst_filepath, "wb") as dst:
+        fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+
+def replace_with_link(canonical_filepath: str, duplicate_filepath: str, link: str):
+    """
+    Replaces duplicate_filepath with a link to canonical_filepath atomically.
+
+    A reflink keeps the timestamps of duplicate_filepath. A hard link shares the inode,
+    so duplicate_filepath gets the timestamps of canonical_filepath.
+    """
+    tmp_filepath: str = os.path.join(os.path.dirname(duplicate_filepath), "." + os.path.basename(duplicate_filepath) + ".dedup")
+    try:
+        if link == "hardlink":
+            os.link(canonical_filepath, tmp_filepath)
+        else:
+            reflink_file(canonical_filepath, tmp_filepath)
+            shutil.copystat(duplicate_filepath, tmp_filepath)
+        os.replace(tmp_filepath, duplicate_filepath)
+    finally:
+        if os.path.lexists(tmp_filepath):
+            os.remove(tmp_filepath)
+
+def is_same_file(stat1: os.stat_result, stat2: os.stat_result) -> bool:
+    return (stat1.st_dev, stat1.st_ino) == (stat2.st_dev, stat2.st_ino)
+
+
+class Deduplicator:
+    """
+    Links a file into an existing file which has the same content. The hashes are cached in the manifest
+    by (path, size, mtime), so a file is hashed only once unless it is changed.
+    """
+
+    def __init__(self, manifest: Manifest, link: str = DEFAULT_DEDUP_LINK):
+        self.manifest = manifest
+        self.link = link
+        self.num_of_linked_files: int = 0
+        self.num_of_saved_bytes: int = 0
+
+    def hash(self, filepath: str, stat: os.stat_result = None) -> tuple[str, str]:
+        """
+        Returns sha256 and linked_to of the file.
+        """
+        sha256: str; linked_to: str
+        sha256, linked_to = self.manifest.get_hash(filepath, stat or os.stat(filepath))
+        if sha256 is None:
+            sha256 = hash_file(filepath)
+        return sha256, linked_to
+
+    def link_if_duplicate(self, filepath: str, sha256: str = None, canonical_filepath: str = None, commit: bool = True) -> bool:
+        """
+        Returns True if the file was replaced with a link.
+        """
+        stat: os.stat_result = os.stat(filepath)
+        linked_to: str = None
+        if sha256 is None:
+            sha256, linked_to = self.hash(filepath, stat)
+        if canonical_filepath is None:
+            canonical_filepath = self.manifest.find_by_hash(sha256, stat.st_size, filepath)
+
+        if canonical_filepath is None or linked_to == os.path.relpath(canonical_filepath, self.manifest.download_dir) \
+                or is_same_file(stat, os.stat(canonical_filepath)):
+            self.manifest.set_hash(filepath, sha256, linked_to, commit)
+            return False
+
+        try:
+            replace_with_link(canonical_filepath, filepath, self.link)
+        except OSError as e:
+            _LOGGER.warning("Failed to %s %s to %s: %s", self.link, filepath.replace(os.getcwd(), "."), canonical_filepath.replace(os.getcwd(), "."), e)
+            self.manifest.set_hash(filepath, sha256, None, commit)
+            return False
+
+        _LOGGER.info("Linked %s to %s", filepath.replace(os.getcwd(), "."), canonical_filepath.replace(os.getcwd(), "."))
+        self.manifest.set_hash(filepath, sha256, canonical_filepath, commit)
+        self.num_of_linked_files += 1
+        self.num_of_saved_bytes += stat.st_size
+        return True
+
+
+def list_downloaded_files(download_dir: str, partial: bool = False) -> list[str]:
+    """
+    Lists the files in wellnote/album/YYYY and wellnote/home/YYYY, or the partial downloads left there if partial.
+    """
+    filepaths: list[str] = []
+    for source in ("album", "home"):
+        source_dir: str = os.path.join(download_dir, "wellnote", source)
+        if not os.path.isdir(source_dir):
+            continue
+        with os.scandir(source_dir) as year_entries:
+            for year_entry in year_entries:
+                if not year_entry.is_dir():
+                    continue
+                with os.scandir(year_entry.path) as entries:
+                    filepaths.extend(entry.path for entry in entries \
+                                     if entry.name.startswith("wellnote_") and entry.is_file(follow_symlinks=False) \
+                                     and (entry.name.split(".")[-1] in PARTIAL_EXTENSIONS) == partial and not entry.name.endswith(".jsonl"))
+    return sorted(filepaths)
+
+def dedup(download_dir: str = None, link: str = DEFAULT_DEDUP_LINK, hash_workers: int = DEFAULT_HASH_WORKERS, dry_run: bool = False) -> int:
+    """
+    Stores the files of the same content in wellnote/album and wellnote/home once.
+    Only the files whose size is shared with another file are hashed.
+    """
+    download_dir = get_download_dir(download_dir)
+    manifest: Manifest = Manifest(download_dir)
+    deduplicator: Deduplicator = Deduplicator(manifest, link)
+    num_of_duplicates: int = 0
+    num_of_duplicate_bytes: int = 0
+    try:
+        size2filepaths: dict[int, list[str]] = {}
+        for filepath in list_downloaded_files(download_dir):
+            size2filepaths.setdefault(os.path.getsize(filepath), []).append(filepath)
+        candidates: list[str] = [filepath for filepaths in size2filepaths.values() if len(filepaths) > 1 for filepath in filepaths]
+        _LOGGER.warning("Hashing %s of %s files", len(candidates), sum(len(filepaths) for filepaths in size2filepaths.values()))
+
+        # hashlib releases the GIL while hashing large chunks, so threads hash files in parallel
+        filepath2hash: dict[str, tuple[str, str]] = {}
+        with ThreadPoolExecutor(max_workers=max(1, hash_workers)) as executor:
+            for filepath, result in zip(candidates, executor.map(deduplicator.hash, candidates)):
+                filepath2hash[filepath] = result
+
+        key2filepaths: dict[tuple[int, str], list[str]] = {}
+        for filepath in candidates:
+            key2filepaths.setdefault((os.path.getsize(filepath), filepath2hash[filepath][0]), []).append(filepath)
+
+        for (size, sha256), filepaths in key2filepaths.items():
+            # album comes before home, and older years come first
+            canonical_filepath: str = filepaths[0]
+            manifest.set_hash(canonical_filepath, sha256, commit=False)
+            for filepath in filepaths[1:]:
+                linked_to: str = filepath2hash[filepath][1]
+                if linked_to == os.path.relpath(canonical_filepath, download_dir) or is_same_file(os.stat(filepath), os.stat(canonical_filepath)):
+                    manifest.set_hash(filepath, sha256, linked_to, commit=False)
+                elif dry_run:
+                    _LOGGER.warning("%s is a duplicate of %s", filepath.replace(os.getcwd(), "."), canonical_filepath.replace(os.getcwd(), "."))
+                    num_of_duplicates += 1
+                    num_of_duplicate_bytes += size
+                else:
+                    deduplicator.link_if_duplicate(filepath, sha256, canonical_filepath, commit=False)
+            manifest.commit()
+    finally:
+        manifest.close()
+
+    if dry_run:
+        _LOGGER.warning("Found %s duplicates (%.1f MB)", num_of_duplicates, num_of_duplicate_bytes / 1024 / 1024)
+    else:
+        _LOGGER.warning("Linked %s duplicates (%.1f MB saved) with %s", deduplicator.num_of_linked_files, deduplicator.num_of_saved_bytes / 1024 / 1024, link)
+    return 0
+
+
+################################################################################
+# Utilities for audit
+
+REPAIR_FILENAME: str = "repair.json"
+QUARANTINE_DIRNAME: str = "quarantine"
+VIDEO_EXTENSIONS: tuple[str, ...] = ("mp4", "mov", "m4v", "3gp")
+ISO_BMFF_EXTENSIONS: tuple[str, ...] = VIDEO_EXTENSIONS + ("heic", "heif")
+ISO_BMFF_FIRST_BOXES: tuple[bytes, ...] = (b"ftyp", b"wide", b"free", b"skip", b"mdat", b"moov")
+PNG_SIGNATURE: bytes = b"\x89PNG\r\n\x1a\n"
+PNG_IEND_CHUNK: bytes = b"\x00\x00\x00\x00IEND\xaeB`\x82"
+# a few encoders pad the end of a JPEG after the end marker
+JPEG_TAIL_SIZE: int = 4096
+
+def check_iso_bmff(f, size: int, extension: str) -> str:
+    """
+    Walks the top level boxes. A truncated video has a last box which goes past the end of the file.
+    """
+    offset: int = 0
+    box_types: list[bytes] = []
+    while offset < size:
+        f.seek(offset)
+        header: bytes = f.read(16)
+        if len(header) < 8:
+            return f"truncated box header at {offset}"
+        box_size, box_type = struct.unpack(">I4s", header[:8])
+        if box_size == 1:
+            if len(header) < 16:
+                return f"truncated box header at {offset}"
+            box_size = struct.unpack(">Q", header[8:16])[0]
+        elif box_size == 0:
+            box_size = size - offset  # the box extends to the end of the file
+        if box_size < 8:
+            return f"invalid size of box {box_type!r} at {offset}"
+        box_types.append(box_type)
+        offset += box_size
+    if offset > size:
+        return f"truncated, {offset - size} bytes of box {box_types[-1]!r} are missing"
+    if not box_types or box_types[0] not in ISO_BMFF_FIRST_BOXES:
+        return "not an ISO base media file"
+    if extension in VIDEO_EXTENSIONS and b"moov" not in box_types:
+        return "no moov box"
+    return None
+
+def check_header(filepath: str, size: int) -> str:
+    """
+    Returns what is wrong with the file from its header and end, or None if it looks complete.
+    Unknown formats are only checked to be non empty.
+    """
+    if size == 0:
+        return "empty"
+    extension: str = filepath.split(".")[-1].lower()
+    with open(filepath, "rb") as f:
+        head: bytes = f.read(16)
+        if extension in ("jpg", "jpeg"):
+            if not head.startswith(b"\xff\xd8\xff"):
+                return "no JPEG signature"
+            f.seek(max(0, size - JPEG_TAIL_SIZE))
+            if b"\xff\xd9" not in f.read().rstrip(b"\x00"):
+                return "no JPEG end marker"
+        elif extension == "png":
+            if not head.startswith(PNG_SIGNATURE):
+                return "no PNG signature"
+            f.seek(max(0, size - len(PNG_IEND_CHUNK)))
+            if f.read() != PNG_IEND_CHUNK:
+                return "no PNG IEND chunk"
+        elif extension == "gif":
+            if head[:6] not in (b"GIF87a", b"GIF89a"):
+                return "no GIF signature"
+            f.seek(size - 1)
+            if f.read(1) != b"\x3b":
+                return "no GIF trailer"
+        elif extension == "webp":
+            if head[:4] != b"RIFF" or head[8:12] != b"WEBP":
+                return "no WebP signature"
+            riff_size: int = struct.unpack("<I", head[4:8])[0] + 8
+            if riff_size > size:
+                return f"truncated, {riff_size - size} bytes are missing"
+        elif extension in ISO_BMFF_EXTENSIONS:
+            return check_iso_bmff(f, size, extension)
+    return None
+
+def hash_file_mmap(filepath: str, size: int) -> str:
+    """
+    Returns the sha256 of the file by mapping it, which saves the copies of read() for large videos.
+    """
+    sha256 = hashlib.sha256()
+    if size > 0:
+        with open(filepath, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            sha256.update(mapped)
+    return sha256.hexdigest()
+
+def check_file(filepath: str, with_hash: bool) -> tuple[str, str]:
+    """
+    Runs in a worker process of audit. Returns the problem of the file or None, and its sha256 if with_hash.
+    """
+    try:
+        size: int = os.path.getsize(filepath)
+        problem: str = check_header(filepath, size)
+        return problem, hash_file_mmap(filepath, size) if with_hash and not problem else None
+    except OSError as e:
+        return f"unreadable: {e}", None
+
+def parse_downloaded_filename(filepath: str) -> tuple[str, str, int]:
+    """
+    Returns the source, date and idx of a downloaded file name, or None.
+    """
+    name: str = os.path.basename(filepath)
+    match: re.Match = Manifest.HOME_FILENAME_PATTERN.match(name)
+    if match:
+        return "home", match.group(1), 0
+    match = Manifest.ALBUM_FILENAME_PATTERN.match(name)
+    if match:
+        return "album", match.group(1), int(match.group(2))
+    return None
+
+def audit(download_dir: str = None, with_hash: bool = False, workers: int = None, storage_url: str = None, storage_endpoint: str = None) -> int:
+    """
+    Checks the files in wellnote/album and wellnote/home, and writes the broken, missing and partially downloaded items
+    and the gaps of the _NNN index of each day to wellnote/repair.json, which --repair of album and home consumes.
+    With with_hash, the files are hashed and compared with the hashes recorded by the last audit or dedup.
+    With storage_url, the items which are not in the download dir are looked up in the storage, where only their existence is checked.
+    A partial download which has the state of a Range fetch is left to the next run, which continues it.
+    """
+    download_dir = get_download_dir(download_dir)
+    repair_path: str = os.path.join(download_dir, "wellnote", REPAIR_FILENAME)
+    # keep_local, so that the files which a stopped run left in the download dir are not removed while they are checked
+    storage: LocalStorage = make_storage(download_dir, storage_url, storage_endpoint, keep_local=True)
+    manifest: Manifest = Manifest(download_dir, storage)
+    key2entry: dict[tuple[str, str, int], dict] = {}
+
+    def add_entry(source: str, date: str, idx: int, filepath: str, reason: str):
+        if (source, date, idx) in key2entry:
+            return
+        _LOGGER.warning("%s: %s", filepath.replace(os.getcwd(), "."), reason)
+        key2entry[(source, date, idx)] = {"source": source, "date": date, "idx": idx, "filepath": os.path.relpath(filepath, download_dir), "reason": reason}
+
+    try:
+        filepaths: list[str] = list_downloaded_files(download_dir)
+        _LOGGER.warning("Checking %s files%s", len(filepaths), " with hashes" if with_hash else "")
+        healthy_keys: set[tuple[str, str, int]] = set()
+        date2indexes: dict[str, set[int]] = {}
+        num_of_hashed: int = 0
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for filepath, (problem, sha256) in zip(filepaths, executor.map(check_file, filepaths, repeat(with_hash), chunksize=32)):
+                key: tuple[str, str, int] = parse_downloaded_filename(filepath)
+                if not key:
+                    continue
+                if key[0] == "album":
+                    date2indexes.setdefault(key[1], set()).add(key[2])
+                if not problem and sha256:
+                    num_of_hashed += 1
+                    recorded_sha256, _ = manifest.get_hash(filepath, os.stat(filepath))
+                    if recorded_sha256 and recorded_sha256 != sha256:
+                        problem = "content changed since it was hashed"
+                    elif not recorded_sha256:
+                        manifest.set_hash(filepath, sha256, commit=False)
+                if problem:
+                    add_entry(*key, filepath, problem)
+                else:
+                    healthy_keys.add(key)
+        manifest.commit()
+
+        for filepath in list_downloaded_files(download_dir, partial=True):
+            if os.path.exists(filepath + ".json"):
+                _LOGGER.info("%s will be resumed by the next run", filepath.replace(os.getcwd(), "."))
+                continue
+            key = parse_downloaded_filename(filepath)
+            if key and key not in healthy_keys:
+                add_entry(*key, filepath, "partially downloaded")
+
+        num_of_missing: int = 0
+        for source in ("album", "home"):
+            for date, idx, filepath in manifest.list_files(source):
+                if (source, date, idx) in healthy_keys or (source, date, idx) in key2entry:
+                    continue
+                if storage.exists(filepath):
+                    if source == "album":
+                        date2indexes.setdefault(date, set()).add(idx)
+                else:
+                    add_entry(source, date, idx, filepath, "missing")
+                    num_of_missing += 1
+
+        # a day has the files _000 to _NNN, so a hole means a missing item
+        for date, indexes in sorted(date2indexes.items()):
+            for idx in range(max(indexes)):
+                if idx not in indexes:
+                    add_entry("album", date, idx, os.path.join(download_dir, "wellnote", "album", date[0:4], f"wellnote_{date}_{idx:03}"), "gap")
+    finally:
+        manifest.close()
+        storage.close()
+
+    entries: list[dict] = sorted(key2entry.values(), key=lambda entry: (entry["source"], entry["date"], entry["idx"]))
+    if with_hash:
+        _LOGGER.warning("Hashed %s files", num_of_hashed)
+    if not entries:
+        _LOGGER.warning("Found no problem in %s files", len(filepaths))
+        if os.path.exists(repair_path):
+            os.remove(repair_path)
+        return 0
+    with open(repair_path, "w", encoding="utf-8") as f:
+        json.dump({"generated": datetime.now().isoformat(timespec="seconds"), "items": entries}, f, ensure_ascii=False, indent=2)
+    _LOGGER.warning("Found %s items to repair. Run album or home with --repair to download them again. Wrote %s", \
+                    len(entries), repair_path.replace(os.getcwd(), "."))
+    if num_of_missing and not storage_url:
+        _LOGGER.warning("If the missing items were uploaded with --storage, run audit with the same --storage instead of --repair.")
+    return 1
+
+def apply_repair_list(manifest: Manifest, source: str) -> list[tuple[int, int]]:
+    """
+    Moves the broken files of the source in the repair list to wellnote/quarantine, forgets them and reopens their months,
+    so that the download visits the months again and downloads only them. Returns the months to visit.
+    """
+    repair_path: str = os.path.join(manifest.download_dir, "wellnote", REPAIR_FILENAME)
+    if not os.path.exists(repair_path):
+        _LOGGER.warning("%s is not found. Run audit first.", repair_path.replace(os.getcwd(), "."))
+        return []
+    with open(repair_path, encoding="utf-8") as f:
+        repair_list: dict = json.load(f)
+
+    months: set[tuple[int, int]] = set()
+    remaining_entries: list[dict] = []
+    for entry in repair_list["items"]:
+        if entry["source"] != source:
+            remaining_entries.append(entry)
+            continue
+        filepath: str = os.path.join(manifest.download_dir, entry["filepath"])
+        if os.path.exists(filepath + ".json"):
+            pass  # the partial download of a Range fetch continues in the visit of its month
+        elif os.path.isfile(filepath):
+            quarantine_filepath: str = os.path.join(manifest.download_dir, "wellnote", QUARANTINE_DIRNAME, entry["filepath"])
+            os.makedirs(os.path.dirname(quarantine_filepath), exist_ok=True)
+            os.replace(filepath, quarantine_filepath)
+            _LOGGER.info("Moved %s to %s", filepath.replace(os.getcwd(), "."), quarantine_filepath.replace(os.getcwd(), "."))
+        manifest.forget(source, entry["date"], entry["idx"])
+        year, month = int(entry["date"][0:4]), int(entry["date"][5:7])
+        manifest.reopen_month(source, year, month)
+        months.add((year, month))
+
+    if remaining_entries:
+        with open(repair_path, "w", encoding="utf-8") as f:
+            json.dump(dict(repair_list, items=remaining_entries), f, ensure_ascii=False, indent=2)
+    else:
+        os.remove(repair_path)
+    _LOGGER.warning("Repairing %s months of %s", len(months), source)
+    return sorted(months)
+
+
+################################################################################
+# Utilities for screenshot encoding
+
+SCREENSHOT_ENCODINGS: tuple[str, ...] = ("webp", "png")
+
+def check_pillow():
+    try:
+        import PIL  # noqa: F401
+    except ImportError as e:
+        raise ImportError("Encoding screenshots needs Pillow. Run: pip install 'wellnote-downloader[image]'") from e
+
+def encode_screenshot(filepath: str, encoding: str) -> tuple[str, int, int]:
+    """
+    Re-encodes a PNG screenshot to lossless WebP or optimized PNG, keeping its timestamps and permission.
+    The original file is kept if the encoded file is not smaller.
+    Returns the path of the resulting file, the original size and the resulting size.
+
+    Runs in a worker process of ScreenshotEncoder.
+    """
+    from PIL import Image
+
+    original_size: int = os.path.getsize(filepath)
+    encoded_filepath: str = os.path.splitext(filepath)[0] + "." + encoding
+    tmp_filepath: str = os.path.join(os.path.dirname(filepath), "." + os.path.basename(encoded_filepath) + ".part")
+    try:
+        with Image.open(filepath) as image:
+            if encoding == "webp":
+                image.save(tmp_filepath, "WEBP", lossless=True, quality=100, method=4)
+            else:
+                image.save(tmp_filepath, "PNG", optimize=True)
+        encoded_size: int = os.path.getsize(tmp_filepath)
+        if encoded_size >= original_size:
+            return filepath, original_size, original_size
+        shutil.copystat(filepath, tmp_filepath)
+        os.replace(tmp_filepath, encoded_filepath)
+    finally:
+        if os.path.exists(tmp_filepath):
+            os.remove(tmp_filepath)
+    if encoded_filepath != filepath:
+        os.remove(filepath)
+    return encoded_filepath, original_size, encoded_size
+
+
+class ScreenshotEncoder:
+    """
+    Re-encodes screenshots in a process pool, so that neither the browser loop nor the post processor thread
+    is blocked by the CPU bound encoding.
+    """
+
+    def __init__(self, encoding: str, num_of_workers: int = None):
+        check_pillow()
+        self.encoding = encoding
+        # spawn, because forking a process which runs the browser and the post processor thread is unsafe
+        self.executor: ProcessPoolExecutor = ProcessPoolExecutor(max_workers=num_of_workers, mp_context=multiprocessing.get_context("spawn"))
+        self.lock: threading.Lock = threading.Lock()
+        self.num_of_files: int = 0
+        self.num_of_original_bytes: int = 0
+        self.num_of_encoded_bytes: int = 0
+
+    def submit(self, filepath: str) -> Future:
+        return self.executor.submit(encode_screenshot, filepath, self.encoding)
+
+    def result(self, future: Future) -> str:
+        """
+        Waits for the encoding and returns the path of the resulting file.
+        """
+        encoded_filepath: str; original_size: int; encoded_size: int
+        encoded_filepath, original_size, encoded_size = future.result()
+        with self.lock:
+            self.num_of_files += 1
+            self.num_of_original_bytes += original_size
+            self.num_of_encoded_bytes += encoded_size
+        _LOGGER.info("Encoded %s: %s -> %s bytes (%s bytes saved)", encoded_filepath.replace(os.getcwd(), "."), original_size, encoded_size, original_size - encoded_size)
+        return encoded_filepath
+
+    def log_summary(self):
+        saved_bytes: int = self.num_of_original_bytes - self.num_of_encoded_bytes
+        _LOGGER.warning("Encoded %s screenshots to %s: %.1f MB -> %.1f MB (%.1f MB saved, %.0f%%)", self.num_of_files, self.encoding, \
+                        self.num_of_original_bytes / 1024 / 1024, self.num_of_encoded_bytes / 1024 / 1024, saved_bytes / 1024 / 1024, \
+                        100.0 * saved_bytes / self.num_of_original_bytes if self.num_of_original_bytes else 0)
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+
+
+def encode(download_dir: str = None, encoding: str = "webp", workers: int = None, disable_update_time: bool = False) -> int:
+    """
+    Re-encodes the PNG screenshots which have been downloaded into wellnote/home/YYYY.
+    """
+    download_dir = get_download_dir(download_dir)
+    home_dir: str = os.path.join(download_dir, "wellnote", "home")
+    filepaths: list[str] = [filepath for filepath in list_downloaded_files(download_dir) \
+                            if filepath.startswith(home_dir + os.sep) and filepath.endswith(".png")]
+    _LOGGER.warning("Encoding %s screenshots to %s", len(filepaths), encoding)
+
+    manifest: Manifest = Manifest(download_dir)
+    encoder: ScreenshotEncoder = ScreenshotEncoder(encoding, workers)
+    num_of_failures: int = 0
+    try:
+        future2filepath: dict[Future, str] = {encoder.submit(filepath): filepath for filepath in filepaths}
+        for future in as_completed(future2filepath):
+            filepath: str = future2filepath[future]
+            try:
+                encoded_filepath: str = encoder.result(future)
+                original_size: int; encoded_size: int
+                _, original_size, encoded_size = future.result()
+                if encoded_size >= original_size:
+                    continue  # the original file is kept
+                # also for a file rewritten in place, e.g. by --encoding png, whose size and mtime changed
+                manifest.rename(filepath, encoded_filepath)
+                if not disable_update_time:
+                    match: re.Match = Manifest.HOME_FILENAME_PATTERN.match(os.path.basename(encoded_filepath))
+                    disable_update_time_of_file(encoded_filepath, datetime.strptime(match.group(1), "%Y-%m-%d_%H-%M-%S"))
+            except Exception as e:
+                num_of_failures += 1
+                _LOGGER.error("Failed to encode %s: %s", filepath.replace(os.getcwd(), "."), e)
+    finally:
+        encoder.close()
+        manifest.close()
+
+    encoder.log_summary()
+    return 1 if num_of_failures else 0
 
 
 ################################################################################
 # Utilities for Wellnote
+def get_wellnote_url() -> str:
+    """
+    WELLNOTE_URL replaces wellnote.jp, e.g. with the local stand-in site of the benchmarks.
+    """
+    return os.environ.get("WELLNOTE_URL", DEFAULT_WELLNOTE_URL)
+
 def get_email_and_password() -> tuple[str, str]:
 
     email: str = None
@@ -257,17 +2462,176 @@ def get_email_and_password() -> tuple[str, str]:
     return email, password
 
 
+DEFAULT_INCREMENTAL_MARGIN: int = 10
+FIRST_YEAR: int = 2009  # We can't go back to the years before wellnote's inception
+
+def get_month_prefix(year: int, month: int) -> str:
+    """
+    Returns the prefix of the dates of the month, or None for the first month, as since of Manifest.advance_watermark.
+    """
+    return None if (year, month) <= (FIRST_YEAR, 1) else f"{year:04}-{month:02}"
+
+def get_next_month_prefix(year: int, month: int) -> str:
+    """
+    Returns the prefix of the dates of the month after the month, as until of Manifest.advance_watermark.
+    """
+    return f"{year + month // 12:04}-{month % 12 + 1:02}"
+
+def get_album_synced_range(manifest: Manifest, start_year: int, start_month: int, end_year: int, end_month: int) -> tuple[str, str]:
+    """
+    Returns since and until of Manifest.advance_watermark for the album, whose months are synced from the start
+    up to the first month which is not completed, e.g. because the run ended early or it was not in the plan.
+    """
+    for year, month in split_into_month_shards(start_year, start_month, end_year, end_month):
+        if not manifest.is_month_completed("album", year, month):
+            return get_month_prefix(start_year, start_month), f"{year:04}-{month:02}"
+    return get_month_prefix(start_year, start_month), get_next_month_prefix(end_year, end_month)
+
+# Reads every rendered card of the home timeline in one round trip.
+# The home timeline is a virtual list which renders only the cards around the window,
+# and the padding of the container stands for the cards which are not rendered.
+# arguments[0] asks for the content of each post as well, e.g. for --format json
+HOME_SNAPSHOT_SCRIPT: str = """
+var withPosts = arguments[0];
+var container = document.getElementsByClassName('sc-jdhwqr')[0];
+if (!container) {
+    return null;
+}
+function toPost(card) {
+    var author = card.querySelector('[translate="no"]');
+    return {
+        author: author ? author.textContent.trim() : null,
+        text: card.innerText,
+        images: Array.from(card.querySelectorAll('img')).filter(function(img) {
+            return img.currentSrc || img.src;
+        }).map(function(img) {
+            return {src: img.currentSrc || img.src, alt: img.alt || null};
+        }),
+        videos: Array.from(card.querySelectorAll('video, video source')).map(function(video) {
+            return video.currentSrc || video.src;
+        }).filter(function(src) { return src; })
+    };
+}
+var style = window.getComputedStyle(container);
+return {
+    paddingTop: parseFloat(style.paddingTop) || 0,
+    paddingBottom: parseFloat(style.paddingBottom) || 0,
+    cards: Array.from(container.children).map(function(card) {
+        var time = card.querySelector('time');
+        var rect = card.getBoundingClientRect();
+        return {
+            index: parseInt(card.getAttribute('data-index'), 10),
+            datetime: time ? time.getAttribute('datetime') : null,
+            top: rect.top + window.pageYOffset,
+            height: rect.height,
+            attached: card.isConnected,
+            element: card,
+            post: withPosts && time ? toPost(card) : null
+        };
+    })
+};
+"""
+
+LAST_HOME_INDEX_SCRIPT: str = """
+var container = document.getElementsByClassName('sc-jdhwqr')[0];
+var card = container ? container.lastElementChild : null;
+return card ? parseInt(card.getAttribute('data-index'), 10) : -1;
+"""
+
+# Tells whether the home timeline shows its end: the window is at the bottom of the page,
+# the virtual list has no padding for cards which are not rendered, and nothing is loading.
+HOME_LIST_END_SCRIPT: str = """
+var container = document.getElementsByClassName('sc-jdhwqr')[0];
+var card = container ? container.lastElementChild : null;
+var style = container ? window.getComputedStyle(container) : null;
+return {
+    lastIndex: card ? parseInt(card.getAttribute('data-index'), 10) : -1,
+    paddingBottom: style ? parseFloat(style.paddingBottom) || 0 : 0,
+    atBottom: window.innerHeight + window.pageYOffset >= document.documentElement.scrollHeight - 1,
+    loading: !!document.querySelector('[aria-busy="true"], [role="progressbar"]')
+};
+"""
+
+HOME_FORMATS: tuple[str, ...] = ("png", "json", "both")
+DEFAULT_HOME_FORMAT: str = "png"
+
+class JsonLinesWriter:
+    """
+    Appends the posts to wellnote/home/YYYY/wellnote_home_YYYY.jsonl. Each line is recorded in the manifest
+    as a member of the file, so a post is found by one seek like a member of an archive volume.
+    """
+
+    def __init__(self, download_dir: str, storage: LocalStorage = None):
+        self.download_dir: str = download_dir
+        self.storage: LocalStorage = storage or LocalStorage(download_dir)
+        self.year2file: dict[str, object] = {}
+
+    def add(self, year_s: str, datetime_s: str, post: dict) -> tuple[str, ArchiveMember]:
+        filepath: str = os.path.join(self.download_dir, "wellnote", "home", year_s, f"wellnote_home_{year_s}.jsonl")
+        f = self.year2file.get(year_s)
+        if f is None:
+            os.makedirs(os.path.dirname(filepath), exist_ok=True)
+            self.storage.fetch(filepath)
+            f = self.year2file[year_s] = open(filepath, "ab")
+        line: bytes = (json.dumps(post, ensure_ascii=False) + "\n").encode("utf-8")
+        offset: int = f.tell()
+        f.write(line)
+        f.flush()
+        return filepath, ArchiveMember(f"wellnote_home_{datetime_s}.json", offset, len(line), time.time())
+
+    def close(self):
+        for f in self.year2file.values():
+            f.close()
+            self.storage.put(f.name)
+        self.year2file.clear()
+
+def scroll_to(driver: WebDriver, y: float):
+    driver.execute_script("window.scrollTo(0, arguments[0]);", y)
+
+def home_list_grows(last_index: int):
+    """
+    Waits until the home timeline loads the posts after last_index.
+    """
+    def _f(driver):
+        return driver.execute_script(LAST_HOME_INDEX_SCRIPT) > last_index
+
+    return _f
+
+def wait_for_more_home_cards(driver: WebDriver, interval: int, last_index: int) -> bool:
+    """
+    Scrolls to the bottom of the home timeline and waits for the cards after last_index, longer at each try.
+    Returns True when the list grows, and False at its end, i.e. when every try reached the bottom of the page
+    with no padding for unrendered cards and nothing loading. Returns None when the list neither grew nor showed its end,
+    e.g. on a slow page load, so that the caller does not take it for the end.
+    """
+    num_of_ends: int = 0
+    for attempt in range(1, NUM_OF_RETRIES + 1):
+        driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
+        try:
+            WebDriverWait(driver, interval * attempt).until(home_list_grows(last_index))
+            return True
+        except TimeoutException:
+            pass
+        state: dict = driver.execute_script(HOME_LIST_END_SCRIPT)
+        if state["lastIndex"] > last_index:
+            return True
+        if state["atBottom"] and not state["paddingBottom"] and not state["loading"]:
+            num_of_ends += 1
+    return False if num_of_ends == NUM_OF_RETRIES else None
+
 @contextmanager
-def wellnote(driver: WebDriver, wait: WebDriverWait, interval: int, email: str, password: str):
+def wellnote(driver: WebDriver, wait: WebDriverWait, pacer: Pacer, email: str, password: str, metrics: Metrics = None):
     try:
-        _LOGGER.info("Geting wellnote.jp")
-        driver.get("https://wellnote.jp/")
-        time.sleep(interval)
+        start: float = time.monotonic()
+        wellnote_url: str = get_wellnote_url()
+        _LOGGER.info("Geting %s", wellnote_url)
+        driver.get(wellnote_url)
+        pacer.pause()
 
         _, condition_idx = wait.until( \
-            EC_OR(wait._timeout, \
-                EC.element_to_be_clickable([By.XPATH, "//a[@href='/login']"]), \
-                EC.element_to_be_clickable([By.XPATH, "//a[@href='/albums']"]) \
+            any_element_is_clickable( \
+                [By.XPATH, "//a[@href='/login']"], \
+                [By.XPATH, "//a[@href='/albums']"], \
             )
         )
 
@@ -298,130 +2662,321 @@ def wellnote(driver: WebDriver, wait: WebDriverWait, interval: int, email: str,
 
                 _LOGGER.info("Sending the login form")
                 password_form.send_keys(Keys.ENTER)
-                time.sleep(interval)
+                pacer.pause()
 
                 wait.until(EC.staleness_of(password_form))
+
+        if metrics:
+            metrics.add("login", time.monotonic() - start)
         
         yield
 
     finally:
-        driver.quit()
+        quit_driver(driver)
 
 
 def download_home(start_year: int = 2009, start_month: int = 1, \
                    end_year: int = 2023, end_month: int = 12, \
                    interval: int = DEFAULT_INTERVAL, \
-                   download_dir: str = None, browser: str = None, clear_profile:bool=False, disable_update_time=False) -> int:
+                   download_dir: str = None, browser: str = None, clear_profile:bool=False, disable_update_time=False, \
+                   pacing: str = DEFAULT_PACING, headless: bool = False, page_load_strategy: str = DEFAULT_PAGE_LOAD_STRATEGY, \
+                   metrics_path: str = None, dedup_link: str = None, \
+                   encoding: str = None, encode_workers: int = None, \
+                   archive_format: str = None, archive_volume_mb: int = DEFAULT_ARCHIVE_VOLUME_MB, \
+                   incremental: bool = False, incremental_margin: int = DEFAULT_INCREMENTAL_MARGIN, \
+                   recycle_items: int = 0, recycle_rss_mb: int = 0, max_restarts: int = DEFAULT_MAX_RESTARTS, \
+                   home_format: str = DEFAULT_HOME_FORMAT, account: str = None, \
+                   storage_url: str = None, storage_endpoint: str = None, upload_workers: int = DEFAULT_UPLOAD_WORKERS, keep_local: bool = False, \
+                   repair: bool = False, email: str = None, password: str = None, recycler: Recycler = None) -> int:
+    import_selenium()
+
     if interval < DEFAULT_INTERVAL:
         interval = DEFAULT_INTERVAL
-
-    email: str; password: str
-    email, password = get_email_and_password()
+    pacer: Pacer = Pacer(interval, pacing)
+
+    if not (email and password):
+        email, password = get_email_and_password()
+
+    with_png: bool = home_format in ("png", "both")
+    with_json: bool = home_format in ("json", "both")
+    check_storage_options(storage_url, archive_format, dedup_link)
+
+    if repair:
+        manifest: Manifest = Manifest(get_download_dir(download_dir))
+        months: list[tuple[int, int]] = apply_repair_list(manifest, "home")
+        manifest.close()
+        if not months:
+            return 0
+        (start_year, start_month), (end_year, end_month) = months[0], months[-1]
+
+    if recycler is None:
+        recycler = Recycler(recycle_items, recycle_rss_mb, max_restarts)
+        return recycler.run(download_home, dict(start_year=start_year, start_month=start_month, end_year=end_year, end_month=end_month, \
+                                                interval=interval, download_dir=download_dir, browser=browser, clear_profile=clear_profile, \
+                                                disable_update_time=disable_update_time, pacing=pacing, headless=headless, page_load_strategy=page_load_strategy, \
+                                                metrics_path=metrics_path, dedup_link=dedup_link, encoding=encoding, encode_workers=encode_workers, \
+                                                archive_format=archive_format, archive_volume_mb=archive_volume_mb, \
+                                                incremental=incremental, incremental_margin=incremental_margin, home_format=home_format, \
+                                                account=account, storage_url=storage_url, storage_endpoint=storage_endpoint, \
+                                                upload_workers=upload_workers, keep_local=keep_local, \
+                                                email=email, password=password, recycler=recycler))
+    # posts newer than the last finished post of the previous browser are done
+    resume_datetime_s: str = recycler.position["datetime"] if recycler.position else None
+    if resume_datetime_s:
+        _LOGGER.warning("Resuming after %s", resume_datetime_s)
+
+    download_dir = get_download_dir(download_dir)
+    storage: LocalStorage = make_storage(download_dir, storage_url, storage_endpoint, upload_workers, keep_local)
 
     driver: WebDriver; wait: WebDriverWait; timeout_sec: int
-    driver, wait, download_dir, timeout_sec = get_driver_and_wait(download_dir, browser, clear_profile)
+    metrics: Metrics = Metrics(metrics_path, "home")
+    with metrics.phase("browser_start"):
+        driver, wait, download_dir, timeout_sec = get_driver_and_wait(download_dir, browser, clear_profile, headless=headless, page_load_strategy=page_load_strategy, \
+                                                                      account=account)
+    metrics.attach(driver, wait)
+    recycler.start(driver)
+
+    manifest: Manifest = Manifest(download_dir, storage)
+    deduplicator: Deduplicator = Deduplicator(manifest, dedup_link) if dedup_link else None
+    encoder: ScreenshotEncoder = ScreenshotEncoder(encoding, encode_workers) if encoding else None
+    archiver: ArchiveWriter = ArchiveWriter(download_dir, archive_format, archive_volume_mb) if archive_format else None
+    json_writer: JsonLinesWriter = JsonLinesWriter(download_dir, storage) if with_json else None
+    postprocessor: PostProcessor = PostProcessor()
+
+    # The timeline is newest first, so the run stops at the watermark of the last run
+    watermark_source: str = "home" if with_png else "home_json"
+    watermark: str = manifest.get_watermark(watermark_source) if incremental else None
+    if watermark:
+        _LOGGER.warning("Stopping at the watermark %s after %s existing posts", watermark, incremental_margin)
+    num_of_existing_under_watermark: int = 0
+    synced: bool = False
+    synced_since: str = None  # the oldest date which the run synced down to from end_year/end_month
+
+    def store(target_path: str, dt: datetime, datetime_s: str, data_index: int, encoded: Future = None):
+        """
+        Runs on the post processor thread.
+        """
+        if encoded:
+            with metrics.phase("encode"):
+                target_path = encoder.result(encoded)
+        if archiver and datetime_s:
+            with metrics.phase("archive"):
+                volume_path, member = archiver.add("home", target_path, target_path, None if disable_update_time else dt)
+            manifest.add("home", datetime_s, 0, volume_path, data_index, member=member)
+            return
+        if is_archive_volume(target_path):
+            return  # the member has the time already
+        # a skipped file may have been left by a run which stopped before uploading it
+        putting: bool = bool(datetime_s) or storage.needs_put(target_path)
+        if not putting and not storage.keeps_files:
+            return  # the object has been uploaded with the time
+        if not disable_update_time and time_needs_update(target_path, dt):
+            with metrics.phase("update_time"):
+                disable_update_time_of_file(target_path, dt)
+        if datetime_s:
+            manifest.add("home", datetime_s, 0, target_path, data_index)
+        if putting:
+            storage.put(target_path)
+        if deduplicator:
+            with metrics.phase("dedup"):
+                deduplicator.link_if_duplicate(target_path)
+
+    def store_json(year_s: str, datetime_s: str, data_index: int, post: dict):
+        """
+        Runs on the post processor thread, so the lines are appended in the order of the timeline.
+        """
+        with metrics.phase("json"):
+            filepath, member = json_writer.add(year_s, datetime_s, post)
+        manifest.add("home_json", datetime_s, 0, filepath, data_index, member=member)
+
+    # The timeline is newest first, so the progress is how far it went back from the end of the period
+    period_end: datetime = datetime(end_year + end_month // 12, end_month % 12 + 1, 1)
+    period_sec: float = (period_end - datetime(start_year, start_month, 1)).total_seconds()
 
     num_of_download:int = 0
     try:
         _LOGGER.info("Maximizing browser window")
         driver.maximize_window()
-        with wellnote(driver, wait, interval, email, password):
+        with wellnote(driver, wait, pacer, email, password, metrics):
 
             _LOGGER.info("Deleting your family element")
             # <div class="sc-dkQkyq kcvKs"><div translate="no" class="sc-jivBlf fDaukR">あなたの家族</div></div>
             # <div class="sc-fIosxK betDep"><div translate="no" class="sc-gyElHZ eHwBVV">あなたの家族</div></div>
             your_family_elem = driver.find_element(By.CLASS_NAME, 'sc-fIosxK')
             driver.execute_script("var element = arguments[0]; element.parentNode.removeChild(element); ", your_family_elem)
-            time.sleep(interval)
+            pacer.pause()
             
             if True: # already in home tab
 
                 data_indexes_done: set[int] = set()
+                # the post processor may not have recorded them in the manifest yet
+                datetimes_json_submitted: set[str] = set()
 
-                sequence_check_count: int = 0
+                num_of_stalls: int = 0
                 while True:
                     # <section class="sc-dUbtfd sc-hxaKAp bYAYzG jdTirr">
                     # <div class="sc-jdhwqr hWjUjw" style="box-sizing: border-box; padding-top: 0px; padding-bottom: 19548px; margin-top: 0px;">
-                    home_element_parent: WebElement = wait.until(EC.element_to_be_clickable([By.CLASS_NAME, "sc-jdhwqr"]))
-
-                    home_elements: WebElement = home_element_parent.find_elements(By.XPATH, "./div")
-                    _LOGGER.debug("Found %s home elements in display.", len(home_elements))
-
-                    for home_element in home_elements:
-                        
-                        if not is_attached(home_element): # attached
-                            sequence_check_count = 0
+                    wait.until(EC.element_to_be_clickable([By.CLASS_NAME, "sc-jdhwqr"]))
+
+                    with metrics.phase("snapshot"):
+                        snapshot: dict = driver.execute_script(HOME_SNAPSHOT_SCRIPT, with_json) or {"paddingTop": 0, "paddingBottom": 0, "cards": []}
+                    cards: list[dict] = snapshot["cards"]
+                    _LOGGER.debug("Found %s home elements in display. padding-bottom=%s", len(cards), snapshot["paddingBottom"])
+
+                    last_card: dict = None
+                    pending_card: dict = None
+                    for card in cards:
+
+                        data_index: int = card["index"]
+                        if data_index in data_indexes_done:
+                            continue
+
+                        # <time class="sc-hKTqa fqnSS" datetime="2019-11-05T20:05:24+09:00">2019年11月5日</time>
+                        datetime_iso_s: str = card["datetime"]
+                        if not datetime_iso_s:
+                            _LOGGER.debug("data_index=%s is not rendered yet", data_index)
+                            pending_card = card
                             break
+                        _LOGGER.info("Found data_index=%s, with datetime=%s", data_index, datetime_iso_s)
 
-                        data_index: int = int(home_element.get_attribute("data-index"))
+                        datetime_iso_s = datetime_iso_s.split("+")[0] # remove +90:00
+                        dt: datetime = datetime.strptime(datetime_iso_s, "%Y-%m-%dT%H:%M:%S")
+                        if dt.year > end_year or (dt.year == end_year and dt.month > end_month):
+                            _LOGGER.warning("Skipping    %s because it is not in the target period", datetime_iso_s)
+                            data_indexes_done.add(data_index)
+                            last_card = card
+                            continue
+                        if dt.year < start_year or (dt.year == start_year and dt.month < start_month):
+                            _LOGGER.warning("Exiting because we reach the end of the target period: %s", datetime_iso_s)
+                            synced = True
+                            synced_since = get_month_prefix(start_year, start_month)
+                            return 0
+
+                        datetime_s = datetime_iso_s.replace(":", "-")
+                        datetime_s = datetime_s.replace("T", "_")
+                        year_s = datetime_s.split("-")[0] #
+
+                        if resume_datetime_s and datetime_s > resume_datetime_s:
+                            _LOGGER.debug("Skipping    %s because the previous browser finished it", datetime_s)
+                            data_indexes_done.add(data_index)
+                            last_card = card
+                            continue
                         
-                        if data_index not in data_indexes_done:
-                            scroll_to_show_element(driver, home_element)
-                            time.sleep(interval/3.0)
-                            
-                            # <time class="sc-hKTqa fqnSS" datetime="2019-11-05T20:05:24+09:00">2019年11月5日</time>
-                            time_elem: WebElement = home_element.find_element(By.XPATH, ".//time")
-                            datetime_iso_s:str = time_elem.get_attribute("datetime")
-                            _LOGGER.info("Found data_index=%s, with datetime=%s", data_index, datetime_iso_s)
-                            datetime_iso_s = datetime_iso_s.split("+")[0] # remove +90:00
-                            dt: datetime = datetime.strptime(datetime_iso_s, "%Y-%m-%dT%H:%M:%S")
-                            if dt.year > end_year or (dt.year == end_year and dt.month > end_month):
-                                _LOGGER.warning("Skipping    %s because it is not in the target period", datetime_iso_s)
-                                data_indexes_done.add(data_index)
-                                break
-                            if dt.year < start_year or (dt.year == start_year and dt.month < start_month):
-                                _LOGGER.warning("Exiting because we reach the end of the target period: %s", datetime_iso_s)
+                        target_dir: str = os.path.join(download_dir, "wellnote", "home", year_s)
+                        target_path: str = os.path.join(target_dir, f"wellnote_home_{datetime_s}.png")
+                        
+                        existing_path: str = manifest.find("home", datetime_s) if with_png else None
+                        needs_png: bool = with_png and not existing_path
+                        needs_json: bool = with_json and datetime_s not in datetimes_json_submitted and not manifest.find("home_json", datetime_s)
+                        if watermark and datetime_s <= watermark:
+                            num_of_existing_under_watermark = 0 if needs_png or needs_json else num_of_existing_under_watermark + 1
+                            if num_of_existing_under_watermark >= max(1, incremental_margin):
+                                _LOGGER.warning("Exiting because %s posts at or before the watermark %s exist", num_of_existing_under_watermark, watermark)
+                                synced = True
+                                synced_since = watermark
                                 return 0
 
-                            datetime_s = datetime_iso_s.replace(":", "-")
-                            datetime_s = datetime_s.replace("T", "_")
-                            year_s = datetime_s.split("-")[0] #
-                            
-                            target_dir: str = os.path.join(download_dir, "wellnote", "home", year_s)
-                            target_path: str = os.path.join(target_dir, f"wellnote_home_{datetime_s}.png")
-                            
-                            if os.path.exists(target_path):
-                                _LOGGER.warning("Skipping    %s because it exists", target_path.replace(os.getcwd(), "."))
+                        if needs_json:
+                            if not card["post"]:
+                                _LOGGER.debug("data_index=%s is not rendered yet", data_index)
+                                pending_card = card
+                                break
+                            post: dict = dict(datetime=card["datetime"], data_index=data_index, **card["post"])
+                            postprocessor.submit(store_json, year_s, datetime_s, data_index, post)
+                            datetimes_json_submitted.add(datetime_s)
+
+                        if existing_path:
+                            _LOGGER.warning("Skipping    %s because it exists", existing_path.replace(os.getcwd(), "."))
+                            if not disable_update_time or storage.needs_put(existing_path):
+                                postprocessor.submit(store, existing_path, dt, None, data_index)
+                            metrics.item(status="skipped", date=datetime_s, data_index=data_index)
+                        elif not needs_png:
+                            if needs_json:
+                                num_of_download += 1
+                                metrics.item(status="downloaded", date=datetime_s, data_index=data_index)
                             else:
-                                _LOGGER.warning("Downloading %s because it does not exist", target_path.replace(os.getcwd(), "."))
-                                os.makedirs(os.path.join(target_dir), exist_ok=True)
-                                time.sleep(interval * 2)
-                                home_element.screenshot(target_path)
+                                _LOGGER.warning("Skipping    %s because it exists", datetime_s)
+                                metrics.item(status="skipped", date=datetime_s, data_index=data_index)
+                        else:
+                            _LOGGER.warning("Downloading %s because it does not exist", target_path.replace(os.getcwd(), "."))
+                            os.makedirs(os.path.join(target_dir), exist_ok=True)
+                            home_element: WebElement = card["element"]
+                            try:
+                                with metrics.phase("screenshot"):
+                                    scroll_to_show_element(driver, home_element)
+                                    pacer.pause(1/3.0)
+                                    pacer.after(wait, images_are_loaded(home_element), 2)
+                                    home_element.screenshot(target_path)
+                            except StaleElementReferenceException:
+                                _LOGGER.info("data_index=%s has been detached before capturing it. Taking a snapshot again.", data_index)
+                                pending_card = card
+                                break
+                            num_of_download += 1
 
-                            if not disable_update_time:
-                                disable_update_time_of_file(target_path, dt)
+                            postprocessor.submit(store, target_path, dt, datetime_s, data_index, encoder.submit(target_path) if encoder else None)
+                            metrics.item(status="downloaded", date=datetime_s, data_index=data_index)
 
-                            data_indexes_done.add(data_index)
-                            
-                            sequence_check_count = 0
+                        metrics.set_progress((period_end - dt).total_seconds(), period_sec)
+                        data_indexes_done.add(data_index)
+                        last_card = card
+                        recycler.item_done(datetime=datetime_s)
+
+                    if last_card:
+                        num_of_stalls = 0
+                    else:
+                        num_of_stalls += 1
+                        if num_of_stalls > NUM_OF_RETRIES:
+                            _LOGGER.error("Giving up because no card could be captured after %s snapshots", num_of_stalls)
                             break
+                        pacer.pause()
+
+                    if pending_card:
+                        _LOGGER.debug("Scrolling to data_index=%s which is not captured yet", pending_card["index"])
+                        scroll_to(driver, pending_card["top"])
+                    elif cards and snapshot["paddingBottom"] > 0:
+                        # Jump over the rendered cards. The virtual list renders the next cards around the new position.
+                        _LOGGER.debug("Scrolling past data_index=%s", cards[-1]["index"])
+                        scroll_to(driver, cards[-1]["top"] + cards[-1]["height"])
                     else:
-                        sequence_check_count += 1
-                        if sequence_check_count >= NUM_OF_RETRIES:
-                            _LOGGER.info("Found the end of the home element sequence")
+                        # Every card is rendered and captured. Wait for the next page of posts, if any.
+                        last_index: int = cards[-1]["index"] if cards else -1
+                        grows: bool = wait_for_more_home_cards(driver, interval, last_index)
+                        if grows is None:
+                            # not synced, so that an incremental run keeps the watermark
+                            _LOGGER.error("Stopping because the home timeline stopped loading after data_index=%s", last_index)
                             break
-                        time.sleep(interval)
-                    
-                    if home_element:
-                        if not is_attached(home_element): # attached
-                            sequence_check_count = 0
+                        if not grows:
+                            _LOGGER.info("Found the end of the home element sequence at data_index=%s", last_index)
+                            synced = True
                             break
-
-                        elem_height: int = home_element.size['height']
-                        _LOGGER.debug("Scrolling the captured element to see next element with its heights=%s", elem_height)
-                        driver.execute_script(f"window.scrollBy(0, {elem_height / 10});")
                     
 
     finally:
         _LOGGER.warning("Finishing album download. The number of downloaded pictures/movies is %s", num_of_download)
-        driver.quit()
+        quit_driver(driver)
+        errors: list[Exception] = postprocessor.close()
+        for error in errors:
+            _LOGGER.error("Post processing failed: %s", error)
+        if encoder:
+            encoder.close()
+            encoder.log_summary()
+        if archiver:
+            archiver.close()
+        if json_writer:
+            json_writer.close()
+        upload_errors: list[Exception] = storage.close()
+        for error in upload_errors:
+            _LOGGER.error("Upload failed: %s", error)
+        if incremental and synced and not errors and not upload_errors:
+            manifest.advance_watermark(watermark_source, synced_since, get_next_month_prefix(end_year, end_month))
+        manifest.close()
+        metrics.close()
     
     return 0
 
 
 @contextmanager
-def album_tab(driver: WebDriver, wait: WebDriverWait, \
-                   interval: int = DEFAULT_INTERVAL):
+def album_tab(driver: WebDriver, wait: WebDriverWait, pacer: Pacer):
 
     _LOGGER.debug("Waiting until a clickable albums button is available")
     # <a class="sc-jWWnA hivVBT" href="/albums">
@@ -429,184 +2984,862 @@ def album_tab(driver: WebDriver, wait: WebDriverWait, \
 
     _LOGGER.info("Clicking the album button")
     album_button.click()
-    time.sleep(interval)
+    pacer.after(wait, EC.visibility_of_element_located([By.CLASS_NAME, "sc-bvFjSx"]))
 
     yield
 
 def download_album(start_year: int = 2009, start_month: int = 1, \
                    end_year: int = 2023, end_month: int = 12, \
                    interval: int = DEFAULT_INTERVAL, \
-                   download_dir: str = None, browser: str = None, clear_profile=False, disable_update_time=False) -> int:
+                   download_dir: str = None, browser: str = None, clear_profile=False, disable_update_time=False, \
+                   pacing: str = DEFAULT_PACING, resume: bool = False, \
+                   fetch: str = DEFAULT_FETCH, fetch_workers: int = DEFAULT_FETCH_WORKERS, \
+                   headless: bool = False, page_load_strategy: str = DEFAULT_PAGE_LOAD_STRATEGY, \
+                   metrics_path: str = None, dedup_link: str = None, incremental: bool = False, \
+                   archive_format: str = None, archive_volume_mb: int = DEFAULT_ARCHIVE_VOLUME_MB, \
+                   recycle_items: int = 0, recycle_rss_mb: int = 0, max_restarts: int = DEFAULT_MAX_RESTARTS, \
+                   workers: int = 1, worker_id: int = None, plan_path: str = None, account: str = None, \
+                   storage_url: str = None, storage_endpoint: str = None, upload_workers: int = DEFAULT_UPLOAD_WORKERS, keep_local: bool = False, \
+                   repair: bool = False, email: str = None, password: str = None, months: Iterable[tuple[int, int]] = None, \
+                   recycler: Recycler = None) -> int:
+    """
+    Downloads the months from start_year/start_month to end_year/end_month, or the (year, month) of months in their order,
+    with one browser. months may be an iterator which yields the months as they are taken from a queue shared by workers.
+    """
+    import_selenium()
+    check_storage_options(storage_url, archive_format, dedup_link)
+
     if interval < DEFAULT_INTERVAL:
         interval = DEFAULT_INTERVAL
+    pacer: Pacer = Pacer(interval, pacing)
+
+    if not (email and password):
+        email, password = get_email_and_password()
+
+    download_dir = get_download_dir(download_dir)
+
+    manifest: Manifest = Manifest(download_dir)
+    watermark: str = manifest.get_watermark("album") if incremental else None
+    if watermark:
+        # The month of the watermark is opened again because items may have been added to it
+        watermark_year, watermark_month = int(watermark[0:4]), int(watermark[5:7])
+        if (watermark_year, watermark_month) > (start_year, start_month):
+            start_year, start_month = watermark_year, watermark_month
+            _LOGGER.warning("Starting from %04d-%02d because of the watermark %s", start_year, start_month, watermark)
+
+    if repair:
+        months = apply_repair_list(manifest, "album")
+        if not months:
+            manifest.close()
+            return 0
+        # one browser opens only these months, and parallel workers skip the other months between them as completed months
+        (start_year, start_month), (end_year, end_month) = months[0], months[-1]
+        resume = True
+
+    if workers > 1:
+        manifest.close()
+        return download_album_in_parallel(workers, start_year, start_month, end_year, end_month, \
+                                          interval=interval, download_dir=download_dir, browser=browser, clear_profile=clear_profile, \
+                                          disable_update_time=disable_update_time, pacing=pacing, resume=resume, \
+                                          fetch=fetch, fetch_workers=fetch_workers, headless=headless, page_load_strategy=page_load_strategy, \
+                                          metrics_path=metrics_path, dedup_link=dedup_link, incremental=incremental, \
+                                          archive_format=archive_format, archive_volume_mb=archive_volume_mb, \
+                                          recycle_items=recycle_items, recycle_rss_mb=recycle_rss_mb, max_restarts=max_restarts, \
+                                          plan_path=plan_path, account=account, storage_url=storage_url, storage_endpoint=storage_endpoint, \
+                                          upload_workers=upload_workers, keep_local=keep_local, email=email, password=password)
+
+    if recycler is None:
+        if months is None:
+            months = split_into_month_shards(start_year, start_month, end_year, end_month)
+            if plan_path:
+                months = apply_album_plan(months, plan_path)
+            if resume:
+                months = [(year, month) for year, month in months if not manifest.is_month_completed("album", year, month)]
+                if months:
+                    _LOGGER.warning("Resuming from %04d-%02d", *months[0])
+            if not months:
+                _LOGGER.warning("All months have been downloaded already")
+                manifest.close()
+                return 0
+        manifest.close()
+        recycler = Recycler(recycle_items, recycle_rss_mb, max_restarts)
+        # The restarted browsers continue with the months which this iterator has not yielded yet
+        return recycler.run(download_album, dict(months=iter(months), \
+                                                 start_year=start_year, start_month=start_month, end_year=end_year, end_month=end_month, \
+                                                 interval=interval, download_dir=download_dir, browser=browser, clear_profile=clear_profile, \
+                                                 disable_update_time=disable_update_time, pacing=pacing, resume=resume, \
+                                                 fetch=fetch, fetch_workers=fetch_workers, headless=headless, page_load_strategy=page_load_strategy, \
+                                                 metrics_path=metrics_path, dedup_link=dedup_link, incremental=incremental, \
+                                                 archive_format=archive_format, archive_volume_mb=archive_volume_mb, \
+                                                 worker_id=worker_id, account=account, storage_url=storage_url, storage_endpoint=storage_endpoint, \
+                                                 upload_workers=upload_workers, keep_local=keep_local, email=email, password=password, recycler=recycler))
+
+    # The previous browser of the recycler stopped at this position, and the month of it has been taken from months
+    position: dict = recycler.position
+    num_of_months: int = operator.length_hint(months)  # 0 for the months of a queue
+    if position:
+        months = chain([(position["year"], position["month"])], months)
+        num_of_months += 1
+        if position["item"] < 0:
+            _LOGGER.warning("Resuming %04d-%02d", position["year"], position["month"])
+        else:
+            _LOGGER.warning("Resuming after item %s of %04d-%02d", position["item"], position["year"], position["month"])
 
-    email: str; password: str
-    email, password = get_email_and_password()
+    # Each browser downloads into its own staging dir, so workers never see the files of other workers
+    staging_dir: str = make_staging_dir(download_dir, worker_id)
+
+    metrics: Metrics = Metrics(metrics_path, "album", worker_id)
+
+    # the manifest was opened before for the watermark, and the skip checks of this browser go to the storage
+    storage: LocalStorage = make_storage(download_dir, storage_url, storage_endpoint, upload_workers, keep_local)
+    manifest.storage = storage
 
     driver: WebDriver; wait: WebDriverWait; timeout_sec: int
-    driver, wait, download_dir, timeout_sec = get_driver_and_wait(download_dir, browser, clear_profile)
+    with metrics.phase("browser_start"):
+        driver, wait, staging_dir, timeout_sec = get_driver_and_wait(staging_dir, browser, clear_profile, worker_id, headless, page_load_strategy, account)
+    metrics.attach(driver, wait)
+    recycler.start(driver)
+
+    fetcher: HttpFetcher = None
+    deduplicator: Deduplicator = Deduplicator(manifest, dedup_link) if dedup_link else None
+    archiver: ArchiveWriter = ArchiveWriter(download_dir, archive_format, archive_volume_mb, worker_id) if archive_format else None
+    postprocessor: PostProcessor = PostProcessor()
+
+    def store(downloaded_filepath: str, target_filepath: str, date_key: str, idx: int, dt: datetime):
+        """
+        Runs on the post processor thread.
+        """
+        if archiver and date_key:
+            # a fetched file is at target_filepath already
+            with metrics.phase("archive"):
+                volume_path, member = archiver.add("album", downloaded_filepath or target_filepath, target_filepath, None if disable_update_time else dt)
+            manifest.add("album", date_key, idx, volume_path, member=member)
+            return
+        if is_archive_volume(target_filepath):
+            return  # the member has the time already
+        # a skipped file may have been left by a run which stopped before uploading it
+        putting: bool = bool(date_key) or storage.needs_put(target_filepath)
+        if not putting and not storage.keeps_files:
+            return  # the object has been uploaded with the time
+        if downloaded_filepath:
+            with metrics.phase("move"):
+                os.makedirs(os.path.dirname(target_filepath), exist_ok=True)
+                shutil.move(downloaded_filepath, target_filepath)
+        if not disable_update_time and time_needs_update(target_filepath, dt):
+            with metrics.phase("update_time"):
+                disable_update_time_of_file(target_filepath, dt)
+        if date_key:
+            manifest.add("album", date_key, idx, target_filepath)
+        if putting:
+            storage.put(target_filepath)
+        if deduplicator:
+            with metrics.phase("dedup"):
+                deduplicator.link_if_duplicate(target_filepath)
+
+    def complete_month(year: int, month: int, num_of_failures: int):
+        """
+        Runs on the post processor thread after the items of the month, so that the browser does not wait for them.
+        """
+        if postprocessor.num_of_failures == num_of_failures:
+            manifest.complete_month("album", year, month)
+
+    def record_fetched(block: bool = False) -> int:
+        results, num_of_failures = fetcher.completed(block)
+        for (date_key, fetched_idx, dt), fetched_filepath in results:
+            postprocessor.submit(store, None, fetched_filepath, date_key, fetched_idx, dt)
+            metrics.item(status="fetched", date=date_key, idx=fetched_idx)
+        return num_of_failures
 
     num_of_download:int = 0
+    synced: bool = False
     try:
-        with wellnote(driver, wait, interval, email, password):
-
-            with album_tab(driver, wait, interval):
-
-                ## Go to start year
-                year: int = 9999
-                while year >= 2009:  # We can't go back to the years before wellnote's inception
-
-                    _LOGGER.debug("Waiting until a year text is available")
-                    # year = wait.until(EC.visibility_of_element_located([By.XPATH, "//div[contains(text(), '年')]"])) # dont work
-                    year_elem: WebElement = wait.until(EC.visibility_of_element_located([By.CLASS_NAME, "sc-bvFjSx"]))
-                    year = int(year_elem.text.replace("年", ""))
-
-                    if year == start_year:
-                        break
-
-                    move_previous_year_button = None
-                    with inspect_mode(driver, timeout_sec) as wait2:
-                        _LOGGER.debug("Waiting until a clickable previous year button is available")
-                        move_previous_year_button: WebElement = wait2.until(EC.element_to_be_clickable([By.XPATH, "//*[name()='svg' and @class='sc-emDsmM fWHKrl']"]))
-                        # move_previous_year_button: WebElement = wait2.until(EC.element_to_be_clickable([By.CLASS_NAME, "sc-emDsmM"]))
-                    if not move_previous_year_button:
-                        _LOGGER.info("Breaking this year because previous button is not found")
-                        start_month = 1
-                        break
-
-                    _LOGGER.info("Moving previous year of %s ", year)
-                    move_previous_year_button.click()
-                    time.sleep(interval)
-
-                _LOGGER.debug("Found year==%s, start_year==%s, end_year=%s", year, start_year, end_year)
-                ## Iterate over years
-                while year <= end_year:
-
-                    _LOGGER.info("Starting year %s", year)
-
-                    end_month_of_this_year = 12 if year != end_year else end_month
-                    month: int
-                    for month in range(start_month, end_month_of_this_year + 1):
-
-                        # <li class="sc-bttaWv fQmbrI">1</li> # selected
-                        # <li class="sc-bttaWv hEsndb" tabindex="0">1</li> # not selected 
-                        # <li class="sc-bttaWv Bhkiq" disabled="">10</li> # disabled
-                        _LOGGER.debug("Waiting until a clickable %s-th month button is available", month)
-                        month_button: WebElement = wait.until(EC.element_to_be_clickable([By.XPATH, f"//li[text()='{month}']"]))
-                        if "fQmbrI" in month_button.get_attribute("class"):
-                            # selected
-                            _LOGGER.info("Already at month %s", month)
-                        else:
-                            # if month_button.is_displayed() and month_button.is_enabled(): # dont work
-                            if "hEsndb" in month_button.get_attribute("class"):
-                                # note selected
-                                _LOGGER.info("Moving %s-th month", month)
-                                month_button.click()
-                                time.sleep(interval)
-                            else:
-                                _LOGGER.info("Found month %s does not have data", month)
-                                continue
+        with wellnote(driver, wait, pacer, email, password, metrics):
+
+            if fetch in ("http", "videos"):
+                fetcher = HttpFetcher(driver, fetch_workers)
+
+            with album_tab(driver, wait, pacer):
+
+                ## Iterate over months, moving from the year shown to the year of each month
+                year: int = None
+                first_year: int = FIRST_YEAR
+                last_year: int = 9999
+                num_of_months_done: int
+                target_year: int
+                month: int
+                for num_of_months_done, (target_year, month) in enumerate(months):
+
+                    recycler.month_started(year=target_year, month=month)
+                    num_of_failures_before_month: int = postprocessor.num_of_failures
+                    metrics.set_progress(num_of_months_done, num_of_months)
 
-                        _LOGGER.debug("Waiting until a clickable upper left grid item is available")
-                        first_grid_item: WebElement = wait.until(EC.element_to_be_clickable([By.CLASS_NAME, "virtuoso-grid-item"]))
+                    if resume and manifest.is_month_completed("album", target_year, month):
+                        _LOGGER.info("Skipping %04d-%02d because it has been downloaded", target_year, month)
+                        continue
 
-                        _LOGGER.info("Clicking the upper left grid item")
+                    while year != target_year and first_year <= target_year <= last_year:
+
+                        _LOGGER.debug("Waiting until a year text is available")
+                        # year = wait.until(EC.visibility_of_element_located([By.XPATH, "//div[contains(text(), '年')]"])) # dont work
+                        year_elem: WebElement = wait.until(EC.visibility_of_element_located([By.CLASS_NAME, "sc-bvFjSx"]))
+                        year_text: str = year_elem.text
+                        year = int(year_text.replace("年", ""))
+
+                        if year == target_year:
+                            break
+
+                        moving_back: bool = target_year < year
+                        _LOGGER.debug("Probing a clickable %s year button", "previous" if moving_back else "next")
+                        move_year_button: WebElement
+                        move_year_button, _ = probe(driver, [By.XPATH, "//*[name()='svg' and @class='sc-emDsmM fWHKrl']" if moving_back else \
+                                                                       "//*[name()='svg' and @class='sc-emDsmM dRpxwk']"])
+                        if not move_year_button:
+                            _LOGGER.info("Found no %s year of %s", "previous" if moving_back else "next", year)
+                            if moving_back:
+                                first_year = year
+                            else:
+                                last_year = year
+                            break
+
+                        _LOGGER.info("Moving the %s year of %s", "previous" if moving_back else "next", year)
+                        with metrics.phase("year_navigation"):
+                            move_year_button.click()
+                            pacer.after(wait, text_changes([By.CLASS_NAME, "sc-bvFjSx"], year_text))
+
+                    if year != target_year:
+                        _LOGGER.info("Skipping %04d-%02d because the album does not have the year", target_year, month)
+                        continue
+
+                    # <li class="sc-bttaWv fQmbrI">1</li> # selected
+                    # <li class="sc-bttaWv hEsndb" tabindex="0">1</li> # not selected 
+                    # <li class="sc-bttaWv Bhkiq" disabled="">10</li> # disabled
+                    _LOGGER.debug("Waiting until a clickable %s-th month button is available", month)
+                    month_button: WebElement = wait.until(EC.element_to_be_clickable([By.XPATH, f"//li[text()='{month}']"]))
+                    if "fQmbrI" in month_button.get_attribute("class"):
+                        # selected
+                        _LOGGER.info("Already at month %s", month)
+                    else:
+                        # if month_button.is_displayed() and month_button.is_enabled(): # dont work
+                        if "hEsndb" in month_button.get_attribute("class"):
+                            # note selected
+                            _LOGGER.info("Moving %s-th month", month)
+                            with metrics.phase("month_button"):
+                                month_button.click()
+                                pacer.after(wait, EC.presence_of_element_located([By.XPATH, f"//li[text()='{month}' and contains(@class, 'fQmbrI')]"]))
+                        else:
+                            _LOGGER.info("Found month %s does not have data", month)
+                            continue
+
+                    _LOGGER.debug("Waiting until a clickable upper left grid item is available")
+                    first_grid_item: WebElement = wait.until(EC.element_to_be_clickable([By.CLASS_NAME, "virtuoso-grid-item"]))
+
+                    if fetcher:
+                        # the site may have rotated the session cookie during a long run
+                        fetcher.update_session(driver)
+
+                    with metrics.phase("grid_count"):
+                        num_of_grid_items: int = driver.execute_script(GRID_COUNT_SCRIPT)
+                    stored_items: list[tuple[str, int, str]] = manifest.list_month("album", year, month)
+                    if num_of_grid_items and num_of_grid_items == len(stored_items):
+                        _LOGGER.warning("Skipping month %s because all of its %s items exist", month, num_of_grid_items)
+                        for date_key, idx, target_filepath in stored_items:
+                            if not disable_update_time:
+                                dt: datetime = datetime.strptime(date_key, "%Y-%m-%d").replace(hour=12)
+                                postprocessor.submit(store, None, target_filepath, None, idx, dt)
+                            metrics.item(status="skipped", date=date_key, idx=idx)
+                        postprocessor.submit(complete_month, year, month, num_of_failures_before_month)
+                        continue
+                    _LOGGER.debug("Found %s items in the grid and %s items in the manifest", num_of_grid_items, len(stored_items))
+
+                    item: int = 0
+                    idx: int = 0
+                    last_date_s = None
+                    if position and (position["year"], position["month"]) == (year, month):
+                        grid_items: list[WebElement] = driver.find_elements(By.CLASS_NAME, "virtuoso-grid-item")
+                        if position["item"] + 1 < len(grid_items):
+                            # The _NNN index continues from the last finished item of the same day
+                            item, last_date_s, idx = position["item"] + 1, position["date"], position["idx"] + 1
+                            first_grid_item = grid_items[item]
+                        position = None
+
+                    _LOGGER.info("Clicking the grid item %s", item)
+                    with metrics.phase("viewer_open"):
                         first_grid_item.click()
-                        time.sleep(interval)
+                        pacer.after(wait, EC.visibility_of_element_located([By.CLASS_NAME, "sc-hmvnCu"]))
 
-                        idx: int = 0
-                        last_date_s = None
-                        while True:
+                    while True:
 
+                        viewer: dict = driver.execute_script(VIEWER_SNAPSHOT_SCRIPT) if fetcher else {}
+                        media_url: str = viewer.get("src")
+                        date_s: str = viewer.get("date")
+                        if not date_s:
                             _LOGGER.debug("Waiting until a visible date text is available")
                             date_elem: WebElement = wait.until(EC.visibility_of_element_located([By.CLASS_NAME, "sc-hmvnCu"]))
-                            date_s: str = date_elem.text # 2019年9月5日
-                            _LOGGER.info("Found date %s", date_s)
+                            date_s = date_elem.text # 2019年9月5日
+                        _LOGGER.info("Found date %s", date_s)
+
+                        if date_s != last_date_s:
+                            idx = 0
+                            last_date_s = date_s
+
+                        year_i, month_i, day_i = parse_date_str_int(date_s)
+                        dt: datetime = datetime(year=year_i, month=month_i, day=day_i, hour=12, minute=00, second=00, microsecond=0)
+
+                        date_key: str = f"{year_i:04}-{month_i:02}-{day_i:02}"
+                        tareget_basename = f"wellnote_{date_key}_{idx:03}"
+                        target_dir = os.path.join(download_dir, "wellnote", "album", f"{year_i:04}")
+                        target_filepath_woe = os.path.join(target_dir, tareget_basename)
+
+                        # if os.path.exists(target_filepath):
+                        target_filepath: str = manifest.find("album", date_key, idx)
+                        if target_filepath:
+                            _LOGGER.warning("Skipping    %s because it exists", target_filepath_woe.replace(os.getcwd(), "."))
+                            if not disable_update_time or storage.needs_put(target_filepath):
+                                postprocessor.submit(store, None, target_filepath, None, idx, dt)
+                            metrics.item(status="skipped", date=date_key, idx=idx)
+                        elif fetcher and media_url and media_url.startswith("http") and (fetch == "http" or viewer.get("video")):
+                            _LOGGER.warning("Fetching    %s", target_filepath_woe.replace(os.getcwd(), "."))
+                            fetcher.submit(media_url, target_filepath_woe, (date_key, idx, dt))
+                            num_of_download += 1
+                            record_fetched()
+                        else:
+                            _LOGGER.debug("Waiting until a clickable vdots button is available")
+                            vdots_button: WebElement = wait.until(EC.element_to_be_clickable([By.CLASS_NAME, "sc-bGaVxB"]))
+                            _LOGGER.info("Clicking vdots button")
+                            vdots_button.click()
+
+                            _LOGGER.debug("Waiting until a clickable download button is available")
+                            download_button: WebElement = wait.until(EC.element_to_be_clickable([By.CLASS_NAME, "sc-gnnDb"]))
 
-                            if date_s != last_date_s:
-                                idx = 0
-                                last_date_s = date_s
+                            with metrics.phase("download"), safe_download(driver, wait, staging_dir, postprocessor.get_pending_paths) as download_result:
+                                _LOGGER.warning("Downloading %s", target_filepath_woe.replace(os.getcwd(), "."))
+                                _LOGGER.info("Clicking download button")
+                                download_button.click()
+                                num_of_download += 1
+                                pacer.pause()
 
-                            year_i, month_i, day_i = parse_date_str_int(date_s)
+                            downloaded_filepath: str = download_result.downloaded_filepath
 
-                            tareget_basename = f"wellnote_{year_i:04}-{month_i:02}-{day_i:02}_{idx:03}"
-                            target_dir = os.path.join(download_dir, "wellnote", "album", f"{year_i:04}")
-                            target_filepath_woe = os.path.join(target_dir, tareget_basename)
+                            extension: str = downloaded_filepath.split(".")[-1]
+                            target_filepath = target_filepath_woe + "." + extension
 
-                            # if os.path.exists(target_filepath):
-                            if glob.glob(target_filepath_woe + ".*"):
-                                _LOGGER.warning("Skipping    %s because it exists", target_filepath_woe.replace(os.getcwd(), "."))
-                                target_filepath = glob.glob(target_filepath_woe + ".*")[0]
+                            postprocessor.submit(store, downloaded_filepath, target_filepath, date_key, idx, dt, pending_path=downloaded_filepath)
+                            metrics.item(status="downloaded", date=date_key, idx=idx)
+                        
+                        _LOGGER.debug("Probing a clickable next button")
+                        swiper_button_next: WebElement
+                        swiper_button_next, _ = probe(driver, [By.CSS_SELECTOR, ".swiper-button-next:not(.swiper-button-disabled)"])
+                        if not swiper_button_next:
+                            _LOGGER.info("Breaking this month because next button is not found")
+                            if fetcher and record_fetched(block=True):
+                                _LOGGER.error("Some items of month %s could not be fetched. They will be downloaded in the next run.", month)
+                                incremental = False # keep the watermark so that the next run opens this month again
                             else:
-                                _LOGGER.debug("Waiting until a clickable vdots button is available")
-                                vdots_button: WebElement = wait.until(EC.element_to_be_clickable([By.CLASS_NAME, "sc-bGaVxB"]))
-                                _LOGGER.info("Clicking vdots button")
-                                vdots_button.click()
+                                postprocessor.submit(complete_month, year, month, num_of_failures_before_month)
+                            break
 
-                                _LOGGER.debug("Waiting until a clickable download button is available")
-                                download_button: WebElement = wait.until(EC.element_to_be_clickable([By.CLASS_NAME, "sc-gnnDb"]))
+                        recycler.item_done(year=year, month=month, item=item, date=date_s, idx=idx)
 
-                                with safe_download(driver, wait, download_dir) as download_result:
-                                    _LOGGER.warning("Downloading %s", target_filepath_woe.replace(os.getcwd(), "."))
-                                    _LOGGER.info("Clicking download button")
-                                    download_button.click()
-                                    num_of_download += 1
-                                    time.sleep(interval)
+                        _LOGGER.info("Clicking the swiper_button_next")
+                        with metrics.phase("next_item"):
+                            active_slide: WebElement = driver.find_element(By.CLASS_NAME, "swiper-slide-active") if pacer.adaptive else None
+                            swiper_button_next.click()
+                            pacer.after(wait, element_changes([By.CLASS_NAME, "swiper-slide-active"], active_slide), 1/4)
 
-                                downloaded_filepath: str = download_result.downloaded_filepath
+                        item += 1
+                        idx += 1
 
-                                extension: str = downloaded_filepath.split(".")[-1]
-                                target_filepath = target_filepath_woe + "." + extension
+                    _LOGGER.debug("Waiting until a clickable close button is available")
+                    # close_button: WebElement = wait.until(EC.element_to_be_clickable([By.XPATH, "//*[name()='svg' and @class='sc-eldieg ljoTWs']"]))
+                    close_button: WebElement = wait.until(EC.element_to_be_clickable([By.CLASS_NAME, "sc-eldieg"]))
 
-                                os.makedirs(os.path.join(target_dir), exist_ok=True)
-                                shutil.move(downloaded_filepath, target_filepath)
+                    _LOGGER.info("Closing the preview window")
+                    close_button.click()
 
-                            if not disable_update_time:
-                                dt: datetime = datetime(year=year_i, month=month_i, day=day_i, hour=12, minute=00, second=00, microsecond=0)
-                                disable_update_time_of_file(target_filepath, dt)
-                            
-                            swiper_button_next = None
-                            with inspect_mode(driver, timeout_sec) as wait2:
-                                _LOGGER.debug("Waiting until a clickable next button is available")
-                                swiper_button_next: WebElement = wait2.until(EC.element_to_be_clickable([By.CLASS_NAME, "swiper-button-next"]))
-                            if not swiper_button_next \
-                            or "swiper-button-disabled" in swiper_button_next.get_attribute("class"):
-                                _LOGGER.info("Breaking this month because next button is not found")
-                                break
+        synced = True
 
-                            _LOGGER.info("Clicking the swiper_button_next")
-                            swiper_button_next.click()
-                            time.sleep(interval/4)
+    finally:
+        _LOGGER.warning("Finishing album download. The number of downloaded pictures/movies is %s", num_of_download)
+        quit_driver(driver)
+        if fetcher:
+            if record_fetched(block=True):
+                synced = False
+            fetcher.close()
+        errors: list[Exception] = postprocessor.close()
+        for error in errors:
+            _LOGGER.error("Post processing failed: %s", error)
+        if archiver:
+            archiver.close()
+        upload_errors: list[Exception] = storage.close()
+        for error in upload_errors:
+            _LOGGER.error("Upload failed: %s", error)
+        shutil.rmtree(staging_dir, ignore_errors=True)
+        if incremental and synced and not errors and not upload_errors:
+            manifest.advance_watermark("album", *get_album_synced_range(manifest, start_year, start_month, end_year, end_month))
+        manifest.close()
+        metrics.set_progress(num_of_months, num_of_months)
+        metrics.close()
+    return 0
 
-                            idx += 1
 
-                        _LOGGER.debug("Waiting until a clickable close button is available")
-                        # close_button: WebElement = wait2.until(EC.element_to_be_clickable([By.XPATH, "//*[name()='svg' and @class='sc-eldieg ljoTWs']"]))
-                        close_button: WebElement = wait2.until(EC.element_to_be_clickable([By.CLASS_NAME, "sc-eldieg"]))
+################################################################################
+# Utilities for parallel download
 
-                        _LOGGER.info("Closing the preview window")
-                        close_button.click()
+_WORKER_ID: int = None
+_MONTH_QUEUE = None
 
-                    move_next_year_button = None
-                    with inspect_mode(driver, timeout_sec) as wait2:
-                        _LOGGER.debug("Waiting until a clickable next year button is available")
-                        move_next_year_button: WebElement = wait2.until(EC.element_to_be_clickable([By.XPATH, "//*[name()='svg' and @class='sc-emDsmM dRpxwk']"]))
-                        # move_next_year_button: WebElement = wait2.until(EC.element_to_be_clickable([By.CLASS_NAME, "sc-emDsmM"]))
-                    if not move_next_year_button:
-                        _LOGGER.info("Breaking this year because next year button is not found")
-                        break
+def split_into_month_shards(start_year: int, start_month: int, end_year: int, end_month: int) -> list[tuple[int, int]]:
+    """
+    (2019, 11, 2020, 2) -> [(2019, 11), (2019, 12), (2020, 1), (2020, 2)]
+    """
+    shards: list[tuple[int, int]] = []
+    year: int = start_year
+    month: int = start_month
+    while (year, month) <= (end_year, end_month):
+        shards.append((year, month))
+        month += 1
+        if month > 12:
+            year += 1
+            month = 1
+    return shards
+
+def _init_album_worker(worker_id_queue, month_queue, log_level: int):
+    global _WORKER_ID, _MONTH_QUEUE
+    _WORKER_ID = worker_id_queue.get()
+    _MONTH_QUEUE = month_queue
+    logging.basicConfig(stream=sys.stderr, format=LOG_FORMAT, level=logging.WARNING)
+    _LOGGER.setLevel(log_level)
 
-                    _LOGGER.info("Moving the next year of %s ", year)
-                    move_next_year_button.click()
-                    time.sleep(interval)
+def _take_months() -> Iterable[tuple[int, int]]:
+    """
+    Yields the months of the shared queue until it yields None.
+    """
+    for year, month in iter(_MONTH_QUEUE.get, None):
+        _LOGGER.warning("Worker %s starts %04d-%02d", _WORKER_ID, year, month)
+        yield year, month
 
-                    year += 1
-                    start_month = 1
-                
+def _download_album_months(kwargs: dict) -> int:
+    return download_album(months=_take_months(), worker_id=_WORKER_ID, **kwargs)
 
+def download_album_in_parallel(workers: int, start_year: int, start_month: int, end_year: int, end_month: int, clear_profile=False, incremental=False, \
+                               plan_path: str = None, **kwargs) -> int:
+    """
+    Splits the period into month shards and downloads them with a pool of browsers.
+    Each worker logs in once, and takes the next month from a shared queue when it finishes a month.
+    A day never spans two months, so the _NNN index of a file is decided by exactly one worker.
+    With a plan of the catalog subcommand, months without missing items are skipped and the longest months start first.
+    """
+    shards: list[tuple[int, int]] = split_into_month_shards(start_year, start_month, end_year, end_month)
+    if kwargs.get("resume"):
+        manifest: Manifest = Manifest(kwargs["download_dir"])
+        shards = [(year, month) for year, month in shards if not manifest.is_month_completed("album", year, month)]
+        manifest.close()
+    if plan_path:
+        shards = apply_album_plan(shards, plan_path)
+    if not shards:
+        _LOGGER.warning("All months have been downloaded already")
+        return 0
+    workers = min(workers, len(shards))
+    _LOGGER.warning("Downloading %s months with %s workers", len(shards), workers)
+
+    if clear_profile:
+        for worker_id in range(workers):
+            clear_profile_dir(get_profile_dir(kwargs.get("browser") or "chrome", worker_id, kwargs.get("account")))
+
+    worker_id_queue = multiprocessing.Queue()
+    for worker_id in range(workers):
+        worker_id_queue.put(worker_id)
+
+    month_queue = multiprocessing.Queue()
+    for shard in shards:
+        month_queue.put(shard)
+    for _ in range(workers):
+        month_queue.put(None)  # stops a worker
+
+    num_of_failures: int = 0
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_album_worker, \
+                             initargs=(worker_id_queue, month_queue, _LOGGER.getEffectiveLevel())) as executor:
+        futures: list[Future] = [executor.submit(_download_album_months, kwargs) for _ in range(workers)]
+        for future in as_completed(futures):
+            try:
+                future.result()
+            except Exception as e:
+                # the other workers take the months left in the queue
+                num_of_failures += 1
+                _LOGGER.error("A worker failed: %s", e)
+
+    if num_of_failures:
+        _LOGGER.error("%s of %s workers failed. Run again with --resume to download the months which they did not finish.", num_of_failures, workers)
+        return 1
+    if incremental:
+        manifest: Manifest = Manifest(kwargs["download_dir"])
+        manifest.advance_watermark("album", *get_album_synced_range(manifest, start_year, start_month, end_year, end_month))
+        manifest.close()
+    return 0
+
+
+################################################################################
+# Utilities for catalog
+
+# Used when neither the manifest nor a metrics file of past runs tells the cost
+DEFAULT_BYTES_PER_ITEM: dict[str, int] = {"album": 3 * 1024 * 1024, "home": 512 * 1024}
+DEFAULT_SECONDS_PER_ITEM: dict[str, float] = {"album": 4.0, "home": 3.0}
+CATALOG_SOURCES: tuple[str, ...] = ("all", "album", "home")
+
+# Reads the state of every month button in one round trip
+MONTH_BUTTONS_SCRIPT: str = """
+var month2class = {};
+document.querySelectorAll('li').forEach(function(li) {
+    var month = li.textContent.trim();
+    if (/^([1-9]|1[0-2])$/.test(month)) { month2class[month] = li.className; }
+});
+return month2class;
+"""
+
+# Scrolls a virtualized grid to its end and returns the number of items from the last data-index
+GRID_SCROLL_TO_END_SCRIPT: str = """
+var scroller = document.querySelector('[data-test-id="virtuoso-scroller"]');
+if (scroller) { scroller.scrollTop = scroller.scrollHeight; }
+window.scrollTo(0, document.body.scrollHeight);
+"""
+GRID_LAST_INDEX_SCRIPT: str = """
+var items = document.getElementsByClassName('virtuoso-grid-item');
+var last = -1;
+for (var i = 0; i < items.length; i++) {
+    var index = parseInt(items[i].getAttribute('data-index'), 10);
+    last = Math.max(last, isNaN(index) ? i : index);
+}
+return last + 1;
+"""
+
+def load_seconds_per_item(metrics_path: str) -> dict[str, float]:
+    """
+    Returns the seconds per downloaded item of each source measured by --metrics of past runs.
+    The whole elapsed time of a run is charged to its downloaded items, so the estimate errs on the long side.
+    """
+    source2downloads: dict[str, int] = {}
+    source2elapsed_sec: dict[str, float] = {}
+    source2num_of_items: dict[str, int] = {}
+    with open(metrics_path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record: dict = json.loads(line)
+            except ValueError:
+                continue
+            source: str = record.get("source")
+            if record.get("event") == "item" and record.get("status") in ("downloaded", "fetched"):
+                source2num_of_items[source] = source2num_of_items.get(source, 0) + 1
+            elif record.get("event") == "summary" and source2num_of_items.get(source):
+                source2downloads[source] = source2downloads.get(source, 0) + source2num_of_items.pop(source)
+                source2elapsed_sec[source] = source2elapsed_sec.get(source, 0.0) + record.get("elapsed_sec", 0.0)
+    return {source: source2elapsed_sec[source] / num_of_downloads for source, num_of_downloads in source2downloads.items() if num_of_downloads}
+
+def catalog_album(driver: WebDriver, wait: WebDriverWait, pacer: Pacer, start_year: int, start_month: int, end_year: int, end_month: int) -> dict[tuple[int, int], int]:
+    """
+    Returns the number of items of each month from the month buttons and the grid, without opening the viewer.
+    """
+    month2count: dict[tuple[int, int], int] = {}
+    with album_tab(driver, wait, pacer):
+        year_text: str = wait.until(EC.visibility_of_element_located([By.CLASS_NAME, "sc-bvFjSx"])).text
+        year: int = int(year_text.replace("年", ""))
+        while year > start_year:
+            move_previous_year_button: WebElement
+            move_previous_year_button, _ = probe(driver, [By.XPATH, "//*[name()='svg' and @class='sc-emDsmM fWHKrl']"])
+            if not move_previous_year_button:
+                break
+            move_previous_year_button.click()
+            pacer.after(wait, text_changes([By.CLASS_NAME, "sc-bvFjSx"], year_text))
+            year_text = driver.find_element(By.CLASS_NAME, "sc-bvFjSx").text
+            year = int(year_text.replace("年", ""))
+
+        while year <= end_year:
+            month2class: dict[str, str] = driver.execute_script(MONTH_BUTTONS_SCRIPT)
+            first_month: int = start_month if year == start_year else 1
+            last_month: int = end_month if year == end_year else 12
+            for month in range(first_month, last_month + 1):
+                class_s: str = month2class.get(str(month), "")
+                if "fQmbrI" not in class_s and "hEsndb" not in class_s:
+                    month2count[(year, month)] = 0
+                    continue
+                if "fQmbrI" not in class_s:
+                    driver.find_element(By.XPATH, f"//li[text()='{month}']").click()
+                    pacer.after(wait, EC.presence_of_element_located([By.XPATH, f"//li[text()='{month}' and contains(@class, 'fQmbrI')]"]))
+                wait.until(EC.element_to_be_clickable([By.CLASS_NAME, "virtuoso-grid-item"]))
+                count: int = driver.execute_script(GRID_COUNT_SCRIPT)
+                if count is None:
+                    driver.execute_script(GRID_SCROLL_TO_END_SCRIPT)
+                    pacer.pause()
+                    count = driver.execute_script(GRID_LAST_INDEX_SCRIPT)
+                _LOGGER.warning("Found %s items in %04d-%02d", count, year, month)
+                month2count[(year, month)] = count
+
+            move_next_year_button: WebElement
+            move_next_year_button, _ = probe(driver, [By.XPATH, "//*[name()='svg' and @class='sc-emDsmM dRpxwk']"])
+            if not move_next_year_button:
+                break
+            move_next_year_button.click()
+            pacer.after(wait, text_changes([By.CLASS_NAME, "sc-bvFjSx"], year_text))
+            year_text = driver.find_element(By.CLASS_NAME, "sc-bvFjSx").text
+            year = int(year_text.replace("年", ""))
+    return month2count
+
+def catalog_home(driver: WebDriver, wait: WebDriverWait, pacer: Pacer, interval: int, start_year: int, start_month: int, end_year: int, end_month: int) -> list[datetime]:
+    """
+    Returns the datetimes of the posts of the period from the home timeline, without taking screenshots.
+    """
+    period_start: datetime = datetime(start_year, start_month, 1)
+    period_end: datetime = datetime(end_year + end_month // 12, end_month % 12 + 1, 1)
+    index2datetime: dict[int, datetime] = {}
+    num_of_stalls: int = 0
+    while True:
+        wait.until(EC.element_to_be_clickable([By.CLASS_NAME, "sc-jdhwqr"]))
+        snapshot: dict = driver.execute_script(HOME_SNAPSHOT_SCRIPT, False) or {"paddingTop": 0, "paddingBottom": 0, "cards": []}
+        cards: list[dict] = snapshot["cards"]
+        num_of_new_cards: int = 0
+        pending_card: dict = None
+        for card in cards:
+            if card["index"] in index2datetime:
+                continue
+            if not card["datetime"]:
+                pending_card = card
+                break
+            dt: datetime = datetime.strptime(card["datetime"].split("+")[0], "%Y-%m-%dT%H:%M:%S")
+            index2datetime[card["index"]] = dt
+            num_of_new_cards += 1
+            if dt < period_start:
+                _LOGGER.info("Reached the start of the period at %s", dt)
+                return sorted((dt for dt in index2datetime.values() if period_start <= dt < period_end), reverse=True)
+
+        if num_of_new_cards:
+            num_of_stalls = 0
+            _LOGGER.info("Found %s posts", len(index2datetime))
+        else:
+            num_of_stalls += 1
+            if num_of_stalls > NUM_OF_RETRIES:
+                _LOGGER.error("Giving up because no post could be read after %s snapshots", num_of_stalls)
+                break
+            pacer.pause()
+
+        if pending_card:
+            scroll_to(driver, pending_card["top"])
+        elif cards and snapshot["paddingBottom"] > 0:
+            scroll_to(driver, cards[-1]["top"] + cards[-1]["height"])
+        else:
+            last_index: int = cards[-1]["index"] if cards else -1
+            grows: bool = wait_for_more_home_cards(driver, interval, last_index)
+            if grows is None:
+                _LOGGER.error("The home timeline stopped loading after data_index=%s. The posts before it are not counted.", last_index)
+            if not grows:
+                break
+    return sorted((dt for dt in index2datetime.values() if period_start <= dt < period_end), reverse=True)
+
+def make_month_plan(year: int, month: int, num_of_items: int, num_of_downloaded: int, bytes_per_item: float, seconds_per_item: float) -> dict:
+    num_of_missing: int = max(0, num_of_items - num_of_downloaded)
+    return {
+        "year": year, "month": month,
+        "items": num_of_items, "downloaded": num_of_downloaded, "missing": num_of_missing,
+        "estimated_bytes": round(num_of_missing * bytes_per_item),
+        "estimated_sec": round(num_of_missing * seconds_per_item, 1),
+    }
+
+def sum_month_plans(month_plans: list[dict]) -> dict:
+    totals: dict = {key: sum(month_plan[key] for month_plan in month_plans) for key in ("items", "downloaded", "missing", "estimated_bytes", "estimated_sec")}
+    totals["estimated_sec"] = round(totals["estimated_sec"], 1)
+    return totals
+
+def catalog(start_year: int = 2009, start_month: int = 1, \
+            end_year: int = 2023, end_month: int = 12, \
+            source: str = "all", interval: int = DEFAULT_INTERVAL, \
+            download_dir: str = None, browser: str = None, clear_profile: bool = False, \
+            pacing: str = DEFAULT_PACING, headless: bool = False, page_load_strategy: str = DEFAULT_PAGE_LOAD_STRATEGY, \
+            cost_path: str = None, plan_path: str = None) -> int:
+    """
+    Counts the album items and home posts of the period without downloading them, and writes a plan with
+    the number of missing items, estimated bytes and estimated duration of each month as JSON.
+    """
+    import_selenium()
+
+    if interval < DEFAULT_INTERVAL:
+        interval = DEFAULT_INTERVAL
+    pacer: Pacer = Pacer(interval, pacing)
+    email, password = get_email_and_password()
+
+    driver: WebDriver; wait: WebDriverWait; timeout_sec: int
+    driver, wait, download_dir, timeout_sec = get_driver_and_wait(download_dir, browser, clear_profile, headless=headless, page_load_strategy=page_load_strategy)
+    plan_path = plan_path or os.path.join(download_dir, "wellnote", "plan.json")
+
+    seconds_per_item: dict[str, float] = dict(DEFAULT_SECONDS_PER_ITEM)
+    if cost_path:
+        seconds_per_item.update(load_seconds_per_item(cost_path))
+
+    manifest: Manifest = Manifest(download_dir)
+    plan: dict = {
+        "generated": datetime.now().isoformat(timespec="seconds"),
+        "period": {"start": f"{start_year:04}-{start_month:02}", "end": f"{end_year:04}-{end_month:02}"},
+    }
+    try:
+        with wellnote(driver, wait, pacer, email, password):
+            if source in ("all", "home"):
+                bytes_per_item: float = manifest.average_size("home") or DEFAULT_BYTES_PER_ITEM["home"]
+                datetimes: list[datetime] = catalog_home(driver, wait, pacer, interval, start_year, start_month, end_year, end_month)
+                downloaded_dates: set[str] = manifest.list_dates("home")
+                month2datetimes: dict[tuple[int, int], list[str]] = {}
+                for dt in datetimes:
+                    month2datetimes.setdefault((dt.year, dt.month), []).append(dt.strftime("%Y-%m-%d_%H-%M-%S"))
+                month_plans: list[dict] = []
+                for (year, month), datetime_strs in sorted(month2datetimes.items()):
+                    month_plan: dict = make_month_plan(year, month, len(datetime_strs), len(downloaded_dates.intersection(datetime_strs)), \
+                                                       bytes_per_item, seconds_per_item["home"])
+                    month_plan["datetimes"] = datetime_strs
+                    month_plans.append(month_plan)
+                plan["home"] = dict(sum_month_plans(month_plans), bytes_per_item=round(bytes_per_item), seconds_per_item=seconds_per_item["home"], months=month_plans)
+
+            if source in ("all", "album"):
+                bytes_per_item: float = manifest.average_size("album") or DEFAULT_BYTES_PER_ITEM["album"]
+                month2count: dict[tuple[int, int], int] = catalog_album(driver, wait, pacer, start_year, start_month, end_year, end_month)
+                month_plans: list[dict] = [make_month_plan(year, month, count, len(manifest.list_month("album", year, month)), \
+                                                           bytes_per_item, seconds_per_item["album"]) \
+                                           for (year, month), count in sorted(month2count.items())]
+                plan["album"] = dict(sum_month_plans(month_plans), bytes_per_item=round(bytes_per_item), seconds_per_item=seconds_per_item["album"], months=month_plans)
     finally:
-        _LOGGER.warning("Finishing album download. The number of downloaded pictures/movies is %s", num_of_download)
-        driver.quit()
+        quit_driver(driver)
+        manifest.close()
+
+    os.makedirs(os.path.dirname(os.path.abspath(plan_path)), exist_ok=True)
+    tmp_plan_path: str = plan_path + ".tmp"
+    with open(tmp_plan_path, "w", encoding="utf-8") as f:
+        json.dump(plan, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_plan_path, plan_path)
+
+    for plan_source in ("album", "home"):
+        if plan_source in plan:
+            totals: dict = plan[plan_source]
+            _LOGGER.warning("%s: %s items, %s missing, %.1f GB and %.1f hours estimated", plan_source, totals["items"], totals["missing"], \
+                            totals["estimated_bytes"] / 1024 ** 3, totals["estimated_sec"] / 3600)
+    _LOGGER.warning("Wrote the plan to %s", plan_path.replace(os.getcwd(), "."))
+    return 0
+
+def load_album_plan(plan_path: str) -> dict[tuple[int, int], dict]:
+    with open(plan_path, encoding="utf-8") as f:
+        plan: dict = json.load(f)
+    return {(month_plan["year"], month_plan["month"]): month_plan for month_plan in plan.get("album", {}).get("months", [])}
+
+def apply_album_plan(months: list[tuple[int, int]], plan_path: str) -> list[tuple[int, int]]:
+    """
+    Skips the months without missing items in the plan, and orders the others from the longest.
+    """
+    month2plan: dict[tuple[int, int], dict] = load_album_plan(plan_path)
+    months = [month for month in months if month2plan.get(month, {}).get("missing", 1) > 0]
+    # Months missing from the plan are unknown, so they go last
+    months.sort(key=lambda month: -month2plan[month]["estimated_sec"] if month in month2plan else 0)
+    return months
+
+
+################################################################################
+# Utilities for batch
+
+DEFAULT_BATCH_WORKERS: int = 2
+BATCH_SOURCES: tuple[str, ...] = ("all", "album", "home")
+ACCOUNT_NAME_PATTERN: re.Pattern = re.compile(r"[\w.-]+")
+
+def load_accounts(accounts_path: str, download_dir: str) -> list[dict]:
+    """
+    Reads the accounts file, one JSON object per line, e.g.
+        {"name": "grandma", "email": "grandma@example.com", "password_env": "GRANDMA_PASSWORD"}
+    "password" may be given instead of "password_env", and "dir" replaces the default output root download_dir/name.
+    """
+    accounts: list[dict] = []
+    names: set[str] = set()
+    with open(accounts_path, encoding="utf-8") as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            account: dict = json.loads(line)
+            name: str = account.get("name")
+            if not name or not ACCOUNT_NAME_PATTERN.fullmatch(name):
+                raise ValueError(f"{accounts_path} L{line_number}: name must consist of letters, digits, '_', '.' and '-'")
+            if name in names:
+                raise ValueError(f"{accounts_path} L{line_number}: name {name} is duplicated")
+            names.add(name)
+            password: str = account.get("password")
+            if account.get("password_env"):
+                password = os.environ.get(account["password_env"])
+            if not account.get("email") or not password:
+                raise ValueError(f"{accounts_path} L{line_number}: email and password (or password_env) of {name} are required")
+            accounts.append({"name": name, "email": account["email"], "password": password, \
+                             "download_dir": os.path.abspath(account.get("dir") or os.path.join(download_dir, name))})
+    return accounts
+
+def _init_batch_worker(log_level: int):
+    logging.basicConfig(stream=sys.stderr, format=LOG_FORMAT, level=logging.WARNING)
+    _LOGGER.setLevel(log_level)
+
+def _download_account(account: dict, source: str, kwargs: dict) -> dict:
+    """
+    Downloads an account in a worker process. The log lines of the worker are prefixed with the account name.
+    """
+    name: str = account["name"]
+    for handler in logging.getLogger().handlers:
+        handler.setFormatter(logging.Formatter(LOG_FORMAT.replace("%(message)s", f"[{name}] %(message)s")))
+    _LOGGER.warning("Starting %s into %s", source, account["download_dir"].replace(os.getcwd(), "."))
+    start: float = time.monotonic()
+    kwargs = dict(kwargs, download_dir=account["download_dir"], account=name, email=account["email"], password=account["password"])
+    ans: int = 0
+    if source in ("all", "album"):
+        ans |= download_album(**kwargs)
+        kwargs["clear_profile"] = False
+    if source in ("all", "home"):
+        ans |= download_home(**kwargs)
+    return {"status": "ok" if ans == 0 else "failed", "elapsed_sec": round(time.monotonic() - start, 1)}
+
+def batch(accounts_path: str, source: str = "album", \
+          start_year: int = 2009, start_month: int = 1, \
+          end_year: int = 2023, end_month: int = 12, \
+          workers: int = DEFAULT_BATCH_WORKERS, interval: int = DEFAULT_INTERVAL, \
+          download_dir: str = None, browser: str = None, clear_profile: bool = False, disable_update_time: bool = False, \
+          pacing: str = DEFAULT_PACING, headless: bool = False, page_load_strategy: str = DEFAULT_PAGE_LOAD_STRATEGY, \
+          incremental: bool = False, report_path: str = None) -> int:
+    """
+    Downloads the accounts of the accounts file with a bounded pool of worker processes, one browser each.
+    Each account has its own browser profile, which keeps its session for the next run, and its own output root.
+    A failed account is reported and does not stop the others.
+    """
+    download_dir = get_download_dir(download_dir)
+    accounts: list[dict] = load_accounts(accounts_path, download_dir)
+    if not accounts:
+        _LOGGER.warning("No account is found in %s", accounts_path)
+        return 0
+    workers = max(1, min(workers, len(accounts)))
+    _LOGGER.warning("Downloading %s accounts with %s workers", len(accounts), workers)
+
+    kwargs: dict = dict(start_year=start_year, start_month=start_month, end_year=end_year, end_month=end_month, \
+                        interval=interval, browser=browser, clear_profile=clear_profile, disable_update_time=disable_update_time, \
+                        pacing=pacing, headless=headless, page_load_strategy=page_load_strategy, incremental=incremental)
+
+    name2result: dict[str, dict] = {}
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_batch_worker, initargs=(_LOGGER.getEffectiveLevel(),)) as executor:
+        future2name = {executor.submit(_download_account, account, source, kwargs): account["name"] for account in accounts}
+        for future in as_completed(future2name):
+            name: str = future2name[future]
+            try:
+                name2result[name] = future.result()
+            except Exception as e:
+                name2result[name] = {"status": "failed", "error": f"{type(e).__name__}: {e}"}
+            _LOGGER.warning("Finished %s: %s (%s of %s accounts)", name, name2result[name]["status"], len(name2result), len(accounts))
+
+    results: list[dict] = [dict(name=account["name"], download_dir=account["download_dir"], **name2result[account["name"]]) for account in accounts]
+    for result in results:
+        log = _LOGGER.warning if result["status"] == "ok" else _LOGGER.error
+        log("%-20s %-6s %s", result["name"], result["status"], result.get("error") or f"{result['elapsed_sec']}s")
+    if report_path:
+        with open(report_path, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+    num_of_failures: int = len([result for result in results if result["status"] != "ok"])
+    if num_of_failures:
+        _LOGGER.error("%s of %s accounts failed. Run again to resume them.", num_of_failures, len(accounts))
+        return 1
     return 0
 
 
@@ -642,10 +3875,30 @@ def main_cli(*args: list[str]) -> int:
     wellnote_downloader_home_ap.add_argument("--start", dest="start_yearmonth", metavar="YYYY-MM", nargs=None, default=None, required=False, help="Start year month")
     wellnote_downloader_home_ap.add_argument("--end", dest="end_yearmonth", metavar="YYYY-MM", nargs=None, default=None, required=False, help="End year month")
     wellnote_downloader_home_ap.add_argument("--interval", dest="interval", metavar="INT", nargs=None, type=int, default=DEFAULT_INTERVAL, help="Sleep time (sec) before sending next browser event")
+    wellnote_downloader_home_ap.add_argument("--pacing", dest="pacing", metavar="STR", nargs=None, choices=PACING_MODES, default=DEFAULT_PACING, help="Either fixed (sleep interval after each browser event) or adaptive (wait for the page and sleep at most interval).")
     wellnote_downloader_home_ap.add_argument("--dir", dest="download_dir", metavar="DIR", nargs=None, default=None, help="Download directry. Default is ./download")
     wellnote_downloader_home_ap.add_argument("--browser", dest="browser", metavar="STR", nargs=None, default=None, help="Browser to automate. either firefox or chrome. default is firefox.")
+    wellnote_downloader_home_ap.add_argument('--headless', dest="headless", action='store_true', default=False, help="Run the browser without its window.")
+    wellnote_downloader_home_ap.add_argument("--page-load-strategy", dest="page_load_strategy", metavar="STR", nargs=None, choices=PAGE_LOAD_STRATEGIES, default=DEFAULT_PAGE_LOAD_STRATEGY, help="Either normal, eager (do not wait for images) or none.")
     wellnote_downloader_home_ap.add_argument('--clear-profile', dest="clear_profile", action='store_true', default=False, help="Clear the browser profile to reset session, loaded files, etc.")
     wellnote_downloader_home_ap.add_argument('--disable-update-time', dest="disable_update_time", action='store_true', default=False, help="Disable to update birth/modify/access time of file.")
+    wellnote_downloader_home_ap.add_argument("--metrics", dest="metrics_path", metavar="FILE", nargs=None, default=None, help="Append per item metrics to FILE as JSON lines and write a Prometheus textfile next to it.")
+    wellnote_downloader_home_ap.add_argument("--dedup", dest="dedup_link", metavar="STR", nargs=None, choices=DEDUP_LINK_MODES, default=None, help="Replace a downloaded file with a reflink or a hard link to an existing file of the same content. A hard link shares the timestamps of the existing file.")
+    wellnote_downloader_home_ap.add_argument("--format", dest="home_format", metavar="STR", nargs=None, choices=HOME_FORMATS, default=DEFAULT_HOME_FORMAT, help="Either png (screenshot of each post), json (text, author, media urls and time of each post appended to wellnote/home/YYYY/wellnote_home_YYYY.jsonl without screenshots) or both.")
+    wellnote_downloader_home_ap.add_argument("--encode", dest="encoding", metavar="STR", nargs=None, choices=SCREENSHOT_ENCODINGS, default=None, help="Re-encode each screenshot to lossless webp or optimized png in worker processes. Needs Pillow.")
+    wellnote_downloader_home_ap.add_argument("--encode-workers", dest="encode_workers", metavar="INT", nargs=None, type=int, default=None, help="Number of processes of --encode. Default is the number of CPUs.")
+    wellnote_downloader_home_ap.add_argument('--incremental', dest="incremental", action='store_true', default=False, help="Stop at the newest post of the last completed run, and record the newest post of this run.")
+    wellnote_downloader_home_ap.add_argument("--incremental-margin", dest="incremental_margin", metavar="INT", nargs=None, type=int, default=DEFAULT_INCREMENTAL_MARGIN, help="Number of consecutive existing posts at or before the watermark to see before --incremental stops")
+    wellnote_downloader_home_ap.add_argument("--archive", dest="archive_format", metavar="STR", nargs=None, choices=ARCHIVE_FORMATS, default=None, help="Append the downloaded files to per-year tar or zip volumes under wellnote/archive instead of wellnote/home/YYYY.")
+    wellnote_downloader_home_ap.add_argument("--archive-volume-mb", dest="archive_volume_mb", metavar="MB", nargs=None, type=int, default=DEFAULT_ARCHIVE_VOLUME_MB, help="Start the next volume of the year when a volume exceeds MB")
+    wellnote_downloader_home_ap.add_argument("--recycle-items", dest="recycle_items", metavar="INT", nargs=None, type=int, default=0, help="Restart the browser every INT items to keep its memory small. 0 disables it.")
+    wellnote_downloader_home_ap.add_argument("--recycle-rss", dest="recycle_rss_mb", metavar="MB", nargs=None, type=int, default=0, help="Restart the browser when it uses more than MB of memory (Linux only). 0 disables it.")
+    wellnote_downloader_home_ap.add_argument("--max-restarts", dest="max_restarts", metavar="INT", nargs=None, type=int, default=DEFAULT_MAX_RESTARTS, help="Number of browser restarts after the browser session died consecutively at the same item before giving up")
+    wellnote_downloader_home_ap.add_argument('--repair', dest="repair", action='store_true', default=False, help="Download again only the items of the repair list of the audit subcommand. The broken files are moved to wellnote/quarantine.")
+    wellnote_downloader_home_ap.add_argument("--storage", dest="storage_url", metavar="URL", nargs=None, default=None, help="Upload the downloaded files to s3://BUCKET/PREFIX in the background and remove them from the download directry. Needs boto3 and the AWS_* credentials.")
+    wellnote_downloader_home_ap.add_argument("--storage-endpoint", dest="storage_endpoint", metavar="URL", nargs=None, default=None, help="Endpoint of an S3 compatible storage, e.g. http://localhost:9000 of MinIO")
+    wellnote_downloader_home_ap.add_argument("--upload-workers", dest="upload_workers", metavar="INT", nargs=None, type=int, default=DEFAULT_UPLOAD_WORKERS, help="Number of concurrent uploads of --storage")
+    wellnote_downloader_home_ap.add_argument('--keep-local', dest="keep_local", action='store_true', default=False, help="Keep the uploaded files of --storage in the download directry.")
     wellnote_downloader_home_ap.add_argument('--loglevel', dest="log_level", metavar="LEVEL", nargs=None, default=None, help=f"Log level either {_acceptable_levels}.")
     wellnote_downloader_home_ap.set_defaults(handler=download_home)
 
@@ -654,13 +3907,99 @@ def main_cli(*args: list[str]) -> int:
     wellnote_downloader_album_ap.add_argument("--start", dest="start_yearmonth", metavar="YYYY-MM", nargs=None, default=None, required=False, help="Start year month")
     wellnote_downloader_album_ap.add_argument("--end", dest="end_yearmonth", metavar="YYYY-MM", nargs=None, default=None, required=False, help="End year month")
     wellnote_downloader_album_ap.add_argument("--interval", dest="interval", metavar="INT", nargs=None, type=int, default=DEFAULT_INTERVAL, help="Sleep time (sec) before sending next browser event")
+    wellnote_downloader_album_ap.add_argument("--pacing", dest="pacing", metavar="STR", nargs=None, choices=PACING_MODES, default=DEFAULT_PACING, help="Either fixed (sleep interval after each browser event) or adaptive (wait for the page and sleep at most interval).")
     wellnote_downloader_album_ap.add_argument("--dir", dest="download_dir", metavar="DIR", nargs=None, default=None, help="Download directry. Default is ./download")
     wellnote_downloader_album_ap.add_argument("--browser", dest="browser", metavar="STR", nargs=None, default=None, help="Browser to automate. either firefox or chrome. default is firefox.")
+    wellnote_downloader_album_ap.add_argument('--headless', dest="headless", action='store_true', default=False, help="Run the browser without its window.")
+    wellnote_downloader_album_ap.add_argument("--page-load-strategy", dest="page_load_strategy", metavar="STR", nargs=None, choices=PAGE_LOAD_STRATEGIES, default=DEFAULT_PAGE_LOAD_STRATEGY, help="Either normal, eager (do not wait for images) or none.")
     wellnote_downloader_album_ap.add_argument('--clear-profile', dest="clear_profile", action='store_true', default=False, help="Clear the browser profile to reset session, loaded files, etc.")
     wellnote_downloader_album_ap.add_argument('--disable-update-time', dest="disable_update_time", action='store_true', default=False, help="Disable to update birth/modify/access time of file.")
+    wellnote_downloader_album_ap.add_argument('--resume', dest="resume", action='store_true', default=False, help="Skip the months which have been downloaded completely and start from the first incomplete month.")
+    wellnote_downloader_album_ap.add_argument("--fetch", dest="fetch", metavar="STR", nargs=None, choices=FETCH_MODES, default=DEFAULT_FETCH, help="Either browser (click the download button), http (fetch the media url of the viewer with the cookies of the browser in resumable chunks) or videos (http for videos and browser for photos).")
+    wellnote_downloader_album_ap.add_argument("--fetch-workers", dest="fetch_workers", metavar="INT", nargs=None, type=int, default=DEFAULT_FETCH_WORKERS, help="Number of concurrent HTTP downloads of --fetch http")
+    wellnote_downloader_album_ap.add_argument('--incremental', dest="incremental", action='store_true', default=False, help="Start from the month of the newest item of the last completed run, and record the newest item of this run.")
+    wellnote_downloader_album_ap.add_argument("--workers", dest="workers", metavar="INT", nargs=None, type=int, default=1, help="Number of browsers to download months in parallel")
+    wellnote_downloader_album_ap.add_argument("--plan", dest="plan_path", metavar="FILE", nargs=None, default=None, help="Plan of the catalog subcommand. Skips the months without missing items and starts the longest months first.")
+    wellnote_downloader_album_ap.add_argument("--metrics", dest="metrics_path", metavar="FILE", nargs=None, default=None, help="Append per item metrics to FILE as JSON lines and write a Prometheus textfile next to it.")
+    wellnote_downloader_album_ap.add_argument("--dedup", dest="dedup_link", metavar="STR", nargs=None, choices=DEDUP_LINK_MODES, default=None, help="Replace a downloaded file with a reflink or a hard link to an existing file of the same content. A hard link shares the timestamps of the existing file.")
+    wellnote_downloader_album_ap.add_argument("--archive", dest="archive_format", metavar="STR", nargs=None, choices=ARCHIVE_FORMATS, default=None, help="Append the downloaded files to per-year tar or zip volumes under wellnote/archive instead of wellnote/album/YYYY.")
+    wellnote_downloader_album_ap.add_argument("--archive-volume-mb", dest="archive_volume_mb", metavar="MB", nargs=None, type=int, default=DEFAULT_ARCHIVE_VOLUME_MB, help="Start the next volume of the year when a volume exceeds MB")
+    wellnote_downloader_album_ap.add_argument("--recycle-items", dest="recycle_items", metavar="INT", nargs=None, type=int, default=0, help="Restart the browser every INT items to keep its memory small. 0 disables it.")
+    wellnote_downloader_album_ap.add_argument("--recycle-rss", dest="recycle_rss_mb", metavar="MB", nargs=None, type=int, default=0, help="Restart the browser when it uses more than MB of memory (Linux only). 0 disables it.")
+    wellnote_downloader_album_ap.add_argument("--max-restarts", dest="max_restarts", metavar="INT", nargs=None, type=int, default=DEFAULT_MAX_RESTARTS, help="Number of browser restarts after the browser session died consecutively at the same item before giving up")
+    wellnote_downloader_album_ap.add_argument('--repair', dest="repair", action='store_true', default=False, help="Download again only the items of the repair list of the audit subcommand. The broken files are moved to wellnote/quarantine.")
+    wellnote_downloader_album_ap.add_argument("--storage", dest="storage_url", metavar="URL", nargs=None, default=None, help="Upload the downloaded files to s3://BUCKET/PREFIX in the background and remove them from the download directry. Needs boto3 and the AWS_* credentials.")
+    wellnote_downloader_album_ap.add_argument("--storage-endpoint", dest="storage_endpoint", metavar="URL", nargs=None, default=None, help="Endpoint of an S3 compatible storage, e.g. http://localhost:9000 of MinIO")
+    wellnote_downloader_album_ap.add_argument("--upload-workers", dest="upload_workers", metavar="INT", nargs=None, type=int, default=DEFAULT_UPLOAD_WORKERS, help="Number of concurrent uploads of --storage")
+    wellnote_downloader_album_ap.add_argument('--keep-local', dest="keep_local", action='store_true', default=False, help="Keep the uploaded files of --storage in the download directry.")
     wellnote_downloader_album_ap.add_argument('--loglevel', dest="log_level", metavar="LEVEL", nargs=None, default=None, help=f"Log level either {_acceptable_levels}.")
     wellnote_downloader_album_ap.set_defaults(handler=download_album)
 
+    ## "wellnote_downloader dedup" command
+    wellnote_downloader_dedup_ap: ArgumentParser = sub_parsers_action.add_parser("dedup", help="store the downloaded files of the same content once")
+    wellnote_downloader_dedup_ap.add_argument("--dir", dest="download_dir", metavar="DIR", nargs=None, default=None, help="Download directry. Default is ./download")
+    wellnote_downloader_dedup_ap.add_argument("--link", dest="link", metavar="STR", nargs=None, choices=DEDUP_LINK_MODES, default=DEFAULT_DEDUP_LINK, help="Either reflink (copy-on-write clone which keeps the timestamps of each file) or hardlink (the files share the timestamps).")
+    wellnote_downloader_dedup_ap.add_argument("--hash-workers", dest="hash_workers", metavar="INT", nargs=None, type=int, default=DEFAULT_HASH_WORKERS, help="Number of threads to hash files")
+    wellnote_downloader_dedup_ap.add_argument('--dry-run', dest="dry_run", action='store_true', default=False, help="Report the duplicates without linking them.")
+    wellnote_downloader_dedup_ap.add_argument('--loglevel', dest="log_level", metavar="LEVEL", nargs=None, default=None, help=f"Log level either {_acceptable_levels}.")
+    wellnote_downloader_dedup_ap.set_defaults(handler=dedup)
+
+
+    ## "wellnote_downloader encode" command
+    wellnote_downloader_encode_ap: ArgumentParser = sub_parsers_action.add_parser("encode", help="re-encode the downloaded home screenshots")
+    wellnote_downloader_encode_ap.add_argument("--dir", dest="download_dir", metavar="DIR", nargs=None, default=None, help="Download directry. Default is ./download")
+    wellnote_downloader_encode_ap.add_argument("--encoding", dest="encoding", metavar="STR", nargs=None, choices=SCREENSHOT_ENCODINGS, default="webp", help="Either webp (lossless) or png (optimized).")
+    wellnote_downloader_encode_ap.add_argument("--workers", dest="workers", metavar="INT", nargs=None, type=int, default=None, help="Number of processes. Default is the number of CPUs.")
+    wellnote_downloader_encode_ap.add_argument('--disable-update-time', dest="disable_update_time", action='store_true', default=False, help="Disable to update birth/modify/access time of file.")
+    wellnote_downloader_encode_ap.add_argument('--loglevel', dest="log_level", metavar="LEVEL", nargs=None, default=None, help=f"Log level either {_acceptable_levels}.")
+    wellnote_downloader_encode_ap.set_defaults(handler=encode)
+
+    ## "wellnote_downloader catalog" command
+    wellnote_downloader_catalog_ap: ArgumentParser = sub_parsers_action.add_parser("catalog", help="count the items to download and estimate the size and duration")
+    wellnote_downloader_catalog_ap.add_argument("--start", dest="start_yearmonth", metavar="YYYY-MM", nargs=None, default=None, required=False, help="Start year month")
+    wellnote_downloader_catalog_ap.add_argument("--end", dest="end_yearmonth", metavar="YYYY-MM", nargs=None, default=None, required=False, help="End year month")
+    wellnote_downloader_catalog_ap.add_argument("--source", dest="source", metavar="STR", nargs=None, choices=CATALOG_SOURCES, default="all", help="Either all, album or home.")
+    wellnote_downloader_catalog_ap.add_argument("--interval", dest="interval", metavar="INT", nargs=None, type=int, default=DEFAULT_INTERVAL, help="Sleep time (sec) before sending next browser event")
+    wellnote_downloader_catalog_ap.add_argument("--pacing", dest="pacing", metavar="STR", nargs=None, choices=PACING_MODES, default=DEFAULT_PACING, help="Either fixed (sleep interval after each browser event) or adaptive (wait for the page and sleep at most interval).")
+    wellnote_downloader_catalog_ap.add_argument("--dir", dest="download_dir", metavar="DIR", nargs=None, default=None, help="Download directry. Default is ./download")
+    wellnote_downloader_catalog_ap.add_argument("--browser", dest="browser", metavar="STR", nargs=None, default=None, help="Browser to automate. either firefox or chrome. default is firefox.")
+    wellnote_downloader_catalog_ap.add_argument('--headless', dest="headless", action='store_true', default=False, help="Run the browser without its window.")
+    wellnote_downloader_catalog_ap.add_argument("--page-load-strategy", dest="page_load_strategy", metavar="STR", nargs=None, choices=PAGE_LOAD_STRATEGIES, default=DEFAULT_PAGE_LOAD_STRATEGY, help="Either normal, eager (do not wait for images) or none.")
+    wellnote_downloader_catalog_ap.add_argument('--clear-profile', dest="clear_profile", action='store_true', default=False, help="Clear the browser profile to reset session, loaded files, etc.")
+    wellnote_downloader_catalog_ap.add_argument("--cost-from", dest="cost_path", metavar="FILE", nargs=None, default=None, help="--metrics file of past runs to estimate the seconds per item")
+    wellnote_downloader_catalog_ap.add_argument("--plan", dest="plan_path", metavar="FILE", nargs=None, default=None, help="Write the plan as JSON to FILE. Default is wellnote/plan.json in the download directry.")
+    wellnote_downloader_catalog_ap.add_argument('--loglevel', dest="log_level", metavar="LEVEL", nargs=None, default=None, help=f"Log level either {_acceptable_levels}.")
+    wellnote_downloader_catalog_ap.set_defaults(handler=catalog)
+
+    ## "wellnote_downloader batch" command
+    wellnote_downloader_batch_ap: ArgumentParser = sub_parsers_action.add_parser("batch", help="download several accounts in parallel")
+    wellnote_downloader_batch_ap.add_argument("--accounts", dest="accounts_path", metavar="FILE", nargs=None, required=True, help="JSON lines of accounts, e.g. {\"name\": \"grandma\", \"email\": \"...\", \"password_env\": \"GRANDMA_PASSWORD\", \"dir\": \"...\"}")
+    wellnote_downloader_batch_ap.add_argument("--source", dest="source", metavar="STR", nargs=None, choices=BATCH_SOURCES, default="album", help="Either all, album or home.")
+    wellnote_downloader_batch_ap.add_argument("--start", dest="start_yearmonth", metavar="YYYY-MM", nargs=None, default=None, required=False, help="Start year month")
+    wellnote_downloader_batch_ap.add_argument("--end", dest="end_yearmonth", metavar="YYYY-MM", nargs=None, default=None, required=False, help="End year month")
+    wellnote_downloader_batch_ap.add_argument("--workers", dest="workers", metavar="INT", nargs=None, type=int, default=DEFAULT_BATCH_WORKERS, help="Number of browsers to download accounts in parallel")
+    wellnote_downloader_batch_ap.add_argument("--interval", dest="interval", metavar="INT", nargs=None, type=int, default=DEFAULT_INTERVAL, help="Sleep time (sec) before sending next browser event")
+    wellnote_downloader_batch_ap.add_argument("--pacing", dest="pacing", metavar="STR", nargs=None, choices=PACING_MODES, default=DEFAULT_PACING, help="Either fixed (sleep interval after each browser event) or adaptive (wait for the page and sleep at most interval).")
+    wellnote_downloader_batch_ap.add_argument("--dir", dest="download_dir", metavar="DIR", nargs=None, default=None, help="Download directry. Each account downloads into DIR/name unless its dir is given. Default is ./download")
+    wellnote_downloader_batch_ap.add_argument("--browser", dest="browser", metavar="STR", nargs=None, default=None, help="Browser to automate. either firefox or chrome. default is firefox.")
+    wellnote_downloader_batch_ap.add_argument('--headless', dest="headless", action='store_true', default=False, help="Run the browser without its window.")
+    wellnote_downloader_batch_ap.add_argument("--page-load-strategy", dest="page_load_strategy", metavar="STR", nargs=None, choices=PAGE_LOAD_STRATEGIES, default=DEFAULT_PAGE_LOAD_STRATEGY, help="Either normal, eager (do not wait for images) or none.")
+    wellnote_downloader_batch_ap.add_argument('--clear-profile', dest="clear_profile", action='store_true', default=False, help="Clear the browser profiles of the accounts to reset session, loaded files, etc.")
+    wellnote_downloader_batch_ap.add_argument('--disable-update-time', dest="disable_update_time", action='store_true', default=False, help="Disable to update birth/modify/access time of file.")
+    wellnote_downloader_batch_ap.add_argument('--incremental', dest="incremental", action='store_true', default=False, help="--incremental of album and home for each account")
+    wellnote_downloader_batch_ap.add_argument("--report", dest="report_path", metavar="FILE", nargs=None, default=None, help="Write the result of each account as JSON to FILE")
+    wellnote_downloader_batch_ap.add_argument('--loglevel', dest="log_level", metavar="LEVEL", nargs=None, default=None, help=f"Log level either {_acceptable_levels}.")
+    wellnote_downloader_batch_ap.set_defaults(handler=batch)
+
+    ## "wellnote_downloader audit" command
+    wellnote_downloader_audit_ap: ArgumentParser = sub_parsers_action.add_parser("audit", help="check the downloaded files and list the items to download again")
+    wellnote_downloader_audit_ap.add_argument("--dir", dest="download_dir", metavar="DIR", nargs=None, default=None, help="Download directry. Default is ./download")
+    wellnote_downloader_audit_ap.add_argument('--hash', dest="with_hash", action='store_true', default=False, help="Hash every file and compare it with the hash of the last audit or dedup to find changed contents.")
+    wellnote_downloader_audit_ap.add_argument("--workers", dest="workers", metavar="INT", nargs=None, type=int, default=None, help="Number of processes to check files. Default is the number of CPUs.")
+    wellnote_downloader_audit_ap.add_argument("--storage", dest="storage_url", metavar="URL", nargs=None, default=None, help="Look up the items which are not in the download directry in s3://BUCKET/PREFIX of --storage of album and home.")
+    wellnote_downloader_audit_ap.add_argument("--storage-endpoint", dest="storage_endpoint", metavar="URL", nargs=None, default=None, help="Endpoint of an S3 compatible storage, e.g. http://localhost:9000 of MinIO")
+    wellnote_downloader_audit_ap.add_argument('--loglevel', dest="log_level", metavar="LEVEL", nargs=None, default=None, help=f"Log level either {_acceptable_levels}.")
+    wellnote_downloader_audit_ap.set_defaults(handler=audit)
 
     arg_ns: Namespace = wellnote_downloader_ap.parse_args(args)
     key2value = vars(arg_ns)
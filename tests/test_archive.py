@@ -0,0 +1,196 @@
+import json
+import os
+import shutil
+import sqlite3
+import tarfile
+import zipfile
+from datetime import datetime
+
+import pytest
+
+from wellnote_downloader import ArchiveMember, ArchiveWriter, Manifest, get_tar_member_end, read_archive_index, read_archive_member, repair_tar_volume, repair_zip_volume
+
+
+def write_downloaded(download_dir, name, data: bytes) -> str:
+    filepath = os.path.join(download_dir, "staging", name)
+    os.makedirs(os.path.dirname(filepath), exist_ok=True)
+    with open(filepath, "wb") as f:
+        f.write(data)
+    return filepath
+
+def add_items(writer: ArchiveWriter, download_dir, items: dict[str, bytes]) -> list:
+    results = []
+    for name, data in items.items():
+        filepath = write_downloaded(download_dir, name, data)
+        target_filepath = os.path.join(download_dir, "wellnote", "album", "2019", name)
+        results.append(writer.add("album", filepath, target_filepath, datetime(2019, 9, 5, 12)))
+    return results
+
+
+ITEMS = {
+    "wellnote_2019-09-05_000.jpg": b"\xff\xd8" + b"a" * 1000 + b"\xff\xd9",
+    "wellnote_2019-09-05_001.mp4": os.urandom(3000),
+    "wellnote_2019-09-06_000.png": b"",
+}
+
+@pytest.mark.parametrize("archive_format", ["tar", "zip"])
+def test_index_offsets_read_members_with_one_seek(tmp_path, archive_format):
+    writer = ArchiveWriter(str(tmp_path), archive_format, 1)
+    results = add_items(writer, str(tmp_path), ITEMS)
+    writer.close()
+
+    for (volume_path, member), (name, data) in zip(results, ITEMS.items()):
+        assert member.name == f"album/2019/{name}"
+        assert member.size == len(data)
+        assert read_archive_member(volume_path, member) == data
+    volume_path = results[0][0]
+    assert os.path.basename(volume_path) == f"album_2019_000.{archive_format}"
+    assert [member.to_dict() for member in read_archive_index(volume_path)] == [member.to_dict() for _, member in results]
+    # the sources have been moved into the volume
+    assert os.listdir(tmp_path / "staging") == []
+
+@pytest.mark.parametrize("archive_format", ["tar", "zip"])
+def test_volume_is_a_standard_archive(tmp_path, archive_format):
+    writer = ArchiveWriter(str(tmp_path), archive_format, 1)
+    results = add_items(writer, str(tmp_path), ITEMS)
+    writer.close()
+
+    volume_path = results[0][0]
+    names = [f"album/2019/{name}" for name in ITEMS]
+    if archive_format == "tar":
+        with tarfile.open(volume_path) as archive:
+            assert archive.getnames() == names
+            assert archive.extractfile(names[1]).read() == ITEMS["wellnote_2019-09-05_001.mp4"]
+    else:
+        with zipfile.ZipFile(volume_path) as archive:
+            assert archive.namelist() == names
+            assert archive.testzip() is None
+
+def test_zip_volume_is_repaired_after_a_crash(tmp_path):
+    writer = ArchiveWriter(str(tmp_path), "zip", 1)
+    first = add_items(writer, str(tmp_path), dict(list(ITEMS.items())[:1]))
+    writer.close()
+    writer = ArchiveWriter(str(tmp_path), "zip", 1)
+    second = add_items(writer, str(tmp_path), dict(list(ITEMS.items())[1:]))
+    volume_path = second[0][0]
+    # the volume and the index as they are on disk when the process dies before close
+    writer.key2volume[("album", "2019")][1].fp.flush()
+    crashed_dir = tmp_path / "crashed" / "wellnote" / "archive"
+    crashed_dir.mkdir(parents=True)
+    shutil.copy(volume_path, crashed_dir)
+    shutil.copy(volume_path + ".jsonl", crashed_dir)
+    writer.close()
+
+    crashed_path = str(crashed_dir / os.path.basename(volume_path))
+    with pytest.raises(zipfile.BadZipFile):
+        zipfile.ZipFile(crashed_path)
+
+    writer = ArchiveWriter(str(tmp_path / "crashed"), "zip", 1)
+    third = add_items(writer, str(tmp_path / "crashed"), {"wellnote_2019-09-07_000.jpg": b"new"})
+    writer.close()
+
+    assert third[0][0] == crashed_path
+    with zipfile.ZipFile(crashed_path) as archive:
+        assert archive.namelist() == [f"album/2019/{name}" for name in ITEMS] + ["album/2019/wellnote_2019-09-07_000.jpg"]
+        assert archive.testzip() is None
+    for volume_path, member in first + second + third:
+        assert read_archive_member(crashed_path, member) == zipfile.ZipFile(crashed_path).read(member.name)
+
+def test_repair_drops_a_member_cut_by_a_crash(tmp_path):
+    writer = ArchiveWriter(str(tmp_path), "zip", 1)
+    results = add_items(writer, str(tmp_path), ITEMS)
+    writer.key2volume[("album", "2019")][1].fp.flush()
+    volume_path = results[0][0]
+    last_member = results[-2][1]
+    with open(volume_path, "rb") as f:
+        data = f.read()
+    with open(str(tmp_path / "cut.zip"), "wb") as f:
+        f.write(data[:last_member.offset + 40])
+    shutil.copy(volume_path + ".jsonl", str(tmp_path / "cut.zip.jsonl"))
+    writer.close()
+
+    members = repair_zip_volume(str(tmp_path / "cut.zip"))
+    assert [member.name for member in members] == ["album/2019/wellnote_2019-09-05_000.jpg"]
+    with zipfile.ZipFile(str(tmp_path / "cut.zip")) as archive:
+        assert archive.namelist() == ["album/2019/wellnote_2019-09-05_000.jpg"]
+        assert archive.read(members[0].name) == ITEMS["wellnote_2019-09-05_000.jpg"]
+    with open(str(tmp_path / "cut.zip.jsonl")) as f:
+        assert [json.loads(line)["member"] for line in f] == ["album/2019/wellnote_2019-09-05_000.jpg"]
+
+def test_tar_volume_is_repaired_after_a_crash(tmp_path):
+    writer = ArchiveWriter(str(tmp_path), "tar", 1)
+    first = add_items(writer, str(tmp_path), ITEMS)
+    writer.close()
+    volume_path = first[0][0]
+    # the process died while it was appending a member, which has no line in the index yet
+    with open(volume_path, "r+b") as f:
+        f.seek(get_tar_member_end(first[-1][1]))
+        f.truncate()
+        f.write(b"album/2019/wellnote_2019-09-07_000.jpg" + b"\x00" * 100)
+    with pytest.raises(tarfile.ReadError):
+        tarfile.open(volume_path, "a")
+
+    writer = ArchiveWriter(str(tmp_path), "tar", 1)
+    second = add_items(writer, str(tmp_path), {"wellnote_2019-09-07_000.jpg": b"new"})
+    writer.close()
+
+    assert second[0][0] == volume_path
+    with tarfile.open(volume_path) as archive:
+        assert archive.getnames() == [f"album/2019/{name}" for name in ITEMS] + ["album/2019/wellnote_2019-09-07_000.jpg"]
+    for _, member in first + second:
+        assert read_archive_member(volume_path, member) == tarfile.open(volume_path).extractfile(member.name).read()
+    assert [member.name for member in read_archive_index(volume_path)] == [member.name for _, member in first + second]
+
+def test_tar_repair_drops_a_member_cut_by_a_crash(tmp_path):
+    writer = ArchiveWriter(str(tmp_path), "tar", 1)
+    results = add_items(writer, str(tmp_path), ITEMS)
+    writer.close()
+    volume_path = results[0][0]
+    cut_member = results[1][1]
+    with open(volume_path, "r+b") as f:
+        f.truncate(cut_member.offset + 100)
+
+    members = repair_tar_volume(volume_path)
+    assert [member.name for member in members] == ["album/2019/wellnote_2019-09-05_000.jpg"]
+    with tarfile.open(volume_path) as archive:
+        assert archive.getnames() == ["album/2019/wellnote_2019-09-05_000.jpg"]
+    assert [member.name for member in read_archive_index(volume_path)] == ["album/2019/wellnote_2019-09-05_000.jpg"]
+
+def test_tar_volume_without_a_complete_member_starts_over(tmp_path):
+    writer = ArchiveWriter(str(tmp_path), "tar", 1)
+    volume_path = writer.get_volume_path("album", "2019", 0)
+    with open(volume_path, "wb") as f:
+        f.write(b"album/2019/wellnote")  # a header cut by a crash
+
+    results = add_items(writer, str(tmp_path), dict(list(ITEMS.items())[:1]))
+    writer.close()
+    with tarfile.open(volume_path) as archive:
+        assert archive.getnames() == ["album/2019/wellnote_2019-09-05_000.jpg"]
+    assert read_archive_member(volume_path, results[0][1]) == ITEMS["wellnote_2019-09-05_000.jpg"]
+
+def test_manifest_locates_archive_members(tmp_path):
+    manifest = Manifest(str(tmp_path))
+    volume_path = str(tmp_path / "wellnote" / "archive" / "album_2019_000.tar")
+    manifest.add("album", "2019-10-01", 0, volume_path, member=ArchiveMember("album/2019/a.mp4", 512, 10, 1.0))
+    located_path, member = manifest.locate("album", "2019-10-01", 0)
+    assert located_path == volume_path
+    assert member.to_dict() == {"member": "album/2019/a.mp4", "offset": 512, "size": 10, "mtime": 1.0}
+    # members of archive volumes are not files of their own
+    assert manifest.list_files("album") == []
+    manifest.close()
+
+def test_items_of_an_old_manifest_get_the_archive_columns(tmp_path):
+    os.makedirs(tmp_path / "wellnote")
+    connection = sqlite3.connect(str(tmp_path / "wellnote" / "manifest.sqlite3"))
+    connection.execute("""CREATE TABLE items (
+        source TEXT NOT NULL, date TEXT NOT NULL, idx INTEGER NOT NULL,
+        extension TEXT, filepath TEXT NOT NULL, size INTEGER, mtime REAL, data_index INTEGER,
+        PRIMARY KEY (source, date, idx))""")
+    connection.execute("INSERT INTO items VALUES ('album', '2019-09-05', 0, 'jpg', 'wellnote/album/2019/wellnote_2019-09-05_000.jpg', 1, 0, NULL)")
+    connection.commit()
+    connection.close()
+
+    manifest = Manifest(str(tmp_path))
+    assert [row[1] for row in manifest.connection.execute("PRAGMA table_info(items)")][-2:] == ["member", "offset"]
+    assert manifest.locate("album", "2019-09-05", 0) == (str(tmp_path / "wellnote" / "album" / "2019" / "wellnote_2019-09-05_000.jpg"), None)
+    manifest.close()
@@ -0,0 +1,149 @@
+import json
+import os
+import struct
+
+import pytest
+
+import wellnote_downloader
+from wellnote_downloader import LocalStorage, Manifest, apply_repair_list, audit, check_header
+
+
+JPEG = b"\xff\xd8\xff\xe0" + b"\x00" * 100 + b"\xff\xd9"
+PNG = wellnote_downloader.PNG_SIGNATURE + b"\x00" * 100 + wellnote_downloader.PNG_IEND_CHUNK
+
+def mp4(moov_size: int = 16) -> bytes:
+    return struct.pack(">I4s", 16, b"ftyp") + b"isom\x00\x00\x02\x00" + struct.pack(">I4s", 8 + moov_size, b"moov") + b"\x00" * moov_size
+
+def write(filepath, data: bytes) -> str:
+    filepath = str(filepath)
+    os.makedirs(os.path.dirname(filepath), exist_ok=True)
+    with open(filepath, "wb") as f:
+        f.write(data)
+    return filepath
+
+def album_filepath(download_dir, date: str, idx: int, extension: str) -> str:
+    return os.path.join(str(download_dir), "wellnote", "album", date[0:4], f"wellnote_{date}_{idx:03}.{extension}")
+
+def check(tmp_path, name: str, data: bytes) -> str:
+    filepath = write(tmp_path / name, data)
+    return check_header(filepath, len(data))
+
+
+@pytest.mark.parametrize("name, data", [
+    ("a.jpg", JPEG),
+    ("a.jpg", JPEG + b"\x00" * 10),  # padding after the end marker
+    ("a.png", PNG),
+    ("a.gif", b"GIF89a" + b"\x00" * 10 + b"\x3b"),
+    ("a.mp4", mp4()),
+    ("a.txt", b"x"),
+])
+def test_complete_files_pass(tmp_path, name, data):
+    assert check(tmp_path, name, data) is None
+
+@pytest.mark.parametrize("name, data, problem", [
+    ("a.jpg", b"", "empty"),
+    ("a.jpg", JPEG[:-2], "no JPEG end marker"),
+    ("a.jpg", b"GIF89a" + JPEG, "no JPEG signature"),
+    ("a.png", PNG[:-4], "no PNG IEND chunk"),
+    ("a.gif", b"GIF89a" + b"\x00" * 10, "no GIF trailer"),
+    ("a.mp4", mp4()[:-4], "truncated, 4 bytes of box b'moov' are missing"),
+    ("a.mp4", mp4()[:16], "no moov box"),
+    ("a.mp4", b"\x00\x00\x00\x04abcd", "invalid size of box b'abcd' at 0"),
+])
+def test_truncated_files_are_found(tmp_path, name, data, problem):
+    assert check(tmp_path, name, data) == problem
+
+
+@pytest.fixture
+def download_dir(tmp_path):
+    write(album_filepath(tmp_path, "2019-09-05", 0, "jpg"), JPEG)
+    write(album_filepath(tmp_path, "2019-09-05", 1, "jpg"), JPEG[:-2])  # broken
+    write(album_filepath(tmp_path, "2019-09-05", 3, "png"), PNG)  # _002 is a gap
+    write(album_filepath(tmp_path, "2019-10-01", 0, "mp4"), mp4())
+    write(album_filepath(tmp_path, "2019-10-02", 0, "part"), b"abc")  # an interrupted browser download
+    manifest = Manifest(str(tmp_path))
+    for month in (9, 10):
+        manifest.complete_month("album", 2019, month)
+    manifest.close()
+    return tmp_path
+
+def load_repair_list(download_dir) -> dict:
+    with open(os.path.join(str(download_dir), "wellnote", "repair.json"), encoding="utf-8") as f:
+        return json.load(f)
+
+def test_audit_writes_the_repair_list(download_dir):
+    os.remove(album_filepath(download_dir, "2019-10-01", 0, "mp4"))  # missing
+    assert audit(str(download_dir), workers=1) == 1
+    items = load_repair_list(download_dir)["items"]
+    assert [(item["date"], item["idx"], item["reason"]) for item in items] == [
+        ("2019-09-05", 1, "no JPEG end marker"),
+        ("2019-09-05", 2, "gap"),
+        ("2019-10-01", 0, "missing"),
+        ("2019-10-02", 0, "partially downloaded"),
+    ]
+    assert items[0]["filepath"] == os.path.join("wellnote", "album", "2019", "wellnote_2019-09-05_001.jpg")
+
+def test_a_resumable_partial_download_is_left_to_the_next_run(download_dir):
+    partial_filepath = write(album_filepath(download_dir, "2019-11-03", 0, "part"), b"abc")
+    write(partial_filepath + ".json", json.dumps({"url": "https://example.com/a.jpg", "size": 10}).encode())
+    audit(str(download_dir), workers=1)
+    assert "2019-11-03" not in [item["date"] for item in load_repair_list(download_dir)["items"]]
+
+    # even a repair list of an older audit does not move it
+    repair_list = load_repair_list(download_dir)
+    repair_list["items"].append({"source": "album", "date": "2019-11-03", "idx": 0, "reason": "partially downloaded", \
+                                 "filepath": os.path.relpath(partial_filepath, str(download_dir))})
+    with open(os.path.join(str(download_dir), "wellnote", "repair.json"), "w", encoding="utf-8") as f:
+        json.dump(repair_list, f)
+    manifest = Manifest(str(download_dir))
+    assert (2019, 11) in apply_repair_list(manifest, "album")
+    manifest.close()
+    assert os.path.exists(partial_filepath) and os.path.exists(partial_filepath + ".json")
+
+def test_repair_list_round_trip(download_dir):
+    audit(str(download_dir), workers=1)
+    repair_list = load_repair_list(download_dir)
+    repair_list["items"].append({"source": "home", "date": "2020-01-01_10-00-00", "idx": 0, "reason": "missing", "filepath": "x"})
+    write(os.path.join(str(download_dir), "wellnote", "repair.json"), json.dumps(repair_list).encode())
+    manifest = Manifest(str(download_dir))
+
+    assert apply_repair_list(manifest, "album") == [(2019, 9), (2019, 10)]
+    quarantine_dir = os.path.join(str(download_dir), "wellnote", "quarantine", "wellnote", "album", "2019")
+    assert sorted(os.listdir(quarantine_dir)) == ["wellnote_2019-09-05_001.jpg", "wellnote_2019-10-02_000.part"]
+    assert manifest.find("album", "2019-09-05", 1) is None
+    assert manifest.find("album", "2019-09-05", 0) == album_filepath(download_dir, "2019-09-05", 0, "jpg")
+    assert not manifest.is_month_completed("album", 2019, 9)
+    assert not manifest.is_month_completed("album", 2019, 10)
+    # the entries of the other source stay for its --repair
+    assert [item["source"] for item in load_repair_list(download_dir)["items"]] == ["home"]
+    assert apply_repair_list(manifest, "home") == [(2020, 1)]
+    assert not os.path.exists(os.path.join(str(download_dir), "wellnote", "repair.json"))
+    manifest.close()
+
+
+class UploadedStorage(LocalStorage):
+    """
+    A storage which has the files uploaded and removed from the download dir.
+    """
+
+    def __init__(self, download_dir, uploaded_filepaths):
+        super().__init__(download_dir)
+        self.uploaded_filepaths = set(uploaded_filepaths)
+
+    def exists(self, filepath):
+        return filepath in self.uploaded_filepaths or os.path.exists(filepath)
+
+def test_uploaded_items_are_looked_up_in_the_storage(download_dir, monkeypatch):
+    uploaded_filepaths = [album_filepath(download_dir, "2019-09-05", 3, "png"), album_filepath(download_dir, "2019-10-01", 0, "mp4")]
+    for filepath in uploaded_filepaths:
+        os.remove(filepath)
+    monkeypatch.setattr(wellnote_downloader, "make_storage", \
+                        lambda download_dir, storage_url, storage_endpoint, **kwargs: UploadedStorage(download_dir, uploaded_filepaths))
+
+    audit(str(download_dir), workers=1, storage_url="s3://bucket/prefix")
+    items = load_repair_list(download_dir)["items"]
+    assert [(item["date"], item["idx"], item["reason"]) for item in items] == [
+        ("2019-09-05", 1, "no JPEG end marker"),
+        ("2019-09-05", 2, "gap"),
+        ("2019-10-02", 0, "partially downloaded"),
+    ]
@@ -0,0 +1,48 @@
+import os
+from datetime import datetime
+
+from wellnote_downloader import Manifest, time_needs_update
+
+
+DT = datetime(2019, 9, 5, 12)
+
+def write(filepath, data: bytes = b"x") -> str:
+    filepath = str(filepath)
+    with open(filepath, "wb") as f:
+        f.write(data)
+    return filepath
+
+def set_time(filepath, dt: datetime):
+    os.chmod(filepath, 0o644)
+    os.utime(filepath, (dt.timestamp(), dt.timestamp()))
+
+def test_time_is_updated_only_when_it_differs(tmp_path):
+    filepath = write(tmp_path / "a.jpg")
+    assert time_needs_update(filepath, DT)
+    set_time(filepath, DT)
+    assert not time_needs_update(filepath, DT)
+    os.chmod(filepath, 0o600)
+    assert time_needs_update(filepath, DT)
+
+def test_linked_files_keep_the_time_of_the_canonical_file(tmp_path):
+    canonical_filepath = write(tmp_path / "a.jpg")
+    set_time(canonical_filepath, DT)
+    os.link(canonical_filepath, str(tmp_path / "b.jpg"))
+    os.symlink(canonical_filepath, str(tmp_path / "c.jpg"))
+    later = datetime(2020, 1, 1, 12)
+    assert not time_needs_update(str(tmp_path / "b.jpg"), later)
+    assert not time_needs_update(str(tmp_path / "c.jpg"), later)
+
+def test_hashes(tmp_path):
+    manifest = Manifest(str(tmp_path))
+    filepath = write(tmp_path / "a.jpg", b"abc")
+    linked_filepath = write(tmp_path / "b.jpg", b"abc")
+    manifest.set_hash(filepath, "h")
+    manifest.set_hash(linked_filepath, "h", linked_to=filepath)
+    assert manifest.get_hash(filepath, os.stat(filepath)) == ("h", None)
+    assert manifest.get_hash(linked_filepath, os.stat(linked_filepath)) == ("h", "a.jpg")
+    assert manifest.find_by_hash("h", 3, excluded_filepath=filepath) == linked_filepath
+    # a changed file is hashed again
+    write(filepath, b"abcd")
+    assert manifest.get_hash(filepath, os.stat(filepath)) == (None, None)
+    manifest.close()
@@ -0,0 +1,38 @@
+import os
+import threading
+
+from wellnote_downloader import PostProcessor, download_is_completed
+
+
+def write(filepath, data: bytes = b"x") -> str:
+    filepath = str(filepath)
+    with open(filepath, "wb") as f:
+        f.write(data)
+    return filepath
+
+def test_pending_files_of_the_post_processor_are_not_new_downloads(tmp_path):
+    moved_dir = tmp_path / "moved"
+    moved_dir.mkdir()
+    old_filepath = write(tmp_path / "old.jpg")
+    release = threading.Event()
+
+    def move(filepath):
+        release.wait()
+        os.replace(filepath, str(moved_dir / os.path.basename(filepath)))
+
+    postprocessor = PostProcessor()
+    postprocessor.submit(move, old_filepath, pending_path=old_filepath)
+    is_completed = download_is_completed(str(tmp_path), postprocessor.get_pending_paths)
+    assert is_completed(None) is False
+
+    new_filepath = write(tmp_path / "new.jpg")
+    assert is_completed(None) == new_filepath
+    release.set()
+    assert postprocessor.close() == []
+    assert postprocessor.get_pending_paths() == set()
+    assert is_completed(None) == new_filepath
+
+def test_download_in_progress(tmp_path):
+    write(tmp_path / "a.jpg", b"")
+    write(tmp_path / "a.jpg.part")
+    assert download_is_completed(str(tmp_path))(None) is False
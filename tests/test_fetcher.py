@@ -0,0 +1,206 @@
+import hashlib
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import wellnote_downloader
+from wellnote_downloader import HttpFetcher, get_cookie_header, load_partial_state, save_partial_state
+
+
+COOKIES = [
+    {"name": "session", "value": "s1", "domain": "wellnote.jp", "path": "/", "secure": True, "httpOnly": True},
+    {"name": "shared", "value": "s2", "domain": ".wellnote.jp", "path": "/", "secure": False},
+    {"name": "api", "value": "s3", "domain": ".wellnote.jp", "path": "/api", "secure": False},
+]
+
+def test_cookies_of_the_host_are_sent():
+    assert get_cookie_header(COOKIES, "https://wellnote.jp/album?x=1") == "session=s1; shared=s2"
+    assert get_cookie_header(COOKIES, "https://wellnote.jp/api/media/1") == "session=s1; shared=s2; api=s3"
+
+def test_host_only_cookies_are_not_sent_to_subdomains():
+    assert get_cookie_header(COOKIES, "https://media.wellnote.jp/a.jpg") == "shared=s2"
+
+def test_cookies_are_not_sent_to_other_hosts():
+    assert get_cookie_header(COOKIES, "https://cdn.example.com/a.jpg") is None
+    assert get_cookie_header(COOKIES, "https://evilwellnote.jp/a.jpg") is None
+    assert get_cookie_header(COOKIES, "https://bucket.s3.amazonaws.com/a.jpg?X-Amz-Signature=x") is None
+
+def test_secure_cookies_are_not_sent_over_http():
+    assert get_cookie_header(COOKIES, "http://wellnote.jp/album") == "shared=s2"
+
+def test_path_must_be_a_prefix_at_a_segment():
+    assert get_cookie_header(COOKIES, "https://wellnote.jp/apix") == "session=s1; shared=s2"
+
+
+class Handler(BaseHTTPRequestHandler):
+    """
+    Serves one media with Range requests as an object storage does. The test sets the class attributes.
+    """
+
+    data: bytes = b""
+    etag: str = None
+    supports_range: bool = True
+    ranges: list = []
+    required_cookie: str = None
+
+    def do_GET(self):
+        if self.required_cookie and self.headers.get("Cookie") != self.required_cookie:
+            type(self).ranges.append("denied")
+            self.send_response(403)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        data = self.data
+        etag = self.etag or '"' + hashlib.md5(data).hexdigest() + '"'
+        range_header = self.headers.get("Range")
+        type(self).ranges.append(range_header)
+        if_range = self.headers.get("If-Range")
+        if not self.supports_range or not range_header or (if_range and if_range != etag):
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(data)))
+            body = data
+        else:
+            start, end = (int(s) for s in range_header[len("bytes="):].split("-"))
+            if start >= len(data):
+                self.send_response(416)
+                self.send_header("Content-Range", f"bytes */{len(data)}")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            body = data[start:end + 1]
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{start + len(body) - 1}/{len(data)}")
+            self.send_header("Content-Length", str(len(body)))
+        self.send_header("Content-Type", "image/jpeg")
+        self.send_header("ETag", etag)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+class FakeDriver:
+
+    current_url = "https://wellnote.jp/album"
+
+    def __init__(self):
+        self.cookies = COOKIES
+
+    def get_cookies(self):
+        return self.cookies
+
+    def execute_script(self, script):
+        return "test"
+
+@pytest.fixture
+def media_url():
+    Handler.data = os.urandom(2500)
+    Handler.etag = None
+    Handler.supports_range = True
+    Handler.ranges = []
+    Handler.required_cookie = None
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}/media/abc?signature=1"
+    server.shutdown()
+    server.server_close()
+
+@pytest.fixture
+def fetcher(monkeypatch):
+    monkeypatch.setattr(wellnote_downloader, "RANGE_CHUNK_SIZE", 1000)
+    fetcher = HttpFetcher(FakeDriver(), 2)
+    yield fetcher
+    fetcher.close()
+
+def read(filepath) -> bytes:
+    with open(filepath, "rb") as f:
+        return f.read()
+
+def test_media_is_fetched_in_range_chunks(tmp_path, media_url, fetcher):
+    target_filepath_woe = str(tmp_path / "2019" / "wellnote_2019-09-05_000")
+    assert fetcher._fetch(media_url, target_filepath_woe) == target_filepath_woe + ".jpg"
+    assert read(target_filepath_woe + ".jpg") == Handler.data
+    assert Handler.ranges == ["bytes=0-999", "bytes=1000-1999", "bytes=2000-2999"]
+    assert not os.path.exists(target_filepath_woe + ".part")
+    assert not os.path.exists(target_filepath_woe + ".part.json")
+
+def test_interrupted_fetch_resumes_from_the_part_file(tmp_path, media_url, fetcher):
+    target_filepath_woe = str(tmp_path / "wellnote_2019-09-05_000")
+    etag = '"' + hashlib.md5(Handler.data).hexdigest() + '"'
+    with open(target_filepath_woe + ".part", "wb") as f:
+        f.write(Handler.data[:1000])
+    # the signature of the url of the last run has expired
+    save_partial_state(target_filepath_woe + ".part.json", {"url": media_url.split("?")[0], "size": 2500, "extension": "jpg", "etag": etag})
+
+    fetcher._fetch(media_url.replace("signature=1", "signature=2"), target_filepath_woe)
+    assert read(target_filepath_woe + ".jpg") == Handler.data
+    assert Handler.ranges == ["bytes=1000-1999", "bytes=2000-2999"]
+
+def test_changed_media_starts_over(tmp_path, media_url, fetcher):
+    target_filepath_woe = str(tmp_path / "wellnote_2019-09-05_000")
+    with open(target_filepath_woe + ".part", "wb") as f:
+        f.write(b"x" * 1000)
+    save_partial_state(target_filepath_woe + ".part.json", {"url": media_url.split("?")[0], "size": 2500, "extension": "jpg", "etag": '"old"'})
+
+    fetcher._fetch(media_url, target_filepath_woe)
+    assert read(target_filepath_woe + ".jpg") == Handler.data
+    assert Handler.ranges == ["bytes=1000-1999"]  # answered with 200 and the whole media
+
+def test_part_file_of_another_url_is_not_resumed(tmp_path, media_url, fetcher):
+    target_filepath_woe = str(tmp_path / "wellnote_2019-09-05_000")
+    with open(target_filepath_woe + ".part", "wb") as f:
+        f.write(b"x" * 1000)
+    save_partial_state(target_filepath_woe + ".part.json", {"url": "http://127.0.0.1/media/other", "size": 2500, "extension": "jpg"})
+
+    fetcher._fetch(media_url, target_filepath_woe)
+    assert read(target_filepath_woe + ".jpg") == Handler.data
+    assert Handler.ranges[0] == "bytes=0-999"
+
+def test_server_without_ranges(tmp_path, media_url, fetcher):
+    Handler.supports_range = False
+    target_filepath_woe = str(tmp_path / "wellnote_2019-09-05_000")
+    fetcher._fetch(media_url, target_filepath_woe)
+    assert read(target_filepath_woe + ".jpg") == Handler.data
+    assert len(Handler.ranges) == 1
+
+def test_part_file_is_kept_with_its_state_until_verified(tmp_path, media_url, fetcher):
+    Handler.etag = '"' + "0" * 32 + '"'  # an MD5 ETag which does not match
+    target_filepath_woe = str(tmp_path / "wellnote_2019-09-05_000")
+    with pytest.raises(IOError, match="MD5 does not match"):
+        fetcher._fetch(media_url, target_filepath_woe)
+    # a broken transfer is deleted with its state so that the next try starts over
+    assert not os.path.exists(target_filepath_woe + ".part")
+    assert not os.path.exists(target_filepath_woe + ".part.json")
+    assert not os.path.exists(target_filepath_woe + ".jpg")
+
+def test_partial_state_round_trip(tmp_path):
+    state_filepath = str(tmp_path / "a.part.json")
+    assert load_partial_state(state_filepath) == {}
+    save_partial_state(state_filepath, {"url": "https://example.com/a", "size": 10})
+    assert load_partial_state(state_filepath) == {"url": "https://example.com/a", "size": 10}
+    assert not os.path.exists(state_filepath + ".tmp")
+    with open(state_filepath, "w") as f:
+        f.write('{"url": "https://exa')  # cut by a crash
+    assert load_partial_state(state_filepath) == {}
+
+def test_denied_fetch_is_retried_with_fresh_cookies(tmp_path, media_url, fetcher):
+    Handler.required_cookie = "session=new"
+    fetcher.driver.cookies = [{"name": "session", "value": "new", "domain": "127.0.0.1", "path": "/"}]
+    target_filepath_woe = str(tmp_path / "wellnote_2019-09-05_000")
+    fetcher.submit(media_url, target_filepath_woe, "item")
+    # the browser thread copies the cookies again while it waits
+    results, num_of_failures = fetcher.completed(block=True)
+    assert results == [("item", target_filepath_woe + ".jpg")] and num_of_failures == 0
+    assert read(target_filepath_woe + ".jpg") == Handler.data
+    assert Handler.ranges[0] == "denied"
+
+def test_fetch_is_retried_only_once(tmp_path, media_url, fetcher):
+    Handler.required_cookie = "session=never"
+    target_filepath_woe = str(tmp_path / "wellnote_2019-09-05_000")
+    fetcher.submit(media_url, target_filepath_woe, "item")
+    results, num_of_failures = fetcher.completed(block=True)
+    assert (results, num_of_failures) == ([], 1)
+    assert Handler.ranges == ["denied", "denied"]
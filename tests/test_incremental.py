@@ -0,0 +1,30 @@
+from wellnote_downloader import ArchiveMember, Manifest, get_album_synced_range
+
+
+def test_watermark_only_advances(tmp_path):
+    manifest = Manifest(str(tmp_path))
+    assert manifest.get_watermark("album") is None
+    manifest.add("album", "2019-09-05", 0, str(tmp_path), member=ArchiveMember("a", 0, 1, 0.0))
+    assert manifest.advance_watermark("album") == "2019-09-05"
+    manifest.forget("album", "2019-09-05", 0)
+    manifest.add("album", "2019-01-01", 0, str(tmp_path), member=ArchiveMember("b", 0, 1, 0.0))
+    assert manifest.advance_watermark("album") == "2019-09-05"
+    manifest.close()
+
+
+def test_watermark_stops_at_the_synced_range(tmp_path):
+    manifest = Manifest(str(tmp_path))
+    for date in ("2019-01-10", "2019-02-10", "2019-03-10"):
+        manifest.add("album", date, 0, str(tmp_path), member=ArchiveMember(date, 0, 1, 0.0))
+    # a run which started after the beginning leaves a gap before it
+    assert manifest.advance_watermark("album", "2019-02") is None
+    # a run which ended early at 2019-03 synced only the items before it
+    manifest.complete_month("album", 2019, 1)
+    manifest.complete_month("album", 2019, 2)
+    assert get_album_synced_range(manifest, 2009, 1, 2019, 3) == (None, "2009-01")
+    assert get_album_synced_range(manifest, 2019, 1, 2019, 3) == ("2019-01", "2019-03")
+    assert manifest.advance_watermark("album", *get_album_synced_range(manifest, 2019, 1, 2019, 3)) is None
+    assert manifest.advance_watermark("album", None, "2019-03") == "2019-02-10"
+    # the next run starts at the watermark
+    assert manifest.advance_watermark("album", "2019-02", "2019-04") == "2019-03-10"
+    manifest.close()
@@ -0,0 +1,66 @@
+import os
+
+from wellnote_downloader import Manifest
+
+
+def write(filepath, data: bytes = b"x") -> str:
+    filepath = str(filepath)
+    os.makedirs(os.path.dirname(filepath), exist_ok=True)
+    with open(filepath, "wb") as f:
+        f.write(data)
+    return filepath
+
+def columns(connection, table: str) -> list[str]:
+    return [row[1] for row in connection.execute(f"PRAGMA table_info({table})")]
+
+
+def test_schema(tmp_path):
+    manifest = Manifest(str(tmp_path))
+    connection = manifest.connection
+    assert connection.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    assert columns(connection, "items") == ["source", "date", "idx", "extension", "filepath", "size", "mtime", "data_index", "member", "offset"]
+    assert columns(connection, "months") == ["source", "year", "month"]
+    assert columns(connection, "hashes") == ["filepath", "size", "mtime", "sha256", "linked_to"]
+    assert columns(connection, "watermarks") == ["source", "date"]
+    assert [row[1] for row in connection.execute("PRAGMA index_list(hashes)") if row[1] == "hashes_sha256"] == ["hashes_sha256"]
+    manifest.close()
+    assert os.path.exists(tmp_path / "wellnote" / "manifest.sqlite3")
+
+def test_existing_files_are_imported_except_partial_downloads(tmp_path):
+    album_dir = tmp_path / "wellnote" / "album" / "2019"
+    write(album_dir / "wellnote_2019-09-05_000.jpg")
+    write(album_dir / "wellnote_2019-09-05_001.mp4")
+    write(album_dir / "wellnote_2019-09-05_002.part")
+    write(album_dir / "wellnote_2019-09-05_003.crdownload")
+    write(tmp_path / "wellnote" / "home" / "2020" / "wellnote_home_2020-01-01_10-00-00.png")
+
+    manifest = Manifest(str(tmp_path))
+    assert [(date, idx, os.path.basename(filepath)) for date, idx, filepath in manifest.list_files("album")] == [
+        ("2019-09-05", 0, "wellnote_2019-09-05_000.jpg"),
+        ("2019-09-05", 1, "wellnote_2019-09-05_001.mp4"),
+    ]
+    assert manifest.find("home", "2020-01-01_10-00-00") == str(tmp_path / "wellnote" / "home" / "2020" / "wellnote_home_2020-01-01_10-00-00.png")
+    manifest.close()
+
+def test_items_and_months(tmp_path):
+    manifest = Manifest(str(tmp_path))
+    filepath = write(tmp_path / "wellnote" / "album" / "2019" / "wellnote_2019-09-05_000.jpg", b"abc")
+    manifest.add("album", "2019-09-05", 0, filepath)
+
+    assert manifest.connection.execute("SELECT extension, filepath, size FROM items WHERE date='2019-09-05'").fetchone() \
+        == ("jpg", os.path.join("wellnote", "album", "2019", "wellnote_2019-09-05_000.jpg"), 3)
+    assert manifest.list_files("album") == [("2019-09-05", 0, filepath)]
+    assert manifest.list_month("album", 2019, 9) == [("2019-09-05", 0, filepath)]
+    assert manifest.average_size("album") == 3
+    assert manifest.list_dates("album") == {"2019-09-05"}
+
+    manifest.complete_month("album", 2019, 9)
+    assert manifest.is_month_completed("album", 2019, 9)
+    manifest.reopen_month("album", 2019, 9)
+    assert not manifest.is_month_completed("album", 2019, 9)
+
+    # a deleted file is forgotten, so that it is downloaded again
+    os.remove(filepath)
+    assert manifest.find("album", "2019-09-05", 0) is None
+    assert manifest.locate("album", "2019-09-05", 0) == (None, None)
+    manifest.close()